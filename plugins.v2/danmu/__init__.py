@@ -5,6 +5,7 @@ from app.core.event import eventmanager
 from app.schemas.types import EventType
 from app.utils.system import SystemUtils
 from app.chain.media import MediaChain
+from app.chain.tmdb import TmdbChain
 from app.core.metainfo import MetaInfo
 from app.core.config import settings
 from app import schemas
@@ -12,11 +13,18 @@ from app.schemas.types import MediaType, EventType, SystemConfigKey
 from datetime import datetime
 
 from typing import Any, List, Dict, Tuple, Optional
+from fastapi.responses import PlainTextResponse
 import subprocess
 import os
 import threading
 import json
+import base64
+import heapq
 from app.plugins.danmu import danmu_generator as generator
+from app.plugins.danmu.danmu_cache import CacheDB, DanmuManifest, MemoCache, RetryQueue, ScrapeJob
+from app.plugins.danmu.pipeline import IngestQueue, Stage, StagePipeline
+from app.plugins.danmu.library_index import LibraryIndex
+from app.plugins.danmu.metrics import ScrapeMetrics
     
 
 class Danmu(_PluginBase):
@@ -52,20 +60,48 @@ class Danmu(_PluginBase):
     _duration = 15
     _path = ''
     _max_threads = 10
+    _hash_workers = 4  # 读取文件hash的并发数 - 硬编码，避免机械硬盘随机读
+    _api_rate_limit = 5  # 每个弹幕API主机每秒最多请求数 - 硬编码
     _onlyFromBili = False
     _useTmdbID = True
     _auto_scrape = True
+    # 增量刮削：跳过未变化且在有效期内的文件
+    _incremental = False
+    _incremental_ttl = 168  # 有效期（小时）
+    # 当前全局刮削任务
+    _job_id: Optional[str] = None
+    _job_thread: Optional[threading.Thread] = None
+    _job_stop = threading.Event()
+    _job_lock = threading.Lock()
+    # 流水线各阶段的共用并发限制 {阶段名称: 信号量}
+    _stage_limits: Dict[str, threading.BoundedSemaphore] = {}
+    _stage_limits_lock = threading.Lock()
+    # 传输完成事件的合并队列
+    _ingest_queue: Optional[IngestQueue] = None
+    _ingest_debounce = 10  # 合并连续传输事件的等待秒数 - 硬编码
+    # 媒体库后台索引
+    _use_library_index = True
+    _library_index: Optional[LibraryIndex] = None
+    # 弹幕精简
+    _dedup_window = 0  # 重复弹幕去重窗口（秒），0为关闭
+    _lane_rate = 0  # 平均每条轨道每秒最多弹幕数，0为不限制
+    _drop_when_full = False  # 轨道占满时丢弃弹幕
     # 新增重试相关配置
     _min_danmu_count = 100  # 最小弹幕数量要求 - 硬编码
-    _max_retry_times = 10  # 最大重试次数 - 硬编码
+    _max_retry_times = 10  # 最大重试次数
     _enable_retry_task = True  # 是否启用重试任务
     
-    # 重试任务列表 - 存储格式: {file_path: {"retry_count": int, "last_attempt": datetime, "file_path": str}}
-    _retry_tasks = {}
-    
     media_chain = MediaChain()
+    # 媒体识别结果缓存 {(名称, 年份, 类型, 季): MediaInfo}，同一季的文件只识别一次
+    _media_cache = MemoCache(ttl=3600)
+
+    # 弹幕数量缓存 {弹幕文件路径: ((大小, 修改时间), 数量)}，限制条数避免大媒体库占用过多内存
+    _danmu_count_cache = MemoCache(ttl=86400, max_size=20000)
+    # 单集播出日期缓存 {(tmdb_id, 季): {集号: 播出日期}}，用于安排重试
+    _air_date_cache = MemoCache(ttl=86400)
     
     def init_plugin(self, config: dict = None):
+        CacheDB.set_data_path(self.get_data_path())
         if config:
             self._enabled = config.get("enabled", False)
             self._width = config.get("width", 1920)
@@ -79,29 +115,27 @@ class Danmu(_PluginBase):
             self._useTmdbID = config.get("useTmdbID", True)
             self._auto_scrape = config.get("auto_scrape", False)
             self._enable_retry_task = config.get("enable_retry_task", True)
-            # 加载重试任务列表
-            retry_tasks_str = config.get("retry_tasks", "{}")
-            try:
-                loaded_tasks = json.loads(retry_tasks_str)
-                self._retry_tasks = {}
-                # 将字符串日期转换为datetime对象，并添加缺失字段的默认值
-                for file_path, task_info in loaded_tasks.items():
-                    try:
-                        self._retry_tasks[file_path] = {
-                            "retry_count": task_info.get("retry_count", 1),
-                            "last_attempt": datetime.fromisoformat(task_info.get("last_attempt", datetime.now().isoformat())),
-                            "file_path": task_info.get("file_path", file_path),
-                            "last_danmu_count": task_info.get("last_danmu_count", 0)
-                        }
-                    except (ValueError, TypeError) as e:
-                        logger.warning(f"跳过无效的重试任务 {file_path}: {e}")
-                        continue
-                logger.info(f"加载了 {len(self._retry_tasks)} 个重试任务")
-            except (json.JSONDecodeError, ValueError, TypeError) as e:
-                logger.warning(f"加载重试任务失败，使用空列表: {e}")
-                self._retry_tasks = {}
+            self._max_retry_times = int(config.get("max_retry_times", 10))
+            self._incremental = config.get("incremental", False)
+            self._incremental_ttl = config.get("incremental_ttl", 168)
+            self._dedup_window = config.get("dedup_window", 0)
+            self._lane_rate = config.get("lane_rate", 0)
+            self._drop_when_full = config.get("drop_when_full", False)
+            self._use_library_index = config.get("use_library_index", True)
+            # 旧版本的重试任务保存在配置中，迁移到重试队列
+            if config.get("retry_tasks"):
+                self._migrate_retry_tasks(config)
+        generator.DanmuAPI.configure_session(self._max_threads)
+        generator.DanmuAPI.configure_rate_limit(self._api_rate_limit)
+        self._restart_library_index()
+        if self._ingest_queue:
+            self._ingest_queue.stop()
+        self._ingest_queue = IngestQueue(self._process_transfer_batch, debounce=self._ingest_debounce,
+                                         name="transfer")
+        self._ingest_queue.start()
         if self._enabled:
             logger.info("弹幕加载插件已启用")
+            self._resume_job()
 
     def get_state(self) -> bool:
         return self._enabled
@@ -121,14 +155,10 @@ class Danmu(_PluginBase):
             return [{
                 "id": "DanmuRetryTask",
                 "name": "弹幕重试任务",
-                "trigger": "cron",
+                "trigger": "interval",
                 "func": self.auto_process_retry_tasks,
                 "kwargs": {
-                    "minute": 0,
-                    "hour": "*/3",  # 每3小时执行一次
-                    "day": "*",
-                    "month": "*",
-                    "day_of_week": "*"
+                    "minutes": 15  # 每15分钟检查一次，只处理已到重试时间的任务
                 }
             }]
         return []
@@ -154,7 +184,21 @@ class Danmu(_PluginBase):
             "methods": ["GET"],
             "auth": "bear",
             "summary": "刮削弹幕",
-            "description": "根据设定的路径刮削弹幕" 
+            "description": "根据设定的路径刮削弹幕，刮削完成后返回，incremental参数控制是否跳过未变化的文件"
+        },{
+            "path": "/start_scrape",
+            "endpoint": self.start_scrape,
+            "methods": ["GET"],
+            "auth": "bear",
+            "summary": "后台刮削弹幕",
+            "description": "在后台根据设定的路径刮削弹幕，立即返回任务ID，incremental参数控制是否跳过未变化的文件"
+        },{
+            "path": "/cancel_scrape",
+            "endpoint": self.cancel_scrape,
+            "methods": ["GET"],
+            "auth": "bear",
+            "summary": "取消刮削",
+            "description": "停止投递新文件并等待处理中的文件完成，取消的任务不会在重启后继续"
         },{
             "path": "/update_path",
             "endpoint": self.update_path,
@@ -193,7 +237,7 @@ class Danmu(_PluginBase):
             "methods": ["GET"],
             "auth": "bear",
             "summary": "扫描路径",
-            "description": "扫描路径下的媒体文件和弹幕信息，支持current_dir参数进行点击式导航"
+            "description": "扫描路径下的媒体文件和弹幕信息，支持current_dir参数进行点击式导航，支持cursor/limit分页及sort/filter_by/count_only参数"
         },
         {
             "path": "/scan_subfolder",
@@ -201,7 +245,7 @@ class Danmu(_PluginBase):
             "methods": ["GET"],
             "auth": "bear",
             "summary": "扫描子文件夹",
-            "description": "扫描指定子文件夹的内容"
+            "description": "扫描指定子文件夹的内容，分页参数同scan_path"
         },
         {
             "path": "/generate_danmu",
@@ -242,6 +286,22 @@ class Danmu(_PluginBase):
             "auth": "bear",
             "summary": "移除重试任务",
             "description": "移除指定的重试任务，需要file_path参数"
+        },
+        {
+            "path": "/prewarm_hash_index",
+            "endpoint": self.prewarm_hash_index,
+            "methods": ["GET"],
+            "auth": "bear",
+            "summary": "预热文件hash索引",
+            "description": "预先计算刮削路径下所有媒体文件的匹配hash"
+        },
+        {
+            "path": "/metrics",
+            "endpoint": self.get_metrics,
+            "methods": ["GET"],
+            "auth": "bear",
+            "summary": "刮削统计",
+            "description": "Prometheus文本格式的刮削进度、阶段耗时和API错误统计"
         }
         ]
      
@@ -262,7 +322,14 @@ class Danmu(_PluginBase):
             "onlyFromBili": self._onlyFromBili,
             "useTmdbID": self._useTmdbID,
             "auto_scrape": self._auto_scrape,
-            "enable_retry_task": self._enable_retry_task
+            "enable_retry_task": self._enable_retry_task,
+            "max_retry_times": self._max_retry_times,
+            "incremental": self._incremental,
+            "incremental_ttl": self._incremental_ttl,
+            "dedup_window": self._dedup_window,
+            "lane_rate": self._lane_rate,
+            "drop_when_full": self._drop_when_full,
+            "use_library_index": self._use_library_index
         }
         
     def _save_config(self, config: dict):
@@ -279,17 +346,14 @@ class Danmu(_PluginBase):
             self._useTmdbID = config.get("useTmdbID", True)
             self._auto_scrape = config.get("auto_scrape", False)
             self._enable_retry_task = config.get("enable_retry_task", True)
-            
-            # 准备重试任务数据
-            retry_tasks_for_save = {}
-            for file_path, task_info in self._retry_tasks.items():
-                retry_tasks_for_save[file_path] = {
-                    "retry_count": task_info["retry_count"],
-                    "last_attempt": task_info["last_attempt"].isoformat(),
-                    "file_path": task_info["file_path"],
-                    "last_danmu_count": task_info.get("last_danmu_count", 0)
-                }
-            
+            self._max_retry_times = int(config.get("max_retry_times", self._max_retry_times))
+            self._incremental = config.get("incremental", self._incremental)
+            self._incremental_ttl = config.get("incremental_ttl", self._incremental_ttl)
+            self._dedup_window = config.get("dedup_window", self._dedup_window)
+            self._lane_rate = config.get("lane_rate", self._lane_rate)
+            self._drop_when_full = config.get("drop_when_full", self._drop_when_full)
+            self._use_library_index = config.get("use_library_index", self._use_library_index)
+
             # 保存到系统配置
             self.update_config({
                 "enabled": self._enabled,
@@ -303,9 +367,16 @@ class Danmu(_PluginBase):
                 "useTmdbID": self._useTmdbID,
                 "auto_scrape": self._auto_scrape,
                 "enable_retry_task": self._enable_retry_task,
-                "retry_tasks": json.dumps(retry_tasks_for_save)
+                "max_retry_times": self._max_retry_times,
+                "incremental": self._incremental,
+                "incremental_ttl": self._incremental_ttl,
+                "dedup_window": self._dedup_window,
+                "lane_rate": self._lane_rate,
+                "drop_when_full": self._drop_when_full,
+                "use_library_index": self._use_library_index
             })
             
+            self._restart_library_index()
             return schemas.Response(success=True, message="配置已保存")
         except Exception as e:
             logger.error(f"保存配置失败: {e}")
@@ -324,35 +395,92 @@ class Danmu(_PluginBase):
     def _get_status(self) -> Dict[str, Any]:
         """获取当前状态"""
         return {
-            "enabled": self._enabled
+            **ScrapeMetrics.snapshot(),
+            "ingest": self._ingest_queue.stats() if self._ingest_queue else None,
+            "job_id": self._job_id if self._job_running() else None,
+            "enabled": self._enabled,
+            "connections": generator.DanmuAPI.get_connection_stats(),
+            "library_index": {
+                "ready": self._library_index.ready,
+                "last_reconcile": self._library_index.last_reconcile
+            } if self._library_index else None
         }
 
-    def generate_danmu(self, file_path: str) -> Optional[str]:
+    def _prepare_task(self, file_path: str) -> generator.DanmuTask:
         """
-        生成弹幕文件
+        识别媒体信息，生成刮削任务
         :param file_path: 视频文件路径
-        :return: 生成的弹幕文件路径，如果失败则返回None或失败原因字符串
         """
-        meta = MetaInfo(file_path)
-        tmdb_id = None
-        episode = None
-        release_date = None
-        use_short_cache_ttl = False
+        task = generator.DanmuTask(file_path=file_path, is_retry=RetryQueue.contains(file_path))
         if self._useTmdbID:
-            media_info = self.media_chain.recognize_media(meta=meta)
+            meta = MetaInfo(file_path)
+            media_info = self._recognize_media(meta)
             if media_info:
-                tmdb_id = media_info.tmdb_id
-                episode = meta.episode.split('E')[1] if meta.episode else None
-                release_date = media_info.release_date
-                if release_date:
+                task.tmdb_id = media_info.tmdb_id
+                task.episode = meta.episode.split('E')[1] if meta.episode else None
+                task.release_date = self._episode_air_date(media_info, meta.begin_season, task.episode)
+                if task.release_date:
                     try:
-                        release_datetime = datetime.strptime(release_date, '%Y-%m-%d')
+                        release_datetime = datetime.strptime(task.release_date, '%Y-%m-%d')
                         is_recent = (datetime.now() - release_datetime).days < 90
                         if is_recent:
-                            logger.info(f"媒体 {tmdb_id} 是最近90天内发布的内容,使用短缓存")
-                            use_short_cache_ttl = True
+                            logger.info(f"媒体 {task.tmdb_id} 是最近90天内发布的内容,使用短缓存")
+                            task.cache_ttl = 60
                     except ValueError:
-                        logger.warning(f"无效的发布日期格式: {release_date},使用默认缓存时间")
+                        logger.warning(f"无效的发布日期格式: {task.release_date},使用默认缓存时间")
+        # 重试任务是为了获取新增弹幕，必须向服务端重新验证缓存
+        if task.is_retry:
+            task.cache_ttl = 0
+        return task
+
+    def _episode_air_date(self, media_info, season: Optional[int], episode: Optional[str]) -> Optional[str]:
+        """
+        获取单集的播出日期，剧集的上映日期是首播日期，不能反映新一集的热度。
+        获取失败时退回到媒体的上映日期
+        :param media_info: 媒体信息
+        :param season: 季号
+        :param episode: 集号
+        """
+        if media_info.type != MediaType.TV or not episode:
+            return media_info.release_date
+        season = season or 1
+        key = (media_info.tmdb_id, season)
+        air_dates = self._air_date_cache.get(key)
+        if air_dates is None:
+            try:
+                episodes = TmdbChain().tmdb_episodes(tmdbid=media_info.tmdb_id, season=season) or []
+                air_dates = {ep.episode_number: ep.air_date for ep in episodes if ep.air_date}
+            except Exception as e:
+                logger.warning(f"获取剧集播出日期失败: {media_info.tmdb_id} 第{season}季 - {e}")
+                return media_info.release_date
+            self._air_date_cache.put(key, air_dates)
+        try:
+            return air_dates.get(int(episode)) or media_info.release_date
+        except ValueError:
+            return media_info.release_date
+
+    def _recognize_media(self, meta: MetaInfo):
+        """
+        识别媒体信息，结果按季缓存，识别失败不缓存
+        :param meta: 文件元数据
+        """
+        if not meta.name:
+            return self.media_chain.recognize_media(meta=meta)
+        key = (meta.name, meta.year, meta.type, meta.begin_season)
+        media_info = self._media_cache.get(key)
+        if media_info is None:
+            media_info = self.media_chain.recognize_media(meta=meta)
+            if media_info:
+                self._media_cache.put(key, media_info)
+        return media_info
+
+    def generate_danmu(self, file_path: str) -> Optional[str]:
+        """
+        生成弹幕文件
+        :param file_path: 视频文件路径
+        :return: 生成的弹幕文件路径，如果失败则返回None或失败原因字符串
+        """
+        task = self._prepare_task(file_path)
     
         try:
             result = generator.danmu_generator(
@@ -365,108 +493,304 @@ class Danmu(_PluginBase):
                 self._duration,
                 self._onlyFromBili,
                 self._useTmdbID,
-                tmdb_id,
-                episode,
-                60 if use_short_cache_ttl else None
+                task.tmdb_id,
+                task.episode,
+                task.cache_ttl,
+                self._thinning_options(),
+                allow_stale=not task.is_retry
             )
-            
-            # 检查弹幕生成结果
-            ass_file = f"{os.path.splitext(file_path)[0]}.danmu.ass"
-            danmu_count = 0
-            
-            # 如果返回字符串且包含弹幕数量为0，说明是失败原因
-            if isinstance(result, str) and result.startswith('弹幕数量为0'):
-                logger.info(result)
-                # 检查是否需要添加到重试任务
-                self._add_to_retry_if_needed(file_path, 0)
-                return result
-            
-            # 检查生成的弹幕文件
-            if os.path.exists(ass_file):
-                danmu_count = self.count_danmu_lines(ass_file)
-                logger.info(f"弹幕生成完成，弹幕数量: {danmu_count}")
-                
-                # 检查弹幕数量是否满足要求
-                if self._enable_retry_task and danmu_count < self._min_danmu_count:
-                    logger.warning(f"弹幕数量 ({danmu_count}) 少于最小要求 ({self._min_danmu_count})，添加到重试任务")
-                    self._add_to_retry_if_needed(file_path, danmu_count)
-                else:
-                    # 弹幕数量满足要求，如果之前在重试列表中则移除
-                    if file_path in self._retry_tasks:
-                        logger.info(f"弹幕数量满足要求，从重试任务中移除: {file_path}")
-                        del self._retry_tasks[file_path]
-                        self._save_retry_tasks()
-            else:
-                logger.warning(f"弹幕文件不存在: {ass_file}")
-                # 没有生成弹幕文件，添加到重试任务
-                self._add_to_retry_if_needed(file_path, 0)
-                
-            return result
+            return self._handle_result(file_path, result, release_date=task.release_date)
         except Exception as e:
             logger.error(f"生成弹幕失败: {e}")
             # 生成失败，添加到重试任务
-            self._add_to_retry_if_needed(file_path, 0)
+            self._add_to_retry_if_needed(file_path, None if task.is_retry else 0, task.release_date)
             return f"生成弹幕失败: {str(e)}"
 
-    def _add_to_retry_if_needed(self, file_path: str, danmu_count: int):
+    def _thinning_options(self) -> generator.ThinningOptions:
+        return generator.ThinningOptions(
+            dedup_window=float(self._dedup_window or 0),
+            lane_rate=float(self._lane_rate or 0),
+            drop_when_full=bool(self._drop_when_full)
+        )
+
+    def _handle_result(self, file_path: str, result: Optional[str], episode_id: Optional[str] = None,
+                       release_date: Optional[str] = None) -> Optional[str]:
+        """
+        根据弹幕生成结果更新重试任务和生成记录
+        :param file_path: 视频文件路径
+        :param result: danmu_generator的返回值
+        :param episode_id: 弹幕ID
+        :param release_date: 上映日期，用于重试排序
+        :return: 原样返回result
+        """
+        # 检查弹幕生成结果
+        ass_file = f"{os.path.splitext(file_path)[0]}.danmu.ass"
+        danmu_count = 0
+
+        # 重试任务下载弹幕失败，本地旧文件不能说明弹幕没有增长，按基础间隔重新安排
+        if result == generator.FETCH_FAILED and RetryQueue.contains(file_path):
+            logger.warning(f"重试任务未获取到弹幕数据，稍后重试: {file_path}")
+            self._add_to_retry_if_needed(file_path, None, release_date)
+            return result
+        
+        # 如果返回字符串且包含弹幕数量为0，说明是失败原因
+        if isinstance(result, str) and result.startswith('弹幕数量为0'):
+            logger.info(result)
+            # 检查是否需要添加到重试任务
+            self._add_to_retry_if_needed(file_path, 0, release_date)
+            return result
+        
+        # 检查生成的弹幕文件
+        if os.path.exists(ass_file):
+            danmu_count = self.count_danmu_lines(ass_file)
+            logger.info(f"弹幕生成完成，弹幕数量: {danmu_count}")
+            if isinstance(result, str) and result.endswith('.ass'):
+                DanmuManifest.record(file_path, danmu_count, episode_id)
+                # 及时更新浏览页的弹幕状态，不等待文件监控或定期校对
+                if self._library_index:
+                    self._library_index.mark_dirty(os.path.dirname(ass_file))
+            
+            # 检查弹幕数量是否满足要求
+            if self._enable_retry_task and danmu_count < self._min_danmu_count:
+                logger.warning(f"弹幕数量 ({danmu_count}) 少于最小要求 ({self._min_danmu_count})，添加到重试任务")
+                self._add_to_retry_if_needed(file_path, danmu_count, release_date)
+            else:
+                # 弹幕数量满足要求，如果之前在重试列表中则移除
+                if RetryQueue.remove(file_path):
+                    logger.info(f"弹幕数量满足要求，从重试任务中移除: {file_path}")
+        else:
+            logger.warning(f"弹幕文件不存在: {ass_file}")
+            # 没有生成弹幕文件，添加到重试任务
+            self._add_to_retry_if_needed(file_path, 0, release_date)
+            
+        return result
+
+    @classmethod
+    def _stage(cls, name: str, func, workers: int) -> Stage:
+        """
+        创建流水线阶段，同名阶段共用一个信号量，
+        全局刮削、重试任务和入库触发的刮削同时运行时合计并发仍不超过workers
+        """
+        with cls._stage_limits_lock:
+            limiter = cls._stage_limits.get(name)
+            if limiter is None:
+                limiter = cls._stage_limits[name] = threading.BoundedSemaphore(workers)
+        return Stage(name, func, workers, limiter)
+
+    def _build_pipeline(self, on_complete=None,
+                        prematched: Optional[Dict[str, Optional[str]]] = None) -> StagePipeline:
+        """
+        构建刮削流水线：识别媒体 -> 读取hash -> 匹配弹幕 -> 下载弹幕 -> 生成ass，各阶段独立限制并发
+        :param on_complete: 文件处理结束时的回调
+        :param prematched: 本次批量匹配的结果 {视频文件路径: 弹幕ID}，只在这条流水线中使用
+        """
+        workers = max(1, int(self._max_threads))
+        prematched = prematched or {}
+        return StagePipeline([
+            self._stage("recognize", self._stage_recognize, workers),
+            self._stage("hash", lambda task: self._stage_hash(task, prematched),
+                        min(workers, self._hash_workers)),
+            self._stage("match", self._stage_match, workers),
+            self._stage("fetch", self._stage_fetch, workers),
+            self._stage("write", self._stage_write, min(workers, os.cpu_count() or 1)),
+        ], on_error=self._on_stage_error, on_complete=on_complete)
+
+    def _run_pipeline(self, files, total: Optional[int] = None, should_stop=None, on_complete=None,
+                      prematched: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, int]:
+        """
+        运行刮削流水线并记录进度
+        :param files: 待处理文件，可以是生成器
+        :param total: 已知的文件总数
+        :param should_stop: 返回True时停止投递新文件
+        :param on_complete: 文件处理结束时的回调
+        :param prematched: 批量匹配的结果 {视频文件路径: 弹幕ID}
+        """
+        ScrapeMetrics.start_job(total)
+        try:
+            return self._build_pipeline(on_complete, prematched).run(ScrapeMetrics.track(files), should_stop)
+        finally:
+            ScrapeMetrics.end_job()
+
+    def _stage_recognize(self, file_path: str) -> generator.DanmuTask:
+        logger.info(f"开始生成弹幕文件：{file_path}")
+        ScrapeMetrics.task_started(file_path)
+        task = self._prepare_task(file_path)
+        # 目录指定了弹幕ID时跳过hash和匹配
+        task.comment_id = generator.IdOverride.resolve(file_path, task.episode)
+        return task
+
+    def _stage_hash(self, task: generator.DanmuTask, prematched: Dict[str, Optional[str]]) -> generator.DanmuTask:
+        if task.comment_id:
+            return task
+        # 已批量匹配过的文件不再逐个匹配
+        if task.file_path in prematched:
+            task.comment_id = prematched.pop(task.file_path)
+            task.matched = True
+        else:
+            task.video_info = generator.DanmuAPI.build_video_info(task.file_path)
+        return task
+
+    def _stage_match(self, task: generator.DanmuTask) -> Optional[generator.DanmuTask]:
+        if task.comment_id:
+            return task
+        task.comment_id = generator.DanmuAPI.match_comment_id(
+            task.file_path, None if task.matched else task.video_info, self._useTmdbID, task.tmdb_id, task.episode
+        )
+        if not task.comment_id:
+            logger.info(f"未找到对应弹幕 - {task.file_path}")
+            return self._finish_task(task, "未找到对应弹幕")
+        return task
+
+    def _stage_fetch(self, task: generator.DanmuTask) -> Optional[generator.DanmuTask]:
+        task.comments_data = generator.DanmuAPI.get_comments(task.comment_id, task.cache_ttl,
+                                                             allow_stale=not task.is_retry)
+        if not task.comments_data:
+            return self._finish_task(task, generator.FETCH_FAILED)
+        return task
+
+    def _stage_write(self, task: generator.DanmuTask) -> generator.DanmuTask:
+        result = generator.write_danmu(
+            task.file_path,
+            task.comments_data,
+            self._width,
+            self._height,
+            'Arial',
+            self._fontsize,
+            self._alpha,
+            self._duration,
+            self._onlyFromBili,
+            self._thinning_options()
+        )
+        # 释放弹幕数据，避免排队任务占用内存
+        task.comments_data = None
+        self._finish_task(task, result)
+        return task
+
+    def _finish_task(self, task: generator.DanmuTask, result: Optional[str]) -> None:
+        task.result = result
+        ScrapeMetrics.task_finished(task.file_path, isinstance(result, str) and result.endswith('.ass'))
+        self._handle_result(task.file_path, result, task.comment_id, task.release_date)
+        return None
+
+    def _on_stage_error(self, item, stage: Stage, error: Exception):
+        if isinstance(item, generator.DanmuTask):
+            file_path, release_date = item.file_path, item.release_date
+        else:
+            file_path, release_date = item, None
+        logger.error(f"生成弹幕失败: {file_path}，阶段: {stage.name}，错误: {error}")
+        ScrapeMetrics.task_finished(file_path, False)
+        # 出错时不知道弹幕是否增长，已有的重试任务按基础间隔重新安排
+        self._add_to_retry_if_needed(file_path, None if RetryQueue.contains(file_path) else 0, release_date)
+
+    def _skip_fresh(self, files):
+        """
+        过滤掉弹幕仍在有效期内的文件
+        """
+        skipped = 0
+        for file_path in files:
+            if DanmuManifest.is_fresh(file_path, float(self._incremental_ttl)):
+                skipped += 1
+                continue
+            yield file_path
+        logger.info(f"增量刮削跳过 {skipped} 个文件")
+
+    def _restart_library_index(self):
+        """
+        按当前配置重建媒体库后台索引，启用状态和索引目录未变化时保留正在运行的索引
+        """
+        roots = []
+        if self._enabled and self._use_library_index and self._path:
+            roots = [os.path.normpath(path.strip()) for path in self._path.split('\n') if path.strip()]
+            roots = [root for root in roots if os.path.isdir(root)]
+        if self._library_index and self._library_index.roots == roots:
+            return
+        if self._library_index:
+            self._library_index.stop()
+            self._library_index = None
+        if not roots:
+            return
+        self._library_index = LibraryIndex(roots, self.get_data_path())
+        self._library_index.start()
+
+    def _media_exists(self, file_path: str) -> bool:
+        """
+        判断媒体文件是否存在，索引中存在时不访问磁盘。
+        索引可能缺少停机期间新增的文件，不存在时以磁盘为准
+        """
+        if self._library_index and self._library_index.exists(file_path):
+            return True
+        return os.path.exists(file_path)
+
+    def _iter_media_files(self, paths: List[str]):
+        """
+        流式遍历路径下的媒体文件，索引可用时直接读取索引
+        """
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            # 检查是否是单个文件
+            if os.path.isfile(path):
+                if path.endswith(('.mp4', '.mkv')):
+                    logger.info(f"刮削单个文件：{path}")
+                    yield path
+                continue
+            logger.info(f"刮削路径：{path}")
+            # 未完成校对的索引可能缺少停机期间新增的文件
+            if self._library_index and self._library_index.reconciled and self._library_index.covers(path):
+                yield from self._library_index.iter_media(path)
+                continue
+            for root, _, files in os.walk(path):
+                for file in files:
+                    if file.endswith(('.mp4', '.mkv')):
+                        yield os.path.join(root, file)
+
+    def _add_to_retry_if_needed(self, file_path: str, danmu_count: Optional[int],
+                                release_date: Optional[str] = None):
         """
         根据弹幕数量判断是否需要添加到重试任务
         :param file_path: 文件路径
-        :param danmu_count: 弹幕数量
+        :param danmu_count: 弹幕数量，未能获取弹幕时为空
+        :param release_date: 上映日期
         """
         if not self._enable_retry_task:
             return
-            
-        # 检查文件是否已在重试列表中
-        if file_path in self._retry_tasks:
-            # 更新重试次数和最后尝试时间
-            self._retry_tasks[file_path]["retry_count"] += 1
-            self._retry_tasks[file_path]["last_attempt"] = datetime.now()
-            
-            # 检查是否达到最大重试次数
-            if self._retry_tasks[file_path]["retry_count"] >= self._max_retry_times:
-                logger.warning(f"文件 {file_path} 达到最大重试次数 ({self._max_retry_times})，从重试列表中移除")
-                del self._retry_tasks[file_path]
-            else:
-                logger.info(f"更新重试任务: {file_path}，重试次数: {self._retry_tasks[file_path]['retry_count']}")
+        if danmu_count is not None and danmu_count >= self._min_danmu_count:
+            return
+        existed = RetryQueue.contains(file_path)
+        task = RetryQueue.record_failure(file_path, danmu_count, self._max_retry_times, release_date)
+        if task is None:
+            logger.warning(f"文件 {file_path} 达到最大重试次数 ({self._max_retry_times})，从重试列表中移除")
+        elif existed:
+            logger.info(f"更新重试任务: {file_path}，重试次数: {task['retry_count']}，"
+                        f"下次重试: {datetime.fromtimestamp(task['next_attempt']).strftime('%Y-%m-%d %H:%M:%S')}")
         else:
-            # 添加新的重试任务
-            if danmu_count < self._min_danmu_count:
-                self._retry_tasks[file_path] = {
-                    "retry_count": 1,
-                    "last_attempt": datetime.now(),
-                    "file_path": file_path,
-                    "last_danmu_count": danmu_count
-                }
-                logger.info(f"添加新的重试任务: {file_path}，当前弹幕数量: {danmu_count}")
-        
-        # 保存重试任务到配置
-        self._save_retry_tasks()
+            logger.info(f"添加新的重试任务: {file_path}，当前弹幕数量: {danmu_count}")
 
-    def _save_retry_tasks(self):
+    def _migrate_retry_tasks(self, config: dict):
         """
-        保存重试任务列表到配置
+        将配置中的重试任务迁移到重试队列，并从配置中删除
+        :param config: 插件配置
         """
         try:
-            # 将datetime对象转换为字符串以便JSON序列化
-            retry_tasks_for_save = {}
-            for file_path, task_info in self._retry_tasks.items():
-                retry_tasks_for_save[file_path] = {
-                    "retry_count": task_info["retry_count"],
-                    "last_attempt": task_info["last_attempt"].isoformat(),
-                    "file_path": task_info["file_path"],
-                    "last_danmu_count": task_info.get("last_danmu_count", 0)
-                }
-            
-            # 获取当前配置
-            current_config = self._get_config()
-            current_config["retry_tasks"] = json.dumps(retry_tasks_for_save)
-            
-            # 更新配置
-            self.update_config(current_config)
-            logger.debug("重试任务列表已保存到配置")
+            tasks = []
+            for file_path, task_info in json.loads(config["retry_tasks"]).items():
+                try:
+                    tasks.append({
+                        "file_path": task_info.get("file_path", file_path),
+                        "retry_count": task_info.get("retry_count", 1),
+                        "last_attempt": datetime.fromisoformat(
+                            task_info.get("last_attempt", datetime.now().isoformat())).timestamp(),
+                        "last_danmu_count": task_info.get("last_danmu_count", 0)
+                    })
+                except (ValueError, TypeError, AttributeError) as e:
+                    logger.warning(f"跳过无效的重试任务 {file_path}: {e}")
+            count = RetryQueue.import_tasks(tasks)
+            logger.info(f"从配置迁移了 {count} 个重试任务")
         except Exception as e:
-            logger.error(f"保存重试任务失败: {e}")
+            logger.warning(f"迁移重试任务失败，保留原配置: {e}")
+            return
+        config.pop("retry_tasks", None)
+        self.update_config(config)
 
     def update_path(self, path: str):
         """
@@ -474,76 +798,173 @@ class Danmu(_PluginBase):
         """
         self._path = path
         logger.info(f"更新路径: {self._path}")
+        self._restart_library_index()
         
-    def generate_danmu_global(self):
+    def generate_danmu_global(self, incremental: Optional[bool] = None):
+        """
+        全局刮削弹幕，等待刮削完成后返回
+        :param incremental: 是否增量刮削，为空时使用配置
+        """
+        response, thread = self._begin_scrape(incremental)
+        if thread is None:
+            return response
+        thread.join()
+        job = ScrapeJob.get(response.data["job_id"])
+        status = job["status"] if job else None
+        if status == ScrapeJob.FINISHED:
+            return schemas.Response(success=True, message="弹幕刮削完成")
+        if status == ScrapeJob.CANCELLED:
+            return schemas.Response(success=False, message="弹幕刮削已取消")
+        if status == ScrapeJob.FAILED:
+            return schemas.Response(success=False, message="弹幕刮削失败")
+        return schemas.Response(success=False, message="弹幕刮削已停止，下次启动时继续")
+
+    def start_scrape(self, incremental: Optional[bool] = None):
+        """
+        在后台全局刮削弹幕，立即返回任务ID
+        :param incremental: 是否增量刮削，为空时使用配置
+        """
+        return self._begin_scrape(incremental)[0]
+
+    def _begin_scrape(self, incremental: Optional[bool]) -> Tuple[Any, Optional[threading.Thread]]:
         """
-        全局刮削弹幕
+        检查刮削路径并启动全局刮削任务
+        :param incremental: 是否增量刮削，为空时使用配置
+        :return: 接口响应，以及启动成功时的任务线程
         """
         if not self._path:
             logger.warning("未设置刮削路径，跳过刮削")
-            return schemas.Response(success=False, message="没有设定路径")
+            return schemas.Response(success=False, message="没有设定路径"), None
 
-        logger.info("开始弹幕刮削")
-        
-        threading_list = []
         paths = [path.strip() for path in self._path.split('\n') if path.strip()]
-
-        # 计算总文件数
-        total_files = 0
         for path in paths:
             if not os.path.exists(path):
                 logger.warning(f"路径不存在: {path}")
-                return schemas.Response(success=False, message=f"路径不存在: {path}")
+                return schemas.Response(success=False, message=f"路径不存在: {path}"), None
 
-            if os.path.isfile(path) and path.endswith(('.mp4', '.mkv')):
-                total_files += 1
-            else:
-                for root, _, files in os.walk(path):
-                    total_files += sum(1 for file in files if file.endswith(('.mp4', '.mkv')))
+        if incremental is None:
+            incremental = self._incremental
+        with self._job_lock:
+            if self._job_running():
+                return schemas.Response(success=False, message="已有刮削任务在运行",
+                                        data={"job_id": self._job_id}), None
+            job_id = ScrapeJob.create(incremental)
+            self._start_job(job_id, bool(incremental), paths)
+            thread = self._job_thread
+        return schemas.Response(success=True, message="弹幕刮削已开始", data={"job_id": job_id}), thread
 
-        for path in paths:
-            if not os.path.exists(path):
-                continue
+    def cancel_scrape(self):
+        """
+        取消正在运行的全局刮削任务
+        """
+        with self._job_lock:
+            if not self._job_running():
+                return schemas.Response(success=False, message="没有正在运行的刮削任务")
+            ScrapeJob.set_status(self._job_id, ScrapeJob.CANCELLED)
+            self._job_stop.set()
+        logger.info(f"取消刮削任务 {self._job_id}，等待处理中的文件完成")
+        return schemas.Response(success=True, message="刮削任务已取消，正在等待处理中的文件完成",
+                                data={"job_id": self._job_id})
 
-            # 检查是否是单个文件
-            if os.path.isfile(path) and path.endswith(('.mp4', '.mkv')):
-                logger.info(f"刮削单个文件：{path}")
-                if len(threading_list) >= self._max_threads:
-                    threading_list[0].join()
-                    threading_list.pop(0)
-
-                thread = threading.Thread(
-                    target=self.generate_danmu,
-                    args=(path,)
-                )
-                thread.start()
-                threading_list.append(thread)
-                continue
+    def _job_running(self) -> bool:
+        return self._job_thread is not None and self._job_thread.is_alive()
+
+    def _start_job(self, job_id: str, incremental: bool, paths: List[str]):
+        self._job_id = job_id
+        self._job_stop = threading.Event()
+        self._job_thread = threading.Thread(target=self._run_job, args=(job_id, incremental, paths, self._job_stop),
+                                            name=f"danmu-job-{job_id}", daemon=True)
+        self._job_thread.start()
+
+    def _resume_job(self):
+        """
+        继续上次未完成的全局刮削任务
+        """
+        if not self._path:
+            return
+        try:
+            job = ScrapeJob.unfinished()
+        except Exception as e:
+            logger.warning(f"读取刮削任务失败: {e}")
+            return
+        if not job:
+            return
+        paths = [path.strip() for path in self._path.split('\n') if path.strip() and os.path.exists(path.strip())]
+        with self._job_lock:
+            if self._job_running():
+                return
+            logger.info(f"继续未完成的刮削任务 {job['id']}")
+            self._start_job(job["id"], job["incremental"], paths)
+
+    def _run_job(self, job_id: str, incremental: bool, paths: List[str], stop_event: threading.Event):
+        """
+        执行全局刮削任务，已处理的文件写入检查点
+        """
+        try:
+            files = self._iter_media_files(paths)
+            done = ScrapeJob.done_count(job_id)
+            if done:
+                logger.info(f"刮削任务 {job_id} 从检查点继续，跳过已处理的 {done} 个文件")
+                files = (file_path for file_path in files if not ScrapeJob.is_done(job_id, file_path))
+            if incremental:
+                logger.info(f"增量刮削，跳过 {self._incremental_ttl} 小时内已生成且未变化的文件")
+                files = self._skip_fresh(files)
+
+            def _checkpoint(item):
+                file_path = item.file_path if isinstance(item, generator.DanmuTask) else item
+                ScrapeJob.mark_done(job_id, file_path)
+
+            logger.info(f"开始弹幕刮削，任务 {job_id}")
+            stats = self._run_pipeline(files, should_stop=stop_event.is_set, on_complete=_checkpoint)
+            ScrapeJob.flush()
+            if stop_event.is_set():
+                # 取消时状态已更新；插件停止时保持运行状态，下次启动继续
+                logger.info(f"刮削任务 {job_id} 已停止，本次处理 {stats['queued']} 个文件")
+                return
+            ScrapeJob.set_status(job_id, ScrapeJob.FINISHED)
+            logger.info(f"弹幕刮削完成，共 {stats['queued']} 个文件，生成 {stats['done']} 个，"
+                        f"未生成 {stats['finished_early']} 个，失败 {stats['failed']} 个")
+        except Exception as e:
+            logger.error(f"刮削任务 {job_id} 失败: {e}")
+            # 标记为失败，避免下次启动时反复继续同一个出错的任务
+            try:
+                ScrapeJob.set_status(job_id, ScrapeJob.FAILED)
+            except Exception as err:
+                logger.error(f"更新刮削任务 {job_id} 状态失败: {err}")
+
+    def _stop_job(self, timeout: float = 30) -> bool:
+        """
+        停止当前刮削任务但保留检查点，等待处理中的文件完成
+        :return: 任务线程是否已退出
+        """
+        with self._job_lock:
+            thread = self._job_thread
+            self._job_stop.set()
+        if thread is not None and thread.is_alive():
+            logger.info(f"停止刮削任务 {self._job_id}，下次启动时继续")
+            thread.join(timeout)
+        return thread is None or not thread.is_alive()
+
+    def prewarm_hash_index(self):
+        """
+        预热刮削路径下媒体文件的hash索引
+        """
+        if not self._path:
+            return schemas.Response(success=False, message="没有设定路径")
+
+        paths = [path.strip() for path in self._path.split('\n') if path.strip()]
+        logger.info("开始预热hash索引")
+        stats = generator.DanmuAPI.prewarm_hash_index(self._iter_media_files(paths), self._hash_workers)
+        message = f"hash索引预热完成。命中: {stats['cached']}, 新计算: {stats['computed']}, 失败: {stats['failed']}, 清理: {stats['pruned']}"
+        logger.info(message)
+        return schemas.Response(success=True, message=message, data=stats)
+
+    def get_metrics(self):
+        """
+        Prometheus文本格式的统计数据
+        """
+        return PlainTextResponse(ScrapeMetrics.prometheus(), media_type="text/plain; version=0.0.4")
 
-            # 处理目录
-            logger.info(f"刮削路径：{path}")
-            for root, _, files in os.walk(path):
-                for file in files:
-                    if file.endswith(('.mp4', '.mkv')):
-                        if len(threading_list) >= self._max_threads:
-                            threading_list[0].join()
-                            threading_list.pop(0)
-
-                        target_file = os.path.join(root, file)
-                        logger.info(f"开始生成弹幕文件：{target_file}")
-                        thread = threading.Thread(
-                            target=self.generate_danmu,
-                            args=(target_file,)
-                        )
-                        thread.start()
-                        threading_list.append(thread)
-
-        for thread in threading_list:
-            thread.join()
-
-        logger.info("弹幕刮削完成")
-        return schemas.Response(success=True, message="弹幕刮削完成")
-    
     @eventmanager.register(EventType.TransferComplete)
     def generate_danmu_after_transfer(self, event):
         """
@@ -575,26 +996,67 @@ class Danmu(_PluginBase):
 
         try:
             raw_data = __to_dict(event.event_data)
-            target_file = raw_data.get("transferinfo", {}).get("file_list_new", [None])[0]
+            target_files = [file for file in raw_data.get("transferinfo", {}).get("file_list_new") or []
+                            if file and file.endswith(('.mp4', '.mkv'))]
             
-            if not target_file:
+            if not target_files:
                 logger.warning("未找到目标文件")
                 return
 
-            logger.info(f"开始生成弹幕文件：{target_file}")
-            thread = threading.Thread(
-                target=self.generate_danmu,
-                args=(target_file,)
-            )
-            thread.start()
+            added = self._ingest_queue.submit(target_files) if self._ingest_queue else 0
+            logger.info(f"传输完成，{added} 个文件加入弹幕生成队列，跳过 {len(target_files) - added} 个重复文件")
         except Exception as e:
             logger.error(f"处理传输完成事件失败: {e}")
 
+    def _process_transfer_batch(self, files: List[str]):
+        """
+        批量生成传输完成文件的弹幕，与全局刮削共用流水线和并发限制
+        :param files: 视频文件路径列表
+        """
+        logger.info(f"开始为 {len(files)} 个传输文件生成弹幕")
+        stats = self._run_pipeline(files, len(files), prematched=self._prematch(files))
+        logger.info(f"传输文件弹幕生成完成，生成 {stats['done']} 个，"
+                    f"未生成 {stats['finished_early']} 个，失败 {stats['failed']} 个")
+
+    def _prematch(self, files: List[str]) -> Dict[str, Optional[str]]:
+        """
+        按目录（季）批量匹配弹幕ID，一季只需一次请求，服务端不支持时由流水线逐个匹配
+        :param files: 视频文件路径列表
+        :return: {视频文件路径: 弹幕ID}，未能批量匹配的文件不出现在结果中
+        """
+        prematched = {}
+        groups: Dict[str, List[str]] = {}
+        for file_path in files:
+            groups.setdefault(os.path.dirname(file_path), []).append(file_path)
+        for directory, group in groups.items():
+            # 目录指定了弹幕ID时无需匹配
+            if len(group) < 2 or generator.IdOverride.anime_id(directory) is not None:
+                continue
+            matches = generator.DanmuAPI.match_group(group, self._hash_workers)
+            if matches:
+                logger.info(f"批量匹配 {directory}：{sum(1 for v in matches.values() if v)}/{len(group)} 个文件匹配成功")
+            prematched.update(matches)
+        return prematched
+
     def stop_service(self):
         """
         退出插件
         """
-        pass
+        stopped = self._stop_job()
+        if self._ingest_queue:
+            stopped = self._ingest_queue.stop() and stopped
+            self._ingest_queue = None
+        if self._library_index:
+            self._library_index.stop()
+            self._library_index = None
+        RetryQueue.flush()
+        ScrapeJob.flush()
+        if not stopped:
+            # 仍有文件在处理，关闭会话和数据库会让这些线程出错，交给进程退出时回收
+            logger.warning("刮削任务未能在超时时间内停止，暂不关闭网络会话和缓存数据库")
+            return
+        generator.DanmuAPI.close_session()
+        CacheDB.close()
 
     def count_danmu_lines(self, ass_file: str) -> int:
         """
@@ -605,6 +1067,10 @@ class Danmu(_PluginBase):
         try:
             if not os.path.exists(ass_file):
                 return 0
+            # 新版本生成的文件头部记录了弹幕数量
+            metadata = generator.DanmuConverter.read_metadata(ass_file)
+            if metadata is not None:
+                return metadata["count"]
             count = 0
             with open(ass_file, 'r', encoding='utf-8') as f:
                 for line in f:
@@ -615,18 +1081,27 @@ class Danmu(_PluginBase):
             logger.error(f"计算弹幕数量失败: {e}")
             return 0
 
-    def scan_path(self, path: str = None, current_dir: str = None) -> Dict[str, Any]:
+    def scan_path(self, path: str = None, current_dir: str = None, cursor: str = None, limit: int = 0,
+                  sort: str = "name", filter_by: str = "all", below: int = None,
+                  count_only: bool = False) -> Dict[str, Any]:
         """
         扫描路径下的媒体文件和弹幕信息
         :param path: 配置的根路径
         :param current_dir: 当前浏览的目录（用于点击式导航）
+        :param cursor: 分页游标，取上一页返回的next_cursor
+        :param limit: 每页数量，0为不分页
+        :param sort: 排序方式 name/danmu_asc/danmu_desc
+        :param filter_by: 过滤方式 all/missing(无弹幕)/below(弹幕少于below条)
+        :param below: filter_by为below时的弹幕数量阈值，默认为最小弹幕数量
+        :param count_only: 只返回数量统计，不返回子项
         :return: 目录结构信息
         """
         logger.debug(f"开始扫描路径: {path if path else self._path}, 当前目录: {current_dir}")
+        page_args = dict(cursor=cursor, limit=limit, sort=sort, filter_by=filter_by, below=below, count_only=count_only)
         
         # 如果有current_dir，直接扫描该目录
         if current_dir:
-            return self.scan_subfolder(current_dir)
+            return self.scan_subfolder(current_dir, **page_args)
         
         # 否则使用配置的路径
         if not path:
@@ -651,13 +1126,21 @@ class Danmu(_PluginBase):
                 "children": []
             }
             
+            # 根目录只列出，点击时再扫描
             for single_path in paths:
                 logger.debug(f"处理子路径: {single_path}")
                 if os.path.exists(single_path):
-                    child_result = self._scan_current_directory(single_path)
-                    result["children"].append(child_result)
+                    result["children"].append({
+                        "name": os.path.basename(single_path) or single_path,
+                        "path": single_path,
+                        "type": "directory",
+                        "is_root": True,
+                        "children": []
+                    })
                 else:
                     logger.warning(f"路径不存在: {single_path}")
+            result["total"] = len(result["children"])
+            result["next_cursor"] = None
                     
             logger.debug(f"多路径扫描完成，共 {len(result['children'])} 个有效路径")
             return schemas.Response(success=True, data=result)
@@ -669,18 +1152,26 @@ class Danmu(_PluginBase):
                 logger.warning(f"路径不存在: {single_path}")
                 return schemas.Response(success=False, message=f"路径不存在: {single_path}")
             
-            result = self._scan_current_directory(single_path, is_root=True)
+            result = self._scan_current_directory(single_path, is_root=True, **page_args)
             logger.debug("单路径扫描完成")
             return schemas.Response(success=True, data=result)
         else:
             logger.debug("没有提供有效路径")
             return schemas.Response(success=False, message="未提供有效路径")
 
-    def _scan_current_directory(self, path: str, is_root: bool = False) -> Dict[str, Any]:
+    def _scan_current_directory(self, path: str, is_root: bool = False, cursor: str = None, limit: int = 0,
+                                sort: str = "name", filter_by: str = "all", below: int = None,
+                                count_only: bool = False) -> Dict[str, Any]:
         """
         扫描当前目录的直接内容（不递归）
         :param path: 要扫描的目录路径
         :param is_root: 是否为根目录
+        :param cursor: 分页游标
+        :param limit: 每页数量，0为不分页
+        :param sort: 排序方式 name/danmu_asc/danmu_desc，目录始终按名称排在前面
+        :param filter_by: 过滤方式 all/missing/below，只作用于媒体文件
+        :param below: filter_by为below时的弹幕数量阈值
+        :param count_only: 只返回数量统计
         :return: 目录结构信息
         """
         logger.debug(f"开始扫描当前目录: {path}, 是否为根目录: {is_root}")
@@ -699,86 +1190,79 @@ class Danmu(_PluginBase):
                 if path.endswith(('.mp4', '.mkv')):
                     logger.debug(f"{path} 是媒体文件")
                     result["type"] = "media"
-                    # 检查是否存在对应的弹幕文件
                     ass_file = f"{os.path.splitext(path)[0]}.danmu.ass"
-                    logger.debug(f"检查弹幕文件: {ass_file}")
-                    if os.path.exists(ass_file):
-                        danmu_count = self.count_danmu_lines(ass_file)
-                        result["danmu_count"] = danmu_count
-                        logger.debug(f"找到弹幕文件，数量: {danmu_count}")
-                    else:
-                        result["danmu_count"] = 0
-                        logger.debug("未找到弹幕文件")
+                    result["danmu_count"] = self._get_danmu_count(ass_file)
                 return result
                 
             # 扫描目录的直接子项
             logger.debug(f"{path} 是目录，开始扫描直接子项")
-            media_count = 0
-            dir_count = 0
-            
-            try:
-                items = os.listdir(path)
-                logger.debug(f"{path} 目录中共有 {len(items)} 个项目")
-            except PermissionError:
-                logger.warning(f"无权限访问目录: {path}")
-                result["error"] = "无权限访问该目录"
-                return result
-            except Exception as e:
-                logger.warning(f"列出目录内容失败: {path}, 错误: {str(e)}")
-                result["error"] = f"列出目录内容失败: {str(e)}"
+            listing = self._list_directory(path)
+            if isinstance(listing, str):
+                result["error"] = listing
                 return result
+            directories, files, danmu_files = listing
             
-            # 先处理目录，再处理文件
-            directories = []
-            files = []
+            # 目录始终按名称排在媒体文件前面，排序键同时作为分页游标
+            children = [((0, item), {
+                "name": item,
+                "path": item_path,
+                "type": "directory",
+                "children": []
+            }, None) for item, item_path in directories]
             
-            for item in items:
-                # 跳过隐藏文件和系统文件
-                if item.startswith('.'):
-                    continue
-                    
-                item_path = os.path.join(path, item)
-                
-                if os.path.isdir(item_path):
-                    directories.append((item, item_path))
-                elif os.path.isfile(item_path) and item.endswith(('.mp4', '.mkv')):
-                    files.append((item, item_path))
+            media = [((1, item), {
+                "name": item,
+                "path": item_path,
+                "type": "media",
+                "children": []
+            }, danmu_files.get(f"{os.path.splitext(item)[0]}.danmu.ass")) for item, item_path in files]
             
-            # 添加目录到结果
-            for item, item_path in sorted(directories):
-                logger.debug(f"发现目录: {item_path}")
-                dir_count += 1
-                child = {
-                    "name": item,
-                    "path": item_path,
-                    "type": "directory",
-                    "children": []
-                }
-                result["children"].append(child)
+            def _fill_count(child: dict, danmu_file) -> int:
+                # 检查是否存在对应的弹幕文件
+                if "danmu_count" not in child:
+                    child["danmu_count"] = self._get_danmu_count(*danmu_file) if danmu_file is not None else 0
+                return child["danmu_count"]
+            
+            # 排序、过滤或统计时需要全部弹幕数量，否则只读取当前页
+            if sort != "name" or filter_by != "all" or count_only:
+                for _, child, danmu_file in media:
+                    _fill_count(child, danmu_file)
+            threshold = self._min_danmu_count if below is None else int(below)
+            if filter_by == "missing":
+                media = [m for m in media if m[1]["danmu_count"] == 0]
+            elif filter_by == "below":
+                media = [m for m in media if m[1]["danmu_count"] < threshold]
+            if sort in ("danmu_asc", "danmu_desc"):
+                sign = -1 if sort == "danmu_desc" else 1
+                media = [((1, sign * child["danmu_count"], name), child, danmu_file)
+                         for (_, name), child, danmu_file in media]
             
-            # 添加媒体文件到结果
-            for item, item_path in sorted(files):
-                logger.debug(f"发现媒体文件: {item_path}")
-                media_count += 1
-                child = {
-                    "name": item,
-                    "path": item_path,
-                    "type": "media",
-                    "children": []
+            if count_only:
+                result["counts"] = {
+                    "directories": len(children),
+                    "media": len(media),
+                    "missing": sum(1 for m in media if m[1]["danmu_count"] == 0),
+                    "below": sum(1 for m in media if m[1]["danmu_count"] < threshold)
                 }
-                # 检查是否存在对应的弹幕文件
-                ass_file = f"{os.path.splitext(item_path)[0]}.danmu.ass"
-                logger.debug(f"检查弹幕文件: {ass_file}")
-                if os.path.exists(ass_file):
-                    danmu_count = self.count_danmu_lines(ass_file)
-                    child["danmu_count"] = danmu_count
-                    logger.debug(f"找到弹幕文件，数量: {danmu_count}")
-                else:
-                    child["danmu_count"] = 0
-                    logger.debug(f"未找到弹幕文件: {ass_file}")
+                return result
+            
+            # 游标记录上一页最后一项的排序键，目录内容变化时不会重复或遗漏
+            items = children + media
+            after = self._decode_cursor(cursor, sort)
+            remaining = [item for item in items if item[0] > after] if after is not None else items
+            limit = int(limit or 0)
+            if 0 < limit < len(remaining):
+                page = heapq.nsmallest(limit, remaining, key=lambda item: item[0])
+            else:
+                page = sorted(remaining, key=lambda item: item[0])
+            for _, child, danmu_file in page:
+                if child["type"] == "media":
+                    _fill_count(child, danmu_file)
                 result["children"].append(child)
+            result["total"] = len(items)
+            result["next_cursor"] = self._encode_cursor(page[-1][0], sort) if len(page) < len(remaining) else None
             
-            logger.debug(f"目录 {path} 扫描完成，发现 {media_count} 个媒体文件，{dir_count} 个子目录")
+            logger.debug(f"目录 {path} 扫描完成，发现 {len(files)} 个媒体文件，{len(directories)} 个子目录")
             return result
         except Exception as e:
             logger.error(f"扫描路径失败: {path}, 错误: {e}")
@@ -786,6 +1270,90 @@ class Danmu(_PluginBase):
             result["error"] = str(e)
             return result
 
+    @staticmethod
+    def _encode_cursor(key: tuple, sort: str) -> str:
+        """
+        将排序键编码为不透明的分页游标
+        """
+        data = json.dumps({"sort": sort, "key": list(key)}, ensure_ascii=False, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor: Optional[str], sort: str) -> Optional[tuple]:
+        """
+        解析分页游标，无效或排序方式不一致时从头开始
+        """
+        if not cursor:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+            if data.get("sort") != sort:
+                return None
+            return tuple(data["key"])
+        except (ValueError, TypeError, KeyError, AttributeError):
+            logger.debug(f"无效的分页游标: {cursor}")
+            return None
+
+    def _list_directory(self, path: str):
+        """
+        列出目录的直接子项，索引可用时不访问磁盘
+        :return: (目录列表, 媒体文件列表, {弹幕文件名: (路径, (大小, 修改时间))})，失败时返回错误信息
+        """
+        node = self._library_index.list_dir(path) if self._library_index else None
+        if node is not None:
+            return (
+                [(name, os.path.join(path, name)) for name in node.dirs],
+                [(name, os.path.join(path, name)) for name in node.media],
+                {name: (os.path.join(path, name), key) for name, key in node.danmu.items()}
+            )
+        
+        # DirEntry自带类型信息，不再逐个stat
+        directories = []
+        files = []
+        danmu_files = {}
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    # 跳过隐藏文件和系统文件
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            directories.append((entry.name, entry.path))
+                        elif entry.name.endswith('.danmu.ass'):
+                            st = entry.stat()
+                            danmu_files[entry.name] = (entry.path, (st.st_size, st.st_mtime_ns))
+                        elif entry.name.endswith(('.mp4', '.mkv')) and entry.is_file():
+                            files.append((entry.name, entry.path))
+                    except OSError as e:
+                        logger.debug(f"读取目录项失败: {entry.path}, 错误: {str(e)}")
+        except PermissionError:
+            logger.warning(f"无权限访问目录: {path}")
+            return "无权限访问该目录"
+        except Exception as e:
+            logger.warning(f"列出目录内容失败: {path}, 错误: {str(e)}")
+            return f"列出目录内容失败: {str(e)}"
+        return directories, files, danmu_files
+
+    def _get_danmu_count(self, ass_file: str, file_key: Optional[Tuple[int, int]] = None) -> int:
+        """
+        获取弹幕数量，按弹幕文件的大小和修改时间缓存
+        :param ass_file: 弹幕文件路径
+        :param file_key: 已知的 (大小, 修改时间ns)，为空时stat文件
+        """
+        if file_key is None:
+            try:
+                st = os.stat(ass_file)
+            except OSError:
+                return 0
+            file_key = (st.st_size, st.st_mtime_ns)
+        cached = self._danmu_count_cache.get(ass_file)
+        if cached and cached[0] == file_key:
+            return cached[1]
+        count = self.count_danmu_lines(ass_file)
+        self._danmu_count_cache.put(ass_file, (file_key, count))
+        return count
+
     def generate_danmu_single(self, file_path: str) -> Dict[str, Any]:
         """
         为单个文件生成弹幕
@@ -823,9 +1391,11 @@ class Danmu(_PluginBase):
             logger.error(f"生成弹幕失败: {e}")
             return schemas.Response(success=False, message=f"生成弹幕失败: {str(e)}")
 
-    def scan_subfolder(self, subfolder_path: str = None) -> Dict[str, Any]:
+    def scan_subfolder(self, subfolder_path: str = None, cursor: str = None, limit: int = 0,
+                       sort: str = "name", filter_by: str = "all", below: int = None,
+                       count_only: bool = False) -> Dict[str, Any]:
         """
-        专门用于扫描子文件夹的内容（点击式导航）
+        专门用于扫描子文件夹的内容（点击式导航），分页参数同scan_path
         :param subfolder_path: 子文件夹路径
         :return: 该子文件夹的内容
         """
@@ -851,7 +1421,9 @@ class Danmu(_PluginBase):
                 is_root = subfolder_path in root_paths
             
             # 直接扫描这个子文件夹的内容
-            result = self._scan_current_directory(subfolder_path, is_root=is_root)
+            result = self._scan_current_directory(subfolder_path, is_root=is_root, cursor=cursor, limit=limit,
+                                                  sort=sort, filter_by=filter_by, below=below,
+                                                  count_only=count_only)
             logger.debug("子文件夹扫描完成")
             return schemas.Response(success=True, data=result)
         except Exception as e:
@@ -863,14 +1435,15 @@ class Danmu(_PluginBase):
         获取重试任务列表
         :return: 重试任务列表
         """
-        # 转换datetime对象为字符串以便前端显示
+        # 转换时间戳为字符串以便前端显示
         display_tasks = {}
-        for file_path, task_info in self._retry_tasks.items():
-            display_tasks[file_path] = {
+        for task_info in RetryQueue.all():
+            display_tasks[task_info["file_path"]] = {
                 "retry_count": task_info["retry_count"],
-                "last_attempt": task_info["last_attempt"].strftime("%Y-%m-%d %H:%M:%S"),
+                "last_attempt": datetime.fromtimestamp(task_info["last_attempt"]).strftime("%Y-%m-%d %H:%M:%S"),
+                "next_attempt": datetime.fromtimestamp(task_info["next_attempt"]).strftime("%Y-%m-%d %H:%M:%S"),
                 "file_path": task_info["file_path"],
-                "last_danmu_count": task_info.get("last_danmu_count", 0)
+                "last_danmu_count": task_info["last_danmu_count"]
             }
         
         return schemas.Response(
@@ -884,85 +1457,71 @@ class Danmu(_PluginBase):
             }
         )
 
-    def process_retry_tasks(self) -> Dict[str, Any]:
+    def process_retry_tasks(self, due_only: bool = False) -> Dict[str, Any]:
         """
-        处理重试任务
+        并发处理重试任务，与全局刮削共用流水线和并发限制，最近上映的优先
+        :param due_only: 只处理已到重试时间的任务
         :return: 处理结果
         """
-        if not self._retry_tasks:
+        tasks_to_process = RetryQueue.due() if due_only else RetryQueue.all(by_priority=True)
+        if not tasks_to_process:
             return schemas.Response(success=True, message="没有待处理的重试任务")
         
-        logger.info(f"开始处理 {len(self._retry_tasks)} 个重试任务")
-        processed_count = 0
+        logger.info(f"开始处理 {len(tasks_to_process)} 个重试任务")
         success_count = 0
         failed_count = 0
         removed_count = 0
         
-        # 创建副本以避免在迭代时修改字典
-        tasks_to_process = list(self._retry_tasks.items())
-        
-        for file_path, task_info in tasks_to_process:
+        files = []
+        for task_info in tasks_to_process:
+            file_path = task_info["file_path"]
             # 检查文件是否仍然存在
-            if not os.path.exists(file_path):
+            if not self._media_exists(file_path):
                 logger.warning(f"重试任务文件不存在，移除: {file_path}")
-                if file_path in self._retry_tasks:
-                    del self._retry_tasks[file_path]
+                RetryQueue.remove(file_path)
                 removed_count += 1
                 continue
             
             # 检查是否达到最大重试次数
             if task_info["retry_count"] >= self._max_retry_times:
                 logger.warning(f"文件 {file_path} 已达到最大重试次数 ({self._max_retry_times})，移除")
-                if file_path in self._retry_tasks:
-                    del self._retry_tasks[file_path]
+                RetryQueue.remove(file_path)
                 removed_count += 1
                 continue
             
             logger.info(f"处理重试任务: {file_path} (第 {task_info['retry_count'] + 1} 次尝试)")
-            
-            try:
-                # 生成弹幕（这会自动更新重试任务状态）
-                result = self.generate_danmu(file_path)
-                processed_count += 1
-                
-                # 检查结果
-                if result and not (isinstance(result, str) and result.startswith('弹幕数量为0')):
-                    # 检查弹幕文件是否满足要求
-                    ass_file = f"{os.path.splitext(file_path)[0]}.danmu.ass"
-                    if os.path.exists(ass_file):
-                        danmu_count = self.count_danmu_lines(ass_file)
-                        if danmu_count >= self._min_danmu_count:
-                            success_count += 1
-                            logger.info(f"重试成功: {file_path}，弹幕数量: {danmu_count}")
-                        else:
-                            failed_count += 1
-                            logger.info(f"重试失败: {file_path}，弹幕数量仍不足: {danmu_count}")
-                    else:
-                        failed_count += 1
-                        logger.warning(f"重试失败: {file_path}，弹幕文件不存在")
-                else:
-                    failed_count += 1
-                    logger.warning(f"重试失败: {file_path}，{result}")
-                    
-            except Exception as e:
-                logger.error(f"处理重试任务失败: {file_path}，错误: {e}")
+            files.append(file_path)
+        
+        # 生成弹幕（结果处理时会自动更新重试任务状态）
+        stats = self._run_pipeline(files, len(files)) if files else {}
+        
+        # 检查弹幕文件是否满足要求
+        for file_path in files:
+            ass_file = f"{os.path.splitext(file_path)[0]}.danmu.ass"
+            danmu_count = self._get_danmu_count(ass_file)
+            if danmu_count >= self._min_danmu_count:
+                success_count += 1
+                logger.info(f"重试成功: {file_path}，弹幕数量: {danmu_count}")
+            else:
                 failed_count += 1
+                logger.info(f"重试失败: {file_path}，弹幕数量仍不足: {danmu_count}")
         
-        # 保存更新后的重试任务列表
-        self._save_retry_tasks()
+        # 提交更新后的重试任务
+        remaining = RetryQueue.count()
         
-        result_message = f"重试任务处理完成。处理: {processed_count}, 成功: {success_count}, 失败: {failed_count}, 移除: {removed_count}, 剩余: {len(self._retry_tasks)}"
+        result_message = f"重试任务处理完成。处理: {len(files)}, 成功: {success_count}, 失败: {failed_count}, 移除: {removed_count}, 剩余: {remaining}"
         logger.info(result_message)
         
         return schemas.Response(
             success=True,
             message=result_message,
             data={
-                "processed": processed_count,
+                "processed": len(files),
                 "success": success_count,
                 "failed": failed_count,
                 "removed": removed_count,
-                "remaining": len(self._retry_tasks)
+                "remaining": remaining,
+                "pipeline": stats
             }
         )
 
@@ -971,9 +1530,7 @@ class Danmu(_PluginBase):
         清空重试任务
         :return: 清空结果
         """
-        task_count = len(self._retry_tasks)
-        self._retry_tasks = {}
-        self._save_retry_tasks()
+        task_count = RetryQueue.clear()
         
         logger.info(f"已清空 {task_count} 个重试任务")
         return schemas.Response(
@@ -990,9 +1547,7 @@ class Danmu(_PluginBase):
         if not file_path:
             return schemas.Response(success=False, message="文件路径不能为空")
             
-        if file_path in self._retry_tasks:
-            del self._retry_tasks[file_path]
-            self._save_retry_tasks()
+        if RetryQueue.remove(file_path):
             logger.info(f"重试任务已移除: {file_path}")
             return schemas.Response(
                 success=True,
@@ -1013,14 +1568,8 @@ class Danmu(_PluginBase):
                 logger.debug("弹幕插件或重试任务功能未启用，跳过定时处理")
                 return
                 
-            if not self._retry_tasks:
-                logger.debug("没有待处理的重试任务")
-                return
-                
-            logger.info(f"定时任务开始处理 {len(self._retry_tasks)} 个重试任务")
-            
-            # 调用现有的处理重试任务方法
-            result = self.process_retry_tasks()
+            # 只处理已到重试时间的任务
+            result = self.process_retry_tasks(due_only=True)
             
             if result.success:
                 logger.info(f"定时任务完成，{result.message}")
@@ -0,0 +1,18 @@
+"""
+加载改动前的 danmu_generator.py 作为性能对比基线
+
+基线文件从插件仓库导出，例如：
+    git show 88aca0e:plugins.v2/danmu/danmu_generator.py > /tmp/danmu_generator_baseline.py
+"""
+import importlib.util
+
+
+def load_baseline(path: str):
+    """
+    按文件路径加载基线模块，不影响当前插件模块
+    :param path: 基线 danmu_generator.py 路径
+    """
+    spec = importlib.util.spec_from_file_location("danmu_generator_baseline", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
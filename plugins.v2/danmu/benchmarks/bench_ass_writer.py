@@ -0,0 +1,80 @@
+"""
+弹幕ass生成性能对比：基线版本逐条解析写入（旧）与列式解析批量写入（新）
+
+基线文件的导出方式见 baseline.py，在 MoviePilot 根目录下运行：
+    python -m app.plugins.danmu.benchmarks.bench_ass_writer <基线danmu_generator.py> [弹幕数量]
+"""
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from app.plugins.danmu.benchmarks.baseline import load_baseline
+from app.plugins.danmu.danmu_generator import DanmuConverter
+
+
+def make_comments(count: int, seed: int = 0, length: float = 1440) -> list:
+    """
+    生成随机弹幕，时间乱序，约三成来自B站
+    """
+    rng = random.Random(seed)
+    words = ["哈哈哈", "前方高能", "来了来了", "名场面", "泪目", "好耶", "awsl", "这也太强了吧", "2333", "第一"]
+    comments = []
+    for cid in range(count):
+        mode = rng.choice((1, 1, 1, 1, 1, 1, 4, 5))
+        source = "[BiliBili]abcdef12" if rng.random() < 0.3 else f"user{rng.randint(1, 99999)}"
+        text = "".join(rng.choice(words) for _ in range(rng.randint(1, 3)))
+        comments.append({
+            "cid": cid,
+            "p": f"{rng.uniform(0, length):.2f},{mode},{rng.randint(0, 0xFFFFFF)},{source}",
+            "m": text
+        })
+    return comments
+
+
+def run_old(baseline, comments: list, output_file: str, only_from_bili: bool):
+    comments = sorted(comments, key=lambda x: float(x['p'].split(',')[0]))
+    if only_from_bili:
+        comments = [comment for comment in comments if '[BiliBili]' in comment['p'].split(',')[3]]
+    baseline.DanmuConverter.convert_comments_to_ass(comments, output_file, 1920, 1080, 'Arial', 50.0, 0.8, 15.0)
+
+
+def run_new(baseline, comments: list, output_file: str, only_from_bili: bool):
+    columns = DanmuConverter.parse_comments(comments, only_from_bili)
+    DanmuConverter.convert_columns_to_ass(columns, output_file, 1920, 1080, 'Arial', 50.0, 0.8, 15.0)
+
+
+def dialogue_lines(file_path: str) -> list:
+    """
+    弹幕行去掉样式覆盖，基线的轨道分配与新版不同，只比较时间和文本
+    """
+    with open(file_path, 'r', encoding='utf-8-sig') as f:
+        return [re.sub(r'\{[^}]*\}', '', line) for line in f if line.startswith('Dialogue:')]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    baseline = load_baseline(sys.argv[1])
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    comments = make_comments(count)
+    with tempfile.TemporaryDirectory() as tmp:
+        for only_from_bili in (False, True):
+            results = {}
+            for name, func in (("old", run_old), ("new", run_new)):
+                output_file = os.path.join(tmp, f"{name}.ass")
+                start = time.perf_counter()
+                func(baseline, comments, output_file, only_from_bili)
+                elapsed = time.perf_counter() - start
+                results[name] = dialogue_lines(output_file)
+                print(f"{name:>3} only_from_bili={only_from_bili!s:<5} {elapsed:6.2f}s "
+                      f"{count / elapsed:>10,.0f} 条/秒  写入 {len(results[name])} 条")
+            # 新版文件头多一行元信息，只比较弹幕行
+            print(f"    弹幕时间和文本一致: {results['old'] == results['new']}")
+
+
+if __name__ == '__main__':
+    main()
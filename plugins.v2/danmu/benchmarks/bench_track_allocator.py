@@ -0,0 +1,59 @@
+"""
+弹幕轨道分配性能对比：基线版本线性查找（find_non_overlapping_track）与堆（TrackAllocator）
+
+基线文件的导出方式见 baseline.py，在 MoviePilot 根目录下运行：
+    python -m app.plugins.danmu.benchmarks.bench_track_allocator <基线danmu_generator.py> [弹幕数量]
+"""
+import random
+import sys
+import time
+
+from app.plugins.danmu.benchmarks.baseline import load_baseline
+from app.plugins.danmu.danmu_generator import TrackAllocator
+
+
+def make_events(count: int, seed: int = 0, length: float = 1440) -> list:
+    """
+    生成按时间排序的 (出现时间, 占用结束时间)，占用1-8秒
+    """
+    rng = random.Random(seed)
+    times = sorted(rng.uniform(0, length) for _ in range(count))
+    return [(t, t + rng.uniform(1, 8)) for t in times]
+
+
+def run_linear(baseline, events: list, max_tracks: int) -> list:
+    tracks = {}
+    result = []
+    for current_time, occupy_until in events:
+        track = baseline.DanmuConverter.find_non_overlapping_track(tracks, current_time, max_tracks)
+        tracks[track] = occupy_until
+        result.append(track)
+    return result
+
+
+def run_heap(baseline, events: list, max_tracks: int) -> list:
+    allocator = TrackAllocator(max_tracks)
+    return [allocator.allocate(current_time, occupy_until) for current_time, occupy_until in events]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    baseline = load_baseline(sys.argv[1])
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    events = make_events(count)
+    for max_tracks in (21, 200):
+        results = {}
+        for name, func in (("linear", run_linear), ("heap", run_heap)):
+            start = time.perf_counter()
+            results[name] = func(baseline, events, max_tracks)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>6} {max_tracks:>3} 轨道 {elapsed:6.2f}s {count / elapsed:>12,.0f} 条/秒")
+        # 基线在轨道全满时总是复用轨道1，之后的分配会与新版不同，只统计相同的条数
+        same = sum(a == b for a, b in zip(results['linear'], results['heap']))
+        print(f"       分配结果相同: {same}/{count}")
+
+
+if __name__ == '__main__':
+    main()
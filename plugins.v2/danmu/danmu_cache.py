@@ -0,0 +1,872 @@
+import os
+import gzip
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Tuple, Callable, Dict, List
+from app.log import logger
+from app.core.config import settings
+
+
+class CacheDB:
+    """
+    插件本地缓存数据库（SQLite），所有持久化索引共用一个连接
+    """
+    DB_NAME = 'danmu_cache.db'
+    SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS file_hash (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        inode INTEGER NOT NULL,
+        hash TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS media_probe (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS subtitle_extract (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        outputs TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS comment_cache (
+        episode_id TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        fetched_at REAL NOT NULL,
+        last_access REAL NOT NULL,
+        etag TEXT,
+        last_modified TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_comment_cache_access ON comment_cache (last_access);
+    CREATE TABLE IF NOT EXISTS danmu_manifest (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        episode_id TEXT,
+        comment_count INTEGER NOT NULL,
+        generated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS retry_task (
+        path TEXT PRIMARY KEY,
+        retry_count INTEGER NOT NULL,
+        last_attempt REAL NOT NULL,
+        next_attempt REAL NOT NULL,
+        last_danmu_count INTEGER NOT NULL DEFAULT 0,
+        release_date TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_retry_task_next ON retry_task (next_attempt);
+    CREATE TABLE IF NOT EXISTS scrape_job (
+        id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        incremental INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS scrape_job_done (
+        job_id TEXT NOT NULL,
+        path TEXT NOT NULL,
+        PRIMARY KEY (job_id, path)
+    );
+    '''
+    _lock = threading.RLock()
+    _conn: Optional[sqlite3.Connection] = None
+    _data_path: Optional[Path] = None
+
+    @classmethod
+    def set_data_path(cls, path) -> None:
+        """
+        设置缓存目录，切换目录时关闭旧连接
+        """
+        with cls._lock:
+            path = Path(path)
+            if cls._data_path == path:
+                return
+            cls.close()
+            cls._data_path = path
+
+    @classmethod
+    def data_path(cls) -> Path:
+        if cls._data_path is None:
+            cls._data_path = Path(settings.PLUGIN_DATA_PATH) / 'danmu'
+        cls._data_path.mkdir(parents=True, exist_ok=True)
+        return cls._data_path
+
+    @classmethod
+    def connection(cls) -> sqlite3.Connection:
+        with cls._lock:
+            if cls._conn is None:
+                db_file = cls.data_path() / cls.DB_NAME
+                cls._conn = sqlite3.connect(str(db_file), check_same_thread=False)
+                cls._conn.execute('PRAGMA journal_mode=WAL')
+                cls._conn.execute('PRAGMA synchronous=NORMAL')
+                cls._conn.executescript(cls.SCHEMA)
+                cls._conn.commit()
+            return cls._conn
+
+    @classmethod
+    def execute(cls, sql: str, params: tuple = ()) -> None:
+        with cls._lock:
+            conn = cls.connection()
+            conn.execute(sql, params)
+            conn.commit()
+
+    @classmethod
+    def executemany(cls, sql: str, seq_of_params) -> None:
+        with cls._lock:
+            conn = cls.connection()
+            conn.executemany(sql, seq_of_params)
+            conn.commit()
+
+    @classmethod
+    def query(cls, sql: str, params: tuple = ()) -> list:
+        with cls._lock:
+            return cls.connection().execute(sql, params).fetchall()
+
+    @classmethod
+    def close(cls) -> None:
+        with cls._lock:
+            if cls._conn is not None:
+                try:
+                    cls._conn.close()
+                except Exception as e:
+                    logger.warning(f"关闭缓存数据库失败: {e}")
+                cls._conn = None
+
+
+class HashIndex:
+    """
+    视频文件前16MB MD5索引，以 路径+大小+修改时间+inode 作为失效依据
+    """
+
+    @staticmethod
+    def _file_key(file_path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(file_path)
+            return st.st_size, st.st_mtime_ns, st.st_ino
+        except OSError:
+            return None
+
+    @classmethod
+    def get(cls, file_path: str) -> Optional[str]:
+        """
+        查询文件的缓存hash，文件发生变化时返回None
+        """
+        key = cls._file_key(file_path)
+        if key is None:
+            return None
+        try:
+            rows = CacheDB.query('SELECT size, mtime_ns, inode, hash FROM file_hash WHERE path = ?', (file_path,))
+        except Exception as e:
+            logger.warning(f"读取hash索引失败: {e}")
+            return None
+        if rows and tuple(rows[0][:3]) == key:
+            return rows[0][3]
+        return None
+
+    @classmethod
+    def put(cls, file_path: str, file_hash: str) -> None:
+        key = cls._file_key(file_path)
+        if key is None or not file_hash:
+            return
+        try:
+            CacheDB.execute(
+                'INSERT OR REPLACE INTO file_hash (path, size, mtime_ns, inode, hash, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (file_path, *key, file_hash, time.time())
+            )
+        except Exception as e:
+            logger.warning(f"写入hash索引失败: {e}")
+
+    @classmethod
+    def get_or_compute(cls, file_path: str, compute: Callable[[str], str]) -> str:
+        """
+        优先使用索引中的hash，未命中或文件已变化时重新计算并写回
+        """
+        file_hash = cls.get(file_path)
+        if file_hash:
+            return file_hash
+        file_hash = compute(file_path)
+        if file_hash:
+            cls.put(file_path, file_hash)
+        return file_hash
+
+    @classmethod
+    def invalidate(cls, file_path: str) -> None:
+        try:
+            CacheDB.execute('DELETE FROM file_hash WHERE path = ?', (file_path,))
+        except Exception as e:
+            logger.warning(f"删除hash索引失败: {e}")
+
+    @classmethod
+    def prune(cls) -> int:
+        """
+        清理已不存在文件的索引记录
+        :return: 清理数量
+        """
+        try:
+            paths = [row[0] for row in CacheDB.query('SELECT path FROM file_hash')]
+            missing = [(path,) for path in paths if not os.path.exists(path)]
+            if missing:
+                CacheDB.executemany('DELETE FROM file_hash WHERE path = ?', missing)
+            return len(missing)
+        except Exception as e:
+            logger.warning(f"清理hash索引失败: {e}")
+            return 0
+
+
+class ProbeCache:
+    """
+    ffprobe结果缓存，以 路径+大小+修改时间 作为失效依据
+    """
+
+    @staticmethod
+    def _file_key(file_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(file_path)
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    @classmethod
+    def get(cls, file_path: str) -> Optional[dict]:
+        key = cls._file_key(file_path)
+        if key is None:
+            return None
+        try:
+            rows = CacheDB.query('SELECT size, mtime_ns, data FROM media_probe WHERE path = ?', (file_path,))
+            if rows and tuple(rows[0][:2]) == key:
+                return json.loads(rows[0][2])
+        except Exception as e:
+            logger.warning(f"读取媒体信息缓存失败: {e}")
+        return None
+
+    @classmethod
+    def put(cls, file_path: str, data: dict) -> None:
+        key = cls._file_key(file_path)
+        if key is None or not data:
+            return
+        try:
+            CacheDB.execute(
+                'INSERT OR REPLACE INTO media_probe (path, size, mtime_ns, data, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (file_path, *key, json.dumps(data, ensure_ascii=False), time.time())
+            )
+        except Exception as e:
+            logger.warning(f"写入媒体信息缓存失败: {e}")
+
+
+class ExtractedSubtitleCache:
+    """
+    内嵌字幕提取记录：视频 路径+大小+修改时间 -> {字幕流序号: 输出文件}。
+    视频没有可提取的字幕流时记录为空，文件不变就不再重复尝试
+    """
+
+    @staticmethod
+    def _file_key(file_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(file_path)
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    @classmethod
+    def get(cls, file_path: str) -> Optional[Dict[int, str]]:
+        """
+        :return: 已提取的字幕，未记录或视频已变化时返回None
+        """
+        key = cls._file_key(file_path)
+        if key is None:
+            return None
+        try:
+            rows = CacheDB.query('SELECT size, mtime_ns, outputs FROM subtitle_extract WHERE path = ?', (file_path,))
+            if rows and tuple(rows[0][:2]) == key:
+                return {int(index): output for index, output in json.loads(rows[0][2]).items()}
+        except Exception as e:
+            logger.warning(f"读取字幕提取记录失败: {e}")
+        return None
+
+    @classmethod
+    def put(cls, file_path: str, outputs: Dict[int, str]) -> None:
+        key = cls._file_key(file_path)
+        if key is None:
+            return
+        try:
+            CacheDB.execute(
+                'INSERT OR REPLACE INTO subtitle_extract (path, size, mtime_ns, outputs, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (file_path, *key, json.dumps(outputs, ensure_ascii=False), time.time())
+            )
+        except Exception as e:
+            logger.warning(f"写入字幕提取记录失败: {e}")
+
+
+class CommentCache:
+    """
+    弹幕数据本地缓存，gzip压缩存储，按最近访问时间淘汰
+    """
+    # 默认缓存时间（分钟）
+    DEFAULT_TTL = 7 * 24 * 60
+    # 缓存总大小上限
+    MAX_SIZE = 512 * 1024 * 1024
+
+    # 当前缓存总大小，首次写入时从数据库统计，之后按写入累加
+    _total_size: Optional[int] = None
+    _total_path: Optional[Path] = None
+    _size_lock = threading.Lock()
+
+    @staticmethod
+    def _cache_dir() -> Path:
+        path = CacheDB.data_path() / 'comments'
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @classmethod
+    def _cache_file(cls, episode_id: str) -> Path:
+        return cls._cache_dir() / f"{episode_id}.json.gz"
+
+    @classmethod
+    def get(cls, episode_id: str) -> Optional[Tuple[Dict, Dict]]:
+        """
+        读取缓存
+        :param episode_id: 弹幕ID
+        :return: (弹幕数据, 元信息)，元信息包含 fetched_at/etag/last_modified
+        """
+        try:
+            rows = CacheDB.query(
+                'SELECT fetched_at, etag, last_modified FROM comment_cache WHERE episode_id = ?', (episode_id,)
+            )
+            if not rows:
+                return None
+            cache_file = cls._cache_file(episode_id)
+            if not cache_file.exists():
+                CacheDB.execute('DELETE FROM comment_cache WHERE episode_id = ?', (episode_id,))
+                return None
+            with gzip.open(cache_file, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+            CacheDB.execute('UPDATE comment_cache SET last_access = ? WHERE episode_id = ?', (time.time(), episode_id))
+            fetched_at, etag, last_modified = rows[0]
+            return data, {"fetched_at": fetched_at, "etag": etag, "last_modified": last_modified}
+        except Exception as e:
+            logger.warning(f"读取弹幕缓存失败: {e}")
+            return None
+
+    @classmethod
+    def is_fresh(cls, meta: Dict, ttl: Optional[int] = None) -> bool:
+        """
+        :param meta: get返回的元信息
+        :param ttl: 缓存时间（分钟），为空时使用默认值
+        """
+        ttl = cls.DEFAULT_TTL if ttl is None else ttl
+        return time.time() - meta.get("fetched_at", 0) < ttl * 60
+
+    @classmethod
+    def put(cls, episode_id: str, data: Dict, etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        try:
+            cache_file = cls._cache_file(episode_id)
+            tmp_file = cache_file.with_name(f"{cache_file.name}.{threading.get_ident()}.tmp")
+            with gzip.open(tmp_file, 'wt', encoding='utf-8', compresslevel=6) as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, cache_file)
+            now = time.time()
+            size = cache_file.stat().st_size
+            old = CacheDB.query('SELECT size FROM comment_cache WHERE episode_id = ?', (episode_id,))
+            CacheDB.execute(
+                'INSERT OR REPLACE INTO comment_cache (episode_id, size, fetched_at, last_access, etag, last_modified) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (episode_id, size, now, now, etag, last_modified)
+            )
+            # 只有累计大小超出上限时才扫描全表淘汰
+            if cls._add_size(size - (old[0][0] if old else 0)) > cls.MAX_SIZE:
+                cls.evict()
+        except Exception as e:
+            logger.warning(f"写入弹幕缓存失败: {e}")
+
+    @classmethod
+    def touch(cls, episode_id: str) -> None:
+        """
+        服务端确认数据未变化时刷新缓存时间
+        """
+        try:
+            now = time.time()
+            CacheDB.execute('UPDATE comment_cache SET fetched_at = ?, last_access = ? WHERE episode_id = ?',
+                            (now, now, episode_id))
+        except Exception as e:
+            logger.warning(f"刷新弹幕缓存失败: {e}")
+
+    @classmethod
+    def _add_size(cls, delta: int) -> int:
+        """
+        累加缓存总大小
+        :return: 累加后的总大小
+        """
+        with cls._size_lock:
+            data_path = CacheDB.data_path()
+            if cls._total_size is None or cls._total_path != data_path:
+                rows = CacheDB.query('SELECT COALESCE(SUM(size), 0) FROM comment_cache')
+                cls._total_size = rows[0][0]
+                cls._total_path = data_path
+            else:
+                cls._total_size += delta
+            return cls._total_size
+
+    @classmethod
+    def evict(cls, max_size: Optional[int] = None) -> int:
+        """
+        超出大小上限时按最近访问时间淘汰
+        :return: 淘汰数量
+        """
+        max_size = cls.MAX_SIZE if max_size is None else max_size
+        rows = CacheDB.query('SELECT episode_id, size FROM comment_cache ORDER BY last_access DESC')
+        total = 0
+        kept = 0
+        expired = []
+        for episode_id, size in rows:
+            total += size
+            if total > max_size:
+                expired.append(episode_id)
+            else:
+                kept = total
+        for episode_id in expired:
+            try:
+                cls._cache_file(episode_id).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"删除弹幕缓存文件失败: {e}")
+        if expired:
+            CacheDB.executemany('DELETE FROM comment_cache WHERE episode_id = ?', [(i,) for i in expired])
+            logger.info(f"弹幕缓存超出上限，淘汰 {len(expired)} 条")
+        with cls._size_lock:
+            cls._total_size = kept
+            cls._total_path = CacheDB.data_path()
+        return len(expired)
+
+
+class DanmuManifest:
+    """
+    弹幕生成记录，用于增量刮削时跳过未变化且未过期的文件
+    """
+
+    @staticmethod
+    def _file_key(file_path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(file_path)
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    @classmethod
+    def record(cls, file_path: str, comment_count: int, episode_id: Optional[str] = None) -> None:
+        """
+        记录一次成功的弹幕生成
+        :param file_path: 视频文件路径
+        :param comment_count: 弹幕数量
+        :param episode_id: 弹幕ID
+        """
+        key = cls._file_key(file_path)
+        if key is None:
+            return
+        try:
+            if episode_id is None:
+                rows = CacheDB.query('SELECT episode_id FROM danmu_manifest WHERE path = ?', (file_path,))
+                episode_id = rows[0][0] if rows else None
+            CacheDB.execute(
+                'INSERT OR REPLACE INTO danmu_manifest (path, size, mtime_ns, episode_id, comment_count, generated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (file_path, *key, episode_id, comment_count, time.time())
+            )
+        except Exception as e:
+            logger.warning(f"写入弹幕生成记录失败: {e}")
+
+    @classmethod
+    def get(cls, file_path: str) -> Optional[Dict]:
+        try:
+            rows = CacheDB.query(
+                'SELECT size, mtime_ns, episode_id, comment_count, generated_at FROM danmu_manifest WHERE path = ?',
+                (file_path,)
+            )
+        except Exception as e:
+            logger.warning(f"读取弹幕生成记录失败: {e}")
+            return None
+        if not rows:
+            return None
+        size, mtime_ns, episode_id, comment_count, generated_at = rows[0]
+        return {"size": size, "mtime_ns": mtime_ns, "episode_id": episode_id,
+                "comment_count": comment_count, "generated_at": generated_at}
+
+    @classmethod
+    def is_fresh(cls, file_path: str, ttl_hours: float) -> bool:
+        """
+        文件未变化、弹幕文件仍存在且生成时间在有效期内
+        :param file_path: 视频文件路径
+        :param ttl_hours: 有效期（小时）
+        """
+        entry = cls.get(file_path)
+        if not entry:
+            return False
+        if (entry["size"], entry["mtime_ns"]) != cls._file_key(file_path):
+            return False
+        if not os.path.exists(os.path.splitext(file_path)[0] + '.danmu.ass'):
+            return False
+        return time.time() - entry["generated_at"] < ttl_hours * 3600
+
+    @classmethod
+    def remove(cls, file_path: str) -> None:
+        try:
+            CacheDB.execute('DELETE FROM danmu_manifest WHERE path = ?', (file_path,))
+        except Exception as e:
+            logger.warning(f"删除弹幕生成记录失败: {e}")
+
+
+class RetryQueue:
+    """
+    弹幕重试任务队列，按下次重试时间建立索引。
+    写操作立即提交；提交失败的写操作保留在内存缓冲区，下次读写时重新提交，读操作优先读取缓冲区
+    """
+    # 按上映天数划分的基础重试间隔 (上映天数上限, 间隔秒数)，刚播出的剧集弹幕增长最快
+    AGE_DELAYS = ((3, 3600), (14, 3 * 3600), (90, 12 * 3600))
+    DEFAULT_DELAY = 24 * 3600  # 上映较久或日期未知时的基础间隔（秒）
+    MAX_DELAY = 7 * 24 * 3600  # 最大重试间隔（秒）
+
+    _lock = threading.RLock()
+    # 待提交的写操作 {路径: 任务，None表示删除}
+    _pending: Dict[str, Optional[Dict]] = {}
+
+    @classmethod
+    def base_delay(cls, release_date: Optional[str], now: Optional[float] = None) -> float:
+        """
+        按上映日期获取基础重试间隔（秒）
+        """
+        try:
+            released = datetime.strptime(release_date, '%Y-%m-%d').timestamp()
+        except (TypeError, ValueError):
+            return cls.DEFAULT_DELAY
+        age_days = ((now or time.time()) - released) / 86400
+        for max_age, delay in cls.AGE_DELAYS:
+            if age_days <= max_age:
+                return delay
+        return cls.DEFAULT_DELAY
+
+    @classmethod
+    def next_delay(cls, retry_count: int, release_date: Optional[str] = None,
+                   previous_count: Optional[int] = None, danmu_count: int = 0) -> float:
+        """
+        计算下次重试的等待时间（秒）。
+        基础间隔由上映日期决定；上次重试后弹幕数量有增长时保持基础间隔，否则按重试次数指数退避
+        :param retry_count: 当前重试次数
+        :param release_date: 上映日期
+        :param previous_count: 上次重试时的弹幕数量，新任务为空
+        :param danmu_count: 本次弹幕数量
+        """
+        delay = cls.base_delay(release_date)
+        if previous_count is None or danmu_count > previous_count:
+            return min(delay, cls.MAX_DELAY)
+        return min(delay * 2 ** max(0, retry_count - 1), cls.MAX_DELAY)
+
+    COLUMNS = 'path, retry_count, last_attempt, next_attempt, last_danmu_count, release_date'
+    # 最近上映的优先，没有上映日期的排在最后
+    PRIORITY_ORDER = 'release_date IS NULL, release_date DESC, next_attempt'
+
+    @staticmethod
+    def _row_to_task(row: tuple) -> Dict:
+        path, retry_count, last_attempt, next_attempt, last_danmu_count, release_date = row
+        return {"file_path": path, "retry_count": retry_count, "last_attempt": last_attempt,
+                "next_attempt": next_attempt, "last_danmu_count": last_danmu_count,
+                "release_date": release_date}
+
+    @classmethod
+    def _write(cls, file_path: str, task: Optional[Dict]) -> None:
+        with cls._lock:
+            cls._pending[file_path] = task
+            cls.flush()
+
+    @classmethod
+    def flush(cls) -> None:
+        """
+        提交缓冲区中的写操作
+        """
+        with cls._lock:
+            if not cls._pending:
+                return
+            pending, cls._pending = cls._pending, {}
+            try:
+                with CacheDB._lock:
+                    conn = CacheDB.connection()
+                    conn.executemany('DELETE FROM retry_task WHERE path = ?',
+                                     [(path,) for path, task in pending.items() if task is None])
+                    conn.executemany(
+                        f'INSERT OR REPLACE INTO retry_task ({cls.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)',
+                        [(path, task["retry_count"], task["last_attempt"], task["next_attempt"],
+                          task["last_danmu_count"], task["release_date"])
+                         for path, task in pending.items() if task is not None]
+                    )
+                    conn.commit()
+            except Exception as e:
+                logger.error(f"保存重试任务失败: {e}")
+                # 提交失败时放回缓冲区，保留期间的新写操作
+                for path, task in pending.items():
+                    cls._pending.setdefault(path, task)
+
+    @classmethod
+    def get(cls, file_path: str) -> Optional[Dict]:
+        with cls._lock:
+            if file_path in cls._pending:
+                task = cls._pending[file_path]
+                return dict(task) if task else None
+            rows = CacheDB.query(f'SELECT {cls.COLUMNS} FROM retry_task WHERE path = ?', (file_path,))
+            return cls._row_to_task(rows[0]) if rows else None
+
+    @classmethod
+    def contains(cls, file_path: str) -> bool:
+        return cls.get(file_path) is not None
+
+    @classmethod
+    def put(cls, file_path: str, retry_count: int, last_danmu_count: int = 0,
+            last_attempt: Optional[float] = None, release_date: Optional[str] = None,
+            delay: Optional[float] = None) -> Dict:
+        """
+        写入重试任务
+        :param delay: 距下次重试的秒数，为空时按上映日期和重试次数计算
+        """
+        last_attempt = last_attempt or time.time()
+        if delay is None:
+            delay = cls.next_delay(retry_count, release_date)
+        task = {"file_path": file_path, "retry_count": retry_count, "last_attempt": last_attempt,
+                "next_attempt": last_attempt + delay, "last_danmu_count": last_danmu_count,
+                "release_date": release_date}
+        cls._write(file_path, task)
+        return task
+
+    @classmethod
+    def record_failure(cls, file_path: str, danmu_count: Optional[int], max_retry_times: int,
+                       release_date: Optional[str] = None) -> Optional[Dict]:
+        """
+        记录一次弹幕不足，新任务从第1次开始，已有任务重试次数加1。
+        弹幕数量为空表示本次未能从服务端获取弹幕，无法判断是否增长：
+        已有任务不计重试次数，按基础间隔重新安排
+        :param file_path: 视频文件路径
+        :param danmu_count: 本次弹幕数量，获取失败时为空
+        :param max_retry_times: 最大重试次数，达到后移除任务
+        :param release_date: 上映日期，用于重试排序
+        :return: 更新后的任务，已移除时返回None
+        """
+        with cls._lock:
+            task = cls.get(file_path)
+            if danmu_count is None:
+                if task:
+                    release_date = release_date or task["release_date"]
+                    return cls.put(file_path, task["retry_count"], task["last_danmu_count"],
+                                   release_date=release_date,
+                                   delay=min(cls.base_delay(release_date), cls.MAX_DELAY))
+                danmu_count = 0
+            retry_count = task["retry_count"] + 1 if task else 1
+            if retry_count >= max_retry_times:
+                cls.remove(file_path)
+                return None
+            release_date = release_date or (task["release_date"] if task else None)
+            delay = cls.next_delay(retry_count, release_date,
+                                   task["last_danmu_count"] if task else None, danmu_count)
+            return cls.put(file_path, retry_count, danmu_count, release_date=release_date, delay=delay)
+
+    @classmethod
+    def remove(cls, file_path: str) -> bool:
+        with cls._lock:
+            if not cls.contains(file_path):
+                return False
+            cls._write(file_path, None)
+            return True
+
+    @classmethod
+    def clear(cls) -> int:
+        with cls._lock:
+            cls.flush()
+            count = cls.count()
+            CacheDB.execute('DELETE FROM retry_task')
+            return count
+
+    @classmethod
+    def count(cls) -> int:
+        with cls._lock:
+            cls.flush()
+            return CacheDB.query('SELECT COUNT(*) FROM retry_task')[0][0]
+
+    @classmethod
+    def all(cls, by_priority: bool = False) -> List[Dict]:
+        """
+        获取全部任务
+        :param by_priority: 按上映日期从新到旧排序，否则按下次重试时间排序
+        """
+        order = cls.PRIORITY_ORDER if by_priority else 'next_attempt'
+        with cls._lock:
+            cls.flush()
+            rows = CacheDB.query(f'SELECT {cls.COLUMNS} FROM retry_task ORDER BY {order}')
+        return [cls._row_to_task(row) for row in rows]
+
+    @classmethod
+    def due(cls, now: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        获取已到重试时间的任务，最近上映的优先
+        """
+        with cls._lock:
+            cls.flush()
+            sql = f'SELECT {cls.COLUMNS} FROM retry_task WHERE next_attempt <= ? ORDER BY {cls.PRIORITY_ORDER}'
+            params = (now or time.time(),)
+            if limit:
+                sql += ' LIMIT ?'
+                params += (int(limit),)
+            rows = CacheDB.query(sql, params)
+        return [cls._row_to_task(row) for row in rows]
+
+    @classmethod
+    def import_tasks(cls, tasks: List[Dict]) -> int:
+        """
+        批量导入任务（用于从旧版配置迁移），已存在的任务不覆盖
+        """
+        rows = []
+        for task in tasks:
+            retry_count = int(task.get("retry_count", 1))
+            last_attempt = float(task.get("last_attempt", time.time()))
+            rows.append((task["file_path"], retry_count, last_attempt, last_attempt + cls.next_delay(retry_count, task.get("release_date")),
+                         int(task.get("last_danmu_count", 0)), task.get("release_date")))
+        with cls._lock:
+            cls.flush()
+            CacheDB.executemany(f'INSERT OR IGNORE INTO retry_task ({cls.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+
+class ScrapeJob:
+    """
+    全局刮削任务记录，已处理的文件分批写入检查点，重启后从检查点继续
+    """
+    RUNNING = 'running'
+    CANCELLED = 'cancelled'
+    FINISHED = 'finished'
+    # 任务异常退出，不再自动继续
+    FAILED = 'failed'
+    BATCH_SIZE = 50
+    KEEP_JOBS = 5  # 保留最近的任务记录数
+
+    _lock = threading.Lock()
+    # 待写入的检查点 [(任务ID, 路径)]
+    _pending: List[Tuple[str, str]] = []
+
+    @staticmethod
+    def _row_to_job(row: tuple) -> Dict:
+        job_id, status, incremental, created_at, updated_at = row
+        return {"id": job_id, "status": status, "incremental": bool(incremental),
+                "created_at": created_at, "updated_at": updated_at}
+
+    @classmethod
+    def create(cls, incremental: bool) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        CacheDB.execute('INSERT INTO scrape_job (id, status, incremental, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                        (job_id, cls.RUNNING, int(bool(incremental)), now, now))
+        cls._prune()
+        return job_id
+
+    @classmethod
+    def get(cls, job_id: str) -> Optional[Dict]:
+        rows = CacheDB.query('SELECT id, status, incremental, created_at, updated_at FROM scrape_job WHERE id = ?',
+                             (job_id,))
+        return cls._row_to_job(rows[0]) if rows else None
+
+    @classmethod
+    def unfinished(cls) -> Optional[Dict]:
+        """
+        最近一个未完成也未取消的任务
+        """
+        rows = CacheDB.query('SELECT id, status, incremental, created_at, updated_at FROM scrape_job '
+                             'WHERE status = ? ORDER BY created_at DESC LIMIT 1', (cls.RUNNING,))
+        return cls._row_to_job(rows[0]) if rows else None
+
+    @classmethod
+    def set_status(cls, job_id: str, status: str) -> None:
+        cls.flush()
+        CacheDB.execute('UPDATE scrape_job SET status = ?, updated_at = ? WHERE id = ?', (status, time.time(), job_id))
+
+    @classmethod
+    def mark_done(cls, job_id: str, file_path: str) -> None:
+        with cls._lock:
+            cls._pending.append((job_id, file_path))
+            if len(cls._pending) < cls.BATCH_SIZE:
+                return
+        cls.flush()
+
+    @classmethod
+    def flush(cls) -> None:
+        with cls._lock:
+            pending, cls._pending = cls._pending, []
+        if not pending:
+            return
+        try:
+            CacheDB.executemany('INSERT OR IGNORE INTO scrape_job_done (job_id, path) VALUES (?, ?)', pending)
+        except Exception as e:
+            logger.error(f"保存刮削检查点失败: {e}")
+
+    @classmethod
+    def done_count(cls, job_id: str) -> int:
+        cls.flush()
+        return CacheDB.query('SELECT COUNT(*) FROM scrape_job_done WHERE job_id = ?', (job_id,))[0][0]
+
+    @classmethod
+    def is_done(cls, job_id: str, file_path: str) -> bool:
+        return bool(CacheDB.query('SELECT 1 FROM scrape_job_done WHERE job_id = ? AND path = ?', (job_id, file_path)))
+
+    @classmethod
+    def _prune(cls) -> None:
+        rows = CacheDB.query('SELECT id FROM scrape_job ORDER BY created_at DESC LIMIT -1 OFFSET ?', (cls.KEEP_JOBS,))
+        if rows:
+            CacheDB.executemany('DELETE FROM scrape_job_done WHERE job_id = ?', rows)
+            CacheDB.executemany('DELETE FROM scrape_job WHERE id = ?', rows)
+
+
+class MemoCache:
+    """
+    进程内的带有效期缓存，用于在一次批量刮削中复用相同的查询结果
+    """
+
+    def __init__(self, ttl: float, max_size: int = 1024):
+        """
+        :param ttl: 有效期（秒）
+        :param max_size: 最多缓存条数，超出时清理过期和最早的条目
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data: Dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] < time.time():
+                del self._data[key]
+                return default
+            return item[1]
+
+    def put(self, key, value) -> None:
+        now = time.time()
+        with self._lock:
+            if len(self._data) >= self.max_size:
+                self._data = {k: v for k, v in self._data.items() if v[0] >= now}
+                # 字典按插入顺序保存，删除最早的一半
+                for k in list(self._data)[:max(0, len(self._data) - self.max_size // 2)]:
+                    del self._data[k]
+            self._data.pop(key, None)
+            self._data[key] = (now + self.ttl, value)
+
+    def remove(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
@@ -1,13 +1,31 @@
 import chardet
 import requests
+import io
 import os
+import codecs
 import re
 import hashlib
 import subprocess
 import json
-from typing import Optional, Dict, List, Tuple
+import threading
+import heapq
+import itertools
+import math
+import time
+from array import array
+from operator import itemgetter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Tuple, Iterable
+from urllib.parse import urlparse
 from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from app.log import logger
+from app.plugins.danmu.danmu_cache import HashIndex, ProbeCache, CommentCache, ExtractedSubtitleCache, MemoCache
+from app.plugins.danmu.metrics import ScrapeMetrics
+
+# 下载弹幕失败时的返回值
+FETCH_FAILED = "未获取到弹幕数据"
 
 @dataclass
 class VideoInfo:
@@ -17,12 +35,352 @@ class VideoInfo:
     video_duration: int
     match_mode: str = "hashAndFileName"
 
+@dataclass
+class DanmuTask:
+    """
+    单个文件的刮削任务，在流水线各阶段之间传递
+    """
+    file_path: str
+    tmdb_id: Optional[int] = None
+    episode: Optional[int] = None
+    release_date: Optional[str] = None
+    cache_ttl: Optional[int] = None
+    video_info: Optional[VideoInfo] = None
+    # 是否已通过批量匹配接口匹配过
+    matched: bool = False
+    # 是否为重试任务，重试任务必须取到服务端的最新弹幕
+    is_retry: bool = False
+    comment_id: Optional[str] = None
+    comments_data: Optional[Dict] = None
+    result: Optional[str] = None
+
+class MediaProbe:
+    """
+    媒体信息探测服务，每个文件只调用一次ffprobe，结果按 路径+大小+修改时间 缓存
+    """
+    SUB_LANGUAGES = ['zh', 'zho', 'chi', 'chs', 'cht', 'cn']
+
+    @staticmethod
+    def _run_ffprobe(file_path: str) -> Dict:
+        try:
+            result = subprocess.run(
+                ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', file_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                encoding='utf-8',
+                errors='ignore'
+            )
+            if result.returncode != 0:
+                logger.warning(f"ffprobe执行失败 - {file_path}: {result.stderr.strip()}")
+                return {}
+            return json.loads(result.stdout or '{}')
+        except Exception as e:
+            logger.error(f"获取视频流信息失败: {e}")
+            return {}
+
+    @staticmethod
+    def _parse(raw: Dict) -> Dict:
+        try:
+            duration = float(raw.get('format', {}).get('duration') or 0)
+        except (TypeError, ValueError):
+            duration = 0.0
+        streams = raw.get('streams', [])
+        languages = sorted({
+            stream.get('tags', {}).get('language', 'unknown')
+            for stream in streams if stream.get('codec_type') == 'subtitle'
+        })
+        return {
+            "duration": duration,
+            "streams": streams,
+            "format": raw.get('format', {}),
+            "subtitle_languages": languages
+        }
+
+    @classmethod
+    def probe(cls, file_path: str) -> Dict:
+        """
+        获取媒体信息
+        :param file_path: 视频文件路径
+        :return: {"duration", "streams", "format", "subtitle_languages"}，失败时返回空字典
+        """
+        info = ProbeCache.get(file_path)
+        if info is not None:
+            return info
+        raw = cls._run_ffprobe(file_path)
+        if not raw:
+            return {}
+        info = cls._parse(raw)
+        ProbeCache.put(file_path, info)
+        return info
+
+    @classmethod
+    def probe_many(cls, file_paths: Iterable[str], max_workers: int = 4) -> Dict[str, Dict]:
+        """
+        并发探测多个文件
+        :param file_paths: 视频文件路径
+        :param max_workers: 最大并发数
+        :return: {文件路径: 媒体信息}
+        """
+        file_paths = list(file_paths)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return dict(zip(file_paths, executor.map(cls.probe, file_paths)))
+
+    @classmethod
+    def get_duration(cls, file_path: str) -> Optional[float]:
+        duration = cls.probe(file_path).get('duration')
+        return duration or None
+
+@dataclass
+class DanmuColumns:
+    """
+    按列存储的弹幕数据，p字段只解析一次，已按时间排序
+    """
+    times: array
+    modes: array
+    colors: array
+    sources: List[str]
+    texts: List[str]
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def select(self, indices: List[int]) -> 'DanmuColumns':
+        """
+        按下标挑选弹幕，返回新的列式数据
+        """
+        return DanmuColumns(
+            times=array('d', (self.times[i] for i in indices)),
+            modes=array('b', (self.modes[i] for i in indices)),
+            colors=array('l', (self.colors[i] for i in indices)),
+            sources=[self.sources[i] for i in indices],
+            texts=[self.texts[i] for i in indices]
+        )
+
+@dataclass
+class ThinningOptions:
+    """
+    弹幕精简选项，默认全部关闭
+    :param dedup_window: 相同内容的弹幕在该时间窗口（秒）内只保留第一条，0为不去重
+    :param lane_rate: 平均每条轨道每秒最多弹幕数，滚动、顶部、底部弹幕分别计算，
+                      每秒最多保留 轨道数×lane_rate 条，0为不限制
+    :param drop_when_full: 轨道全部占用时丢弃弹幕而不是重叠显示
+    """
+    dedup_window: float = 0
+    lane_rate: float = 0
+    drop_when_full: bool = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.dedup_window > 0 or self.lane_rate > 0 or self.drop_when_full
+
+class RateLimiter:
+    """
+    按主机区分的令牌桶限速器，多线程共享
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        :param rate: 每个主机每秒允许的请求数，0为不限制
+        :param burst: 允许的突发请求数，默认与rate相同
+        """
+        self.rate = float(rate)
+        self.burst = max(1, int(burst if burst is not None else math.ceil(self.rate)))
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str) -> float:
+        """
+        获取一个令牌，令牌不足时阻塞等待
+        :return: 等待的秒数
+        """
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate) - 1
+            # 令牌可以为负，表示已预约的请求，等待到令牌补足为止
+            self._buckets[host] = [tokens, now]
+            wait = -tokens / self.rate if tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+class IdOverride:
+    """
+    目录级弹幕ID覆盖：目录下的 <番剧ID>.id 文件为整个目录指定弹幕，
+    命中时无需计算hash、探测时长和调用匹配接口。按目录修改时间缓存，每个目录只列一次
+    """
+    _lock = threading.Lock()
+    # {目录: (修改时间ns, 番剧ID)}
+    _cache: Dict[str, Tuple[int, Optional[int]]] = {}
+
+    @classmethod
+    def anime_id(cls, directory: str) -> Optional[int]:
+        """
+        获取目录指定的番剧ID
+        """
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        with cls._lock:
+            cached = cls._cache.get(directory)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        anime_id = None
+        try:
+            for file in sorted(os.listdir(directory)):
+                if not file.endswith('.id'):
+                    continue
+                try:
+                    anime_id = int(os.path.splitext(file)[0])
+                except ValueError:
+                    logger.warning(f"弹幕ID文件名无效 - {os.path.join(directory, file)}")
+                    continue
+                logger.info(f"找到弹幕ID文件 - {os.path.join(directory, file)}")
+                break
+        except OSError as e:
+            logger.warning(f"读取目录失败: {directory}, 错误: {e}")
+        with cls._lock:
+            cls._cache[directory] = (mtime_ns, anime_id)
+        return anime_id
+
+    @classmethod
+    def resolve(cls, file_path: str, episode) -> Optional[str]:
+        """
+        获取视频文件被覆盖的弹幕ID，没有覆盖或集数未知时返回None
+        :param file_path: 视频文件路径
+        :param episode: 集数
+        """
+        anime_id = cls.anime_id(os.path.dirname(file_path))
+        if anime_id is None:
+            return None
+        try:
+            return str(anime_id * 10000 + int(episode))
+        except (TypeError, ValueError):
+            logger.warning(f"集数未知，忽略弹幕ID文件 - {file_path}")
+            return None
+
 class DanmuAPI:
     BASE_URL = 'https://dandanapi.hankun.online/api/v1'
     HEADERS = {
         'Accept': 'application/json',
         "User-Agent": "Moviepilot/plugins 1.3.0"
     }
+    # (连接超时, 读取超时)
+    TIMEOUT = (5, 30)
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+    # 批量匹配每次请求的最大文件数
+    BATCH_MATCH_SIZE = 32
+    # 服务端返回不支持批量匹配后暂停尝试的秒数，可能只是反向代理等临时返回404，到期后重新尝试
+    BATCH_RETRY_AFTER = 3600
+    # 暂停批量匹配的截止时间（time.monotonic）
+    _batch_disabled_until = 0.0
+    # TMDB ID对应的剧集 {TMDB ID: {"exact": {集数: 弹幕ID}, "animes": {番剧ID: {集数: 弹幕ID}}}}
+    # exact 为服务端对该集的直接回答；animes 按番剧分别保存返回的剧集列表，不同番剧不合并
+    _tmdb_episodes = MemoCache(ttl=3600)
+
+    _session: Optional[requests.Session] = None
+    _session_lock = threading.Lock()
+    _pool_size = 10
+    # 每个主机每秒最多请求数
+    RATE_LIMIT = 5
+    _rate_limiter = RateLimiter(RATE_LIMIT)
+
+    @classmethod
+    def configure_session(cls, pool_size: int):
+        """
+        按并发数设置连接池大小，大小变化时重建会话
+        :param pool_size: 连接池大小，一般与刮削线程数一致
+        """
+        pool_size = max(1, int(pool_size))
+        with cls._session_lock:
+            if pool_size == cls._pool_size and cls._session is not None:
+                return
+            cls._pool_size = pool_size
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+
+    @classmethod
+    def configure_rate_limit(cls, rate: float):
+        """
+        设置每个主机每秒最多请求数，0为不限制
+        """
+        if float(rate) != cls._rate_limiter.rate:
+            cls._rate_limiter = RateLimiter(rate)
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """
+        获取共享的 keep-alive 会话
+        """
+        with cls._session_lock:
+            if cls._session is None:
+                retry = Retry(
+                    total=3,
+                    backoff_factor=0.5,
+                    status_forcelist=cls.RETRY_STATUS,
+                    allowed_methods=frozenset(['GET', 'POST']),
+                    respect_retry_after_header=True,
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=cls._pool_size,
+                                      max_retries=retry, pool_block=True)
+                session = requests.Session()
+                session.headers.update(cls.HEADERS)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                cls._session = session
+            return cls._session
+
+    @classmethod
+    def close_session(cls):
+        with cls._session_lock:
+            if cls._session is not None:
+                cls._session.close()
+                cls._session = None
+
+    @classmethod
+    def request(cls, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        通过共享会话发送请求，默认带超时、重试和按主机限速
+        """
+        kwargs.setdefault('timeout', cls.TIMEOUT)
+        host = urlparse(url).netloc
+        cls._rate_limiter.acquire(host)
+        try:
+            response = cls.get_session().request(method, url, **kwargs)
+        except Exception:
+            ScrapeMetrics.record_request(host, error=True)
+            raise
+        ScrapeMetrics.record_request(host, error=response.status_code >= 400)
+        return response
+
+    @classmethod
+    def get_connection_stats(cls) -> Dict[str, int]:
+        """
+        连接池统计：新建连接数、请求数以及复用次数
+        """
+        stats = {"opened": 0, "requests": 0, "reused": 0}
+        with cls._session_lock:
+            session = cls._session
+        if session is None:
+            return stats
+        for adapter in set(session.adapters.values()):
+            poolmanager = getattr(adapter, 'poolmanager', None)
+            if not poolmanager:
+                continue
+            for key in list(poolmanager.pools.keys()):
+                pool = poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                stats["opened"] += pool.num_connections
+                stats["requests"] += pool.num_requests
+        stats["reused"] = max(0, stats["requests"] - stats["opened"])
+        return stats
 
     @staticmethod
     def calculate_md5_of_first_16MB(file_path: str) -> str:
@@ -37,8 +395,46 @@ class DanmuAPI:
             logger.error(f"计算MD5失败: {e}")
             return ""
 
+    @staticmethod
+    def get_file_hash(file_path: str) -> str:
+        """
+        获取文件匹配hash，优先读取本地hash索引
+        :param file_path: 视频文件路径
+        :return: 前16MB的MD5
+        """
+        return HashIndex.get_or_compute(file_path, DanmuAPI.calculate_md5_of_first_16MB)
+
+    @staticmethod
+    def prewarm_hash_index(file_paths: Iterable[str], max_workers: int = 4) -> Dict[str, int]:
+        """
+        批量预热hash索引
+        :param file_paths: 视频文件路径
+        :param max_workers: 并发数
+        :return: 统计信息
+        """
+        stats = {"cached": 0, "computed": 0, "failed": 0}
+
+        def _warm(file_path: str) -> str:
+            if HashIndex.get(file_path):
+                return "cached"
+            file_hash = DanmuAPI.calculate_md5_of_first_16MB(file_path)
+            if not file_hash:
+                return "failed"
+            HashIndex.put(file_path, file_hash)
+            return "computed"
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for state in executor.map(_warm, file_paths):
+                stats[state] += 1
+        stats["pruned"] = HashIndex.prune()
+        return stats
+
     @staticmethod
     def get_video_duration(file_path: str) -> Optional[float]:
+        duration = MediaProbe.get_duration(file_path)
+        if duration:
+            return duration
+        # ffprobe不可用时回退到解析ffmpeg输出
         try:
             process = subprocess.Popen(
                 ['ffmpeg', '-i', file_path],
@@ -66,6 +462,25 @@ class DanmuAPI:
             logger.error(f"获取文件大小失败: {e}")
             return 0
 
+    @staticmethod
+    def _episode_key(episode) -> str:
+        try:
+            return str(int(episode))
+        except (TypeError, ValueError):
+            return str(episode)
+
+    @staticmethod
+    def _lookup_tmdb_episode(cached: Dict, episode_key: str) -> Optional[str]:
+        """
+        从缓存的剧集中查找弹幕ID。一个TMDB ID可能对应多部番剧（如分季），
+        只有各番剧列表给出的结果一致时才采用，否则交给服务端判断
+        """
+        if episode_key in cached["exact"]:
+            return cached["exact"][episode_key]
+        candidates = {episode_map[episode_key] for episode_map in cached["animes"].values()
+                      if episode_key in episode_map}
+        return candidates.pop() if len(candidates) == 1 else None
+
     @staticmethod
     def search_by_tmdb_id(tmdb_id: int, episode: Optional[int] = None) -> Optional[str]:
         """
@@ -83,7 +498,13 @@ class DanmuAPI:
                 data["episode"] = episode
             else:
                 data["episode"] = 1
-            response = requests.post(url, json=data, headers=DanmuAPI.HEADERS)
+            # 同一季的其他集已查询过时直接返回
+            episode_key = DanmuAPI._episode_key(data["episode"])
+            cached = DanmuAPI._tmdb_episodes.get(tmdb_id) or {"exact": {}, "animes": {}}
+            comment_id = DanmuAPI._lookup_tmdb_episode(cached, episode_key)
+            if comment_id:
+                return comment_id
+            response = DanmuAPI.request('POST', url, json=data)
             if response.status_code == 200:
                 result = response.json()
                 if result.get("success") and not result.get("hasMore"):
@@ -91,52 +512,148 @@ class DanmuAPI:
                     if animes and len(animes) > 0:
                         episodes = animes[0].get("episodes", [])
                         if episodes and len(episodes) > 0:
-                            return str(episodes[0].get("episodeId"))
+                            comment_id = str(episodes[0].get("episodeId"))
+                            cached = {"exact": {**cached["exact"], episode_key: comment_id},
+                                      "animes": dict(cached["animes"])}
+                            # 列表首项就是所查的集时，集数与本地一致，缓存这部番剧的整个剧集列表
+                            anime_id = animes[0].get("animeId")
+                            if anime_id is not None and \
+                                    DanmuAPI._episode_key(episodes[0].get("episodeNumber")) == episode_key:
+                                cached["animes"][anime_id] = {
+                                    DanmuAPI._episode_key(item["episodeNumber"]): str(item["episodeId"])
+                                    for item in episodes
+                                    if item.get("episodeNumber") is not None and item.get("episodeId") is not None
+                                }
+                            DanmuAPI._tmdb_episodes.put(tmdb_id, cached)
+                            return comment_id
             return None
         except Exception as e:
             logger.error(f"使用TMDB ID搜索弹幕失败: {e}")
             return None
 
     @staticmethod
-    def get_comment_id(file_path: str, use_tmdb_id: bool = False, tmdb_id: Optional[int] = None, episode: Optional[int] = None, cache_ttl: Optional[int] = None) -> Optional[str]:
+    def build_video_info(file_path: str) -> VideoInfo:
         """
-        获取弹幕ID
+        计算匹配所需的文件信息（hash、大小、时长）
         :param file_path: 视频文件路径
+        """
+        with ScrapeMetrics.timer("hash"):
+            file_hash = DanmuAPI.get_file_hash(file_path)
+        with ScrapeMetrics.timer("probe"):
+            video_duration = int(DanmuAPI.get_video_duration(file_path) or 0)
+        return VideoInfo(
+            file_name=os.path.basename(file_path),
+            file_hash=file_hash,
+            file_size=DanmuAPI.get_file_size(file_path),
+            video_duration=video_duration
+        )
+
+    @staticmethod
+    def _parse_match(result: Dict) -> Optional[str]:
+        """
+        从匹配结果中取出弹幕ID，兼容单文件和批量接口的返回格式
+        """
+        if result.get("matchResult"):
+            return str(result["matchResult"]["episodeId"])
+        if result.get("isMatched") and result.get("matches"):
+            return str(result["matches"][0]["episodeId"])
+        return None
+
+    @classmethod
+    def batch_available(cls) -> bool:
+        """
+        是否尝试批量匹配，服务端返回不支持后暂停 BATCH_RETRY_AFTER 秒
+        """
+        return time.monotonic() >= cls._batch_disabled_until
+
+    @classmethod
+    @ScrapeMetrics.timed("match")
+    def match_batch(cls, items: Dict[str, VideoInfo]) -> Dict[str, Optional[str]]:
+        """
+        批量匹配弹幕ID，每 BATCH_MATCH_SIZE 个文件一次请求。
+        服务端不支持或请求失败的文件不出现在结果中，由调用方逐个匹配
+        :param items: {视频文件路径: 文件信息}
+        :return: {视频文件路径: 弹幕ID}，未匹配的为None
+        """
+        matches = {}
+        paths = list(items)
+        for start in range(0, len(paths), cls.BATCH_MATCH_SIZE):
+            if not cls.batch_available():
+                break
+            chunk = paths[start:start + cls.BATCH_MATCH_SIZE]
+            try:
+                response = cls.request('POST', f"{cls.BASE_URL}/match/batch",
+                                       json={"requests": [items[path].__dict__ for path in chunk]})
+                if response.status_code in (404, 405, 501):
+                    logger.info(f"弹幕服务不支持批量匹配，{cls.BATCH_RETRY_AFTER} 秒内使用逐个匹配")
+                    cls._batch_disabled_until = time.monotonic() + cls.BATCH_RETRY_AFTER
+                    break
+                if response.status_code != 200:
+                    logger.warning(f"批量匹配失败，状态码: {response.status_code}")
+                    continue
+                results = response.json().get("results") or []
+                if len(results) != len(chunk):
+                    logger.warning(f"批量匹配结果数量不符: {len(results)}/{len(chunk)}")
+                    continue
+                for path, result in zip(chunk, results):
+                    matches[path] = cls._parse_match(result)
+            except Exception as e:
+                logger.error(f"批量匹配失败: {e}")
+        return matches
+
+    @classmethod
+    def match_group(cls, file_paths: List[str], max_workers: int = 4) -> Dict[str, Optional[str]]:
+        """
+        批量匹配同一季（目录）的视频文件，计算出的hash和时长会被缓存，后续逐个处理时无需重复读取
+        :param file_paths: 视频文件路径
+        :param max_workers: 计算文件信息的并发数
+        :return: {视频文件路径: 弹幕ID}，未匹配的为None，未能批量匹配的文件不出现在结果中
+        """
+        if not cls.batch_available() or len(file_paths) < 2:
+            return {}
+        items = {}
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            for file_path, video_info in zip(file_paths, executor.map(cls._try_build_video_info, file_paths)):
+                if video_info and video_info.file_hash:
+                    items[file_path] = video_info
+        return cls.match_batch(items) if items else {}
+
+    @staticmethod
+    def _try_build_video_info(file_path: str) -> Optional[VideoInfo]:
+        try:
+            return DanmuAPI.build_video_info(file_path)
+        except Exception as e:
+            logger.error(f"获取文件信息失败: {file_path}, 错误: {e}")
+            return None
+
+    @staticmethod
+    @ScrapeMetrics.timed("match")
+    def match_comment_id(file_path: str, video_info: Optional[VideoInfo], use_tmdb_id: bool = False,
+                         tmdb_id: Optional[int] = None, episode: Optional[int] = None) -> Optional[str]:
+        """
+        根据文件信息匹配弹幕ID
+        :param file_path: 视频文件路径
+        :param video_info: 文件信息，为空时表示已批量匹配过，只尝试TMDB ID
         :param use_tmdb_id: 是否使用TMDB ID
         :param tmdb_id: TMDB ID
         :param episode: 集数
         :return: 弹幕ID
         """
         try:
-            # 首先尝试使用文件名和文件大小匹配
-            file_name = os.path.basename(file_path)
-            file_size = DanmuAPI.get_file_size(file_path)
-            file_hash = DanmuAPI.calculate_md5_of_first_16MB(file_path)
-            
-            video_info = VideoInfo(
-                file_name=file_name,
-                file_hash=file_hash,
-                file_size=file_size,
-                video_duration=int(DanmuAPI.get_video_duration(file_path) or 0)
-            )
-            
-            # 检查当前目录下所有的 .id 文件
-            video_dir = os.path.dirname(file_path)
-            for file in os.listdir(video_dir):
-                if file.endswith('.id'):
-                    id_file = os.path.join(video_dir, file)
-                    logger.info(f"找到弹幕ID文件 - {id_file}")
-                    fileID = str(int(os.path.splitext(file)[0]) * 10000 + int(episode))
-                    return fileID
+            # 检查目录下的 .id 文件
+            comment_id = IdOverride.resolve(file_path, episode)
+            if comment_id:
+                return comment_id
             
             # 使用 match API
-            url = f"{DanmuAPI.BASE_URL}/match"
-            response = requests.post(url, json=video_info.__dict__, headers=DanmuAPI.HEADERS)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get("isMatched") and result.get("matches"):
-                    return str(result["matches"][0]["episodeId"])
+            if video_info is not None:
+                url = f"{DanmuAPI.BASE_URL}/match"
+                response = DanmuAPI.request('POST', url, json=video_info.__dict__)
+
+                if response.status_code == 200:
+                    comment_id = DanmuAPI._parse_match(response.json())
+                    if comment_id:
+                        return comment_id
             
             # 如果使用TMDB ID且提供了TMDB ID，尝试使用TMDB ID匹配
             if use_tmdb_id and tmdb_id is not None:
@@ -149,6 +666,27 @@ class DanmuAPI:
             logger.error(f"获取弹幕ID失败: {e}")
             return None
 
+    @staticmethod
+    def get_comment_id(file_path: str, use_tmdb_id: bool = False, tmdb_id: Optional[int] = None, episode: Optional[int] = None, cache_ttl: Optional[int] = None) -> Optional[str]:
+        """
+        获取弹幕ID
+        :param file_path: 视频文件路径
+        :param use_tmdb_id: 是否使用TMDB ID
+        :param tmdb_id: TMDB ID
+        :param episode: 集数
+        :return: 弹幕ID
+        """
+        # 目录指定了弹幕ID时跳过hash和时长探测
+        comment_id = IdOverride.resolve(file_path, episode)
+        if comment_id:
+            return comment_id
+        try:
+            video_info = DanmuAPI.build_video_info(file_path)
+        except Exception as e:
+            logger.error(f"获取弹幕ID失败: {e}")
+            return None
+        return DanmuAPI.match_comment_id(file_path, video_info, use_tmdb_id, tmdb_id, episode)
+
     @staticmethod
     def get_title_from_nfo(file_path: str) -> Optional[str]:
         nfo_file = os.path.splitext(file_path)[0] + '.nfo'
@@ -166,24 +704,135 @@ class DanmuAPI:
             return None
 
     @classmethod
-    def get_comments(cls, comment_id: str) -> Optional[Dict]:
+    @ScrapeMetrics.timed("fetch")
+    def get_comments(cls, comment_id: str, cache_ttl: Optional[int] = None,
+                     allow_stale: bool = True) -> Optional[Dict]:
         """
-        获取弹幕内容
+        获取弹幕内容，优先使用本地缓存
         :param comment_id: 弹幕ID
+        :param cache_ttl: 缓存时间（分钟），为空时使用默认缓存时间
+        :param allow_stale: 请求失败时是否使用过期缓存
         :return: 弹幕数据
         """
+        cached = CommentCache.get(comment_id)
+        if cached and CommentCache.is_fresh(cached[1], cache_ttl):
+            logger.info(f"使用本地弹幕缓存 - {comment_id}")
+            return cached[0]
         try:
             url = f"{cls.BASE_URL}/{comment_id}?from_id=0&with_related=true&ch_convert=0"
-            response = requests.get(url, headers=cls.HEADERS)
+            headers = {}
+            if cached:
+                # 缓存过期，带条件请求重新验证
+                if cached[1].get("etag"):
+                    headers["If-None-Match"] = cached[1]["etag"]
+                if cached[1].get("last_modified"):
+                    headers["If-Modified-Since"] = cached[1]["last_modified"]
+            response = cls.request('GET', url, headers=headers)
+            if response.status_code == 304 and cached:
+                CommentCache.touch(comment_id)
+                return cached[0]
             if response.status_code == 200:
-                return response.json()
+                data = response.json()
+                CommentCache.put(comment_id, data,
+                                 etag=response.headers.get("ETag"),
+                                 last_modified=response.headers.get("Last-Modified"))
+                return data
             logger.error(f"获取弹幕失败: {response.text}")
-            return None
         except Exception as e:
             logger.error(f"获取弹幕失败: {e}")
-            return None
+        if cached and allow_stale:
+            logger.warning(f"使用过期的弹幕缓存 - {comment_id}")
+            return cached[0]
+        return None
+
+class TrackAllocator:
+    """
+    弹幕轨道分配器，要求按时间顺序分配。
+    优先分配编号最小的空闲轨道；全部占用时选择最早空出的轨道，单次分配 O(log n)
+    """
+
+    def __init__(self, max_tracks: int):
+        self.max_tracks = max(1, int(max_tracks))
+        # 空闲轨道（小顶堆，按轨道编号）
+        self._free = list(range(1, self.max_tracks + 1))
+        # 占用中的轨道（小顶堆，按空出时间）
+        self._busy: List[Tuple[float, int]] = []
+
+    def _release(self, current_time: float):
+        busy = self._busy
+        while busy and busy[0][0] <= current_time:
+            heapq.heappush(self._free, heapq.heappop(busy)[1])
+
+    def has_free(self, current_time: float) -> bool:
+        """
+        当前时间是否还有空闲轨道
+        """
+        self._release(current_time)
+        return bool(self._free)
+
+    def allocate(self, current_time: float, occupy_until: float) -> int:
+        """
+        分配轨道
+        :param current_time: 弹幕出现时间
+        :param occupy_until: 轨道被占用到的时间
+        :return: 轨道编号（从1开始）
+        """
+        self._release(current_time)
+        if self._free:
+            track = heapq.heappop(self._free)
+        else:
+            # 轨道已满，复用最早空出的轨道
+            track = heapq.heappop(self._busy)[1]
+        heapq.heappush(self._busy, (occupy_until, track))
+        return track
 
 class DanmuConverter:
+    # 弹幕数量等元信息写在 [Script Info] 的注释行中，定长便于写完后回填
+    METADATA_PREFIX = '; Danmu Metadata: '
+    METADATA_WIDTH = 512
+
+    @classmethod
+    def _metadata_line(cls, metadata: Dict) -> bytes:
+        data = (cls.METADATA_PREFIX + json.dumps(metadata, ensure_ascii=False, separators=(',', ':'))).encode('utf-8')
+        if len(data) > cls.METADATA_WIDTH:
+            data = (cls.METADATA_PREFIX + json.dumps({"count": metadata.get("count", 0)})).encode('utf-8')
+        return data.ljust(cls.METADATA_WIDTH) + b'\n'
+
+    @classmethod
+    def read_metadata(cls, ass_file: str) -> Optional[Dict]:
+        """
+        读取弹幕文件头部的元信息，旧版本生成的文件返回None
+        :return: {"count": 总数, "sources": {来源: 数量}}
+        """
+        try:
+            with open(ass_file, 'rb') as f:
+                head = f.read(4096)
+        except OSError:
+            return None
+        prefix = cls.METADATA_PREFIX.encode('utf-8')
+        start = head.find(prefix)
+        if start == -1:
+            return None
+        end = head.find(b'\n', start)
+        if end == -1:
+            return None
+        try:
+            metadata = json.loads(head[start + len(prefix):end].decode('utf-8').strip())
+            return metadata if isinstance(metadata.get("count"), int) else None
+        except (ValueError, AttributeError):
+            return None
+
+    @staticmethod
+    def source_name(source: str) -> str:
+        """
+        弹幕来源，如 [BiliBili]xxxx 返回 BiliBili，弹弹play本站弹幕返回 DanDanPlay
+        """
+        if source.startswith('['):
+            end = source.find(']')
+            if end > 1:
+                return source[1:end]
+        return 'DanDanPlay'
+
     @staticmethod
     def convert_timestamp(timestamp: float) -> str:
         timestamp = round(timestamp * 100.0)
@@ -220,101 +869,324 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
         )
 
     @staticmethod
-    def find_non_overlapping_track(tracks: Dict[int, float], current_time: float, max_tracks: int) -> int:
-        possible_track = 1
-        last_time_remain = 100.0
-        for track in range(1, max_tracks + 1):
-            if track not in tracks or current_time >= tracks[track]:
-                return track
-            time_remain = float(tracks[track]) - current_time
-            if time_remain > last_time_remain:
-                possible_track = track
-        return possible_track
+    def parse_comments(comments: List[Dict], only_from_bili: bool = False) -> DanmuColumns:
+        """
+        将弹幕解析为列式数据并按时间排序
+        :param comments: 弹弹play返回的弹幕列表
+        :param only_from_bili: 是否只保留B站弹幕
+        """
+        rows = []
+        invalid = 0
+        for comment in comments:
+            text = comment.get('m')
+            p = comment.get('p', '').split(',')
+            if len(p) < 3 or not text:
+                invalid += 1
+                continue
+            source = p[3] if len(p) > 3 else ''
+            if only_from_bili and '[BiliBili]' not in source:
+                continue
+            try:
+                mode = int(p[1])
+                rows.append((float(p[0]), mode if -128 <= mode < 128 else 0, int(p[2]) & 0xFFFFFF, source, text))
+            except ValueError:
+                invalid += 1
+        if invalid:
+            logger.warning(f"跳过 {invalid} 条格式不正确的弹幕")
+
+        rows.sort(key=itemgetter(0))
+        times, modes, colors, sources, texts = zip(*rows) if rows else ((), (), (), (), ())
+        return DanmuColumns(
+            times=array('d', times),
+            modes=array('b', modes),
+            colors=array('l', colors),
+            sources=list(sources),
+            texts=list(texts)
+        )
+
+    @staticmethod
+    def _rank_bucket(indices: List[int], texts: List[str], limit: int) -> List[int]:
+        """
+        从同一秒同一类型的弹幕中按优先级保留limit条：
+        同一内容的第一条优先于重复的，其次内容越少见越优先，再次越长越优先
+        """
+        counts = {}
+        for index in indices:
+            key = texts[index].strip()
+            counts[key] = counts.get(key, 0) + 1
+        seen = {}
+        ranked = []
+        for index in indices:
+            key = texts[index].strip()
+            occurrence = seen.get(key, 0)
+            seen[key] = occurrence + 1
+            ranked.append((occurrence, counts[key], -len(key), index))
+        ranked.sort()
+        return [item[3] for item in ranked[:limit]]
 
     @classmethod
-    def convert_comments_to_ass(cls, comments: List[Dict], output_file: str, width: int, 
-                              height: int, fontface: str, fontsize: float, alpha: float, duration: float):
+    def thin_columns(cls, columns: DanmuColumns, options: ThinningOptions, max_tracks: int) -> Tuple[DanmuColumns, Dict[str, int]]:
+        """
+        去除时间窗口内的重复弹幕，并按轨道数限制每秒弹幕数量
+        :param columns: 已按时间排序的列式弹幕
+        :param options: 精简选项
+        :param max_tracks: 每类弹幕的轨道数量
+        :return: (精简后的弹幕, 丢弃统计)
+        """
+        stats = {"duplicate": 0, "rate_limited": 0}
+        if options.dedup_window <= 0 and options.lane_rate <= 0:
+            return columns, stats
+        # 滚动、顶部、底部弹幕各有max_tracks条轨道，分别限制
+        per_second = int(math.ceil(options.lane_rate * max_tracks)) if options.lane_rate > 0 else 0
+        texts = columns.texts
+        last_seen = {}
+        kept = []
+        # 当前这一秒内各类型的弹幕 {类型: [下标]}
+        second_bucket = None
+        buckets: Dict[int, List[int]] = {}
+
+        def _flush():
+            selected = []
+            for indices in buckets.values():
+                if len(indices) > per_second:
+                    stats["rate_limited"] += len(indices) - per_second
+                    indices = cls._rank_bucket(indices, texts, per_second)
+                selected.extend(indices)
+            kept.extend(sorted(selected))
+            buckets.clear()
+
+        for index, (timeline, mode, text) in enumerate(zip(columns.times, columns.modes, texts)):
+            if options.dedup_window > 0:
+                key = text.strip()
+                last_time = last_seen.get(key)
+                if last_time is not None and timeline - last_time < options.dedup_window:
+                    stats["duplicate"] += 1
+                    continue
+                last_seen[key] = timeline
+            if not per_second:
+                kept.append(index)
+                continue
+            second = int(timeline)
+            if second != second_bucket:
+                _flush()
+                second_bucket = second
+            buckets.setdefault(mode if mode in (4, 5) else 1, []).append(index)
+        if per_second:
+            _flush()
+        if len(kept) == len(columns):
+            return columns, stats
+        return columns.select(kept), stats
+
+    @staticmethod
+    def format_centiseconds(centiseconds: int) -> str:
+        hour, rest = divmod(centiseconds, 360000)
+        minute, rest = divmod(rest, 6000)
+        second, centsecond = divmod(rest, 100)
+        return f'{hour}:{minute:02d}:{second:02d}.{centsecond:02d}'
+
+    @classmethod
+    def convert_columns_to_ass(cls, columns: DanmuColumns, output_file: str, width: int, height: int,
+                               fontface: str, fontsize: float, alpha: float, duration: float,
+                               batch_size: int = 4096, drop_when_full: bool = False) -> Dict[str, int]:
+        """
+        将列式弹幕数据写入ass文件，按批拼接后写入
+        :param batch_size: 每批写入的行数
+        :param drop_when_full: 轨道全部占用时丢弃弹幕
+        :return: {"written": 写入数量, "saturated": 因轨道占满丢弃的数量}
+        """
         styleid = 'Danmu'
         max_tracks = int(height) // int(fontsize)
-        scrolling_tracks = {}
-        top_tracks = {}
-        bottom_tracks = {}
-
-        logger.info(f"{output_file} - 共匹配到{len(comments)}条弹幕。")
-        
-        with open(output_file, 'w', encoding='utf-8-sig') as f:
-            cls.write_ass_head(f, width, height, fontface, fontsize, alpha, styleid)
-            
-            for comment in comments:
-                try:
-                    p = comment.get('p', '').split(',')
-                    if len(p) < 3:
-                        logger.warning(f"弹幕数据格式不正确: {comment}")
-                        continue
-                    
-                    timeline = float(p[0])
-                    pos = int(p[1])
-                    color = int(p[2])
-                    text = comment.get('m', '')
-                    user = str(p[3])
-                    
-                    if not text:
+        scrolling_tracks = TrackAllocator(max_tracks)
+        top_tracks = TrackAllocator(max_tracks)
+        bottom_tracks = TrackAllocator(max_tracks)
+        format_cs = cls.format_centiseconds
+        # 相同时间戳的字符串只格式化一次
+        timestamps = {}
+        gap = 1
+        center_x = width / 2
+        stats = {"written": 0, "saturated": 0}
+
+        logger.info(f"{output_file} - 共匹配到{len(columns)}条弹幕。")
+
+        head = io.StringIO()
+        cls.write_ass_head(head, width, height, fontface, fontsize, alpha, styleid)
+        first_line, rest = head.getvalue().split('\n', 1)
+        source_counts = {}
+        source_name = cls.source_name
+
+        with open(output_file, 'wb', buffering=1024 * 1024) as f:
+            f.write(codecs.BOM_UTF8 + (first_line + '\n').encode('utf-8'))
+            metadata_offset = f.tell()
+            f.write(cls._metadata_line({"count": 0}))
+            f.write(rest.encode('utf-8'))
+            buffer = []
+            for timeline, pos, color, source, text in zip(columns.times, columns.modes, columns.colors,
+                                                          columns.sources, columns.texts):
+                if drop_when_full:
+                    tracks = scrolling_tracks if pos == 1 else bottom_tracks if pos == 4 else top_tracks if pos == 5 else None
+                    if tracks is not None and not tracks.has_free(timeline):
+                        stats["saturated"] += 1
                         continue
-                        
-                    start_time = cls.convert_timestamp(timeline)
-                    end_time = cls.convert_timestamp(timeline + duration)
-                    
-                    gap = 1
+                start_cs = round(timeline * 100.0)
+                end_cs = round((timeline + duration) * 100.0)
+                start_time = timestamps.get(start_cs)
+                if start_time is None:
+                    start_time = timestamps[start_cs] = format_cs(start_cs)
+                end_time = timestamps.get(end_cs)
+                if end_time is None:
+                    end_time = timestamps[end_cs] = format_cs(end_cs)
+
+                if pos == 1:  # 滚动弹幕
                     text_width = len(text) * fontsize * 0.6
-                    velocity = (width + text_width) / duration
-                    leave_time = text_width / velocity + gap
-
-                    color_hex = f'&H{color & 0xFFFFFF:06X}'
-                    styles = ''
-                    
-                    if pos == 1:  # 滚动弹幕
-                        track_id = cls.find_non_overlapping_track(scrolling_tracks, timeline, max_tracks)
-                        scrolling_tracks[track_id] = timeline + leave_time
-                        initial_y = (track_id - 1) * fontsize + 10
-                        styles = f'\\move({width}, {initial_y}, {-len(text)*fontsize}, {initial_y})'
-                    elif pos == 4:  # 底部弹幕
-                        track_id = cls.find_non_overlapping_track(bottom_tracks, timeline, max_tracks)
-                        bottom_tracks[track_id] = timeline + duration
-                        styles = f'\\an2\\pos({width/2}, {height - 50 - (track_id - 1) * fontsize})'
-                    elif pos == 5:  # 顶部弹幕
-                        track_id = cls.find_non_overlapping_track(top_tracks, timeline, max_tracks)
-                        top_tracks[track_id] = timeline + duration
-                        styles = f'\\an8\\pos({width/2}, {50 + (track_id - 1) * fontsize})'
-                    else:
-                        styles = f'\\move(0, 0, {width}, 0)'
-
-                    f.write(f'Dialogue: 0,{start_time},{end_time},{styleid},,0,0,0,,{{\\c{color_hex}{styles}}}{text}\n')
-                except Exception as e:
-                    logger.error(f"处理弹幕数据失败: {e}, 弹幕数据: {comment}")
-                    continue
-            
+                    leave_time = text_width * duration / (width + text_width) + gap
+                    track_id = scrolling_tracks.allocate(timeline, timeline + leave_time)
+                    initial_y = (track_id - 1) * fontsize + 10
+                    styles = f'\\move({width}, {initial_y}, {-len(text)*fontsize}, {initial_y})'
+                elif pos == 4:  # 底部弹幕
+                    track_id = bottom_tracks.allocate(timeline, timeline + duration)
+                    styles = f'\\an2\\pos({center_x}, {height - 50 - (track_id - 1) * fontsize})'
+                elif pos == 5:  # 顶部弹幕
+                    track_id = top_tracks.allocate(timeline, timeline + duration)
+                    styles = f'\\an8\\pos({center_x}, {50 + (track_id - 1) * fontsize})'
+                else:
+                    styles = f'\\move(0, 0, {width}, 0)'
+
+                buffer.append(f'Dialogue: 0,{start_time},{end_time},{styleid},,0,0,0,,{{\\c&H{color:06X}{styles}}}{text}\n')
+                stats["written"] += 1
+                name = source_name(source)
+                source_counts[name] = source_counts.get(name, 0) + 1
+                if len(buffer) >= batch_size:
+                    f.write(''.join(buffer).encode('utf-8'))
+                    buffer.clear()
+            if buffer:
+                f.write(''.join(buffer).encode('utf-8'))
+            # 回填弹幕数量
+            f.seek(metadata_offset)
+            f.write(cls._metadata_line({"count": stats["written"], "sources": source_counts}))
+
             logger.info('弹幕生成成功 - ' + output_file)
+        return stats
+
+class SubtitleIndex:
+    """
+    按目录缓存的字幕文件索引。同一季的所有剧集共用一次目录遍历，
+    再次查询时只检查各子目录的修改时间，有变化才重新遍历
+    """
+    SUB_EXTS = ('.srt', '.ass', '.ssa')
+    # 语言标签优先级：简体 > 繁体 > 其他中文标签，未标注语言的排在中文之后、其他语言之前
+    LANGUAGE_RANK = ('chs', 'sc', 'zh-hans', 'zh-cn', 'gb', 'cht', 'tc', 'zh-hant', 'zh-tw', 'big5',
+                     'zh', 'zho', 'chi', 'cn')
+
+    # {目录: ({目录: 修改时间ns}, [(文件名, 路径)])}，只保留最近使用的几百个目录
+    _cache = MemoCache(ttl=86400, max_size=256)
+
+    @classmethod
+    def _scan(cls, directory: str) -> Tuple[Dict[str, int], List[Tuple[str, str]]]:
+        mtimes = {}
+        subtitles = []
+        for root, _, files in os.walk(directory):
+            try:
+                mtimes[root] = os.stat(root).st_mtime_ns
+            except OSError:
+                continue
+            for file in files:
+                # 排除弹幕文件和合并生成的 .withDanmu.ass
+                if file.lower().endswith(cls.SUB_EXTS) and 'danmu' not in file.lower():
+                    subtitles.append((file, os.path.join(root, file)))
+        return mtimes, subtitles
+
+    @staticmethod
+    def _is_fresh(mtimes: Dict[str, int]) -> bool:
+        for path, mtime_ns in mtimes.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    @classmethod
+    def subtitles(cls, directory: str) -> List[Tuple[str, str]]:
+        """
+        获取目录（含子目录）下的全部字幕文件
+        """
+        cached = cls._cache.get(directory)
+        if cached and cls._is_fresh(cached[0]):
+            return cached[1]
+        cached = cls._scan(directory)
+        cls._cache.put(directory, cached)
+        return cached[1]
+
+    @classmethod
+    def invalidate(cls, directory: str):
+        cls._cache.remove(directory)
+
+    @classmethod
+    def _rank(cls, directory: str, filename: str, name: str, path: str) -> tuple:
+        stem, ext = os.path.splitext(name)
+        # 保留 zh-hans 这类带连字符的标签
+        tokens = re.split(r'[._\s\[\]()]+', stem[len(filename):].lower())
+        tags = [token.strip('-') for token in tokens if token.strip('-')]
+        ranks = [cls.LANGUAGE_RANK.index(tag) for tag in tags if tag in cls.LANGUAGE_RANK]
+        if ranks:
+            language_rank = min(ranks)
+        else:
+            language_rank = len(cls.LANGUAGE_RANK) + (1 if tags else 0)
+        return (
+            # 只有ass/ssa可以合并
+            ext.lower() not in ('.ass', '.ssa'),
+            language_rank,
+            os.path.dirname(path) != directory,
+            name
+        )
+
+    @classmethod
+    def candidates(cls, file_path: str) -> List[str]:
+        """
+        获取视频对应的字幕文件，按格式、语言和所在目录排序
+        :param file_path: 视频文件路径
+        """
+        directory = os.path.dirname(file_path)
+        filename = os.path.splitext(os.path.basename(file_path))[0]
+        matched = []
+        for name, path in cls.subtitles(directory):
+            if not name.startswith(filename):
+                continue
+            # 避免 E1 匹配到 E10 的字幕
+            rest = name[len(filename):]
+            if rest[:1].isalnum():
+                continue
+            matched.append((cls._rank(directory, filename, name, path), path))
+        return [path for _, path in sorted(matched)]
+
 
 class SubtitleProcessor:
     @staticmethod
     def get_video_streams(file_path: str) -> Dict:
-        try:
-            result = subprocess.run(
-                ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            return json.loads(result.stdout) if result.returncode == 0 else {}
-        except Exception as e:
-            logger.error(f"获取视频流信息失败: {e}")
+        info = MediaProbe.probe(file_path)
+        if not info:
             return {}
+        return {"streams": info.get("streams", []), "format": info.get("format", {})}
+
+    # 图形字幕无法转换为ass
+    IMAGE_SUB_CODECS = ('hdmv_pgs_subtitle', 'dvd_subtitle', 'dvb_subtitle', 'xsub')
 
     @staticmethod
     def extract_subtitles(file_path: str, output_file: str, stream_index: int) -> bool:
+        return SubtitleProcessor.extract_subtitle_streams(file_path, {stream_index: output_file})
+
+    @staticmethod
+    def extract_subtitle_streams(file_path: str, outputs: Dict[int, str]) -> bool:
+        """
+        一次ffmpeg调用提取多条字幕流，只读取一遍视频文件
+        :param outputs: {字幕流序号: 输出文件}
+        """
+        command = ['ffmpeg', '-y', '-i', file_path]
+        for stream_index, output_file in outputs.items():
+            command += ['-map', f'0:{stream_index}', '-c:s', 'ass', output_file]
         try:
             result = subprocess.run(
-                ['ffmpeg', '-i', file_path, '-map', f'0:{stream_index}', '-c:s', 'ass', output_file],
+                command,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 universal_newlines=True
@@ -325,137 +1197,229 @@ class SubtitleProcessor:
             return False
 
     @classmethod
-    def try_extract_sub(cls, file_path: str):
+    def try_extract_sub(cls, file_path: str) -> List[str]:
+        """
+        提取中文内嵌字幕，视频未变化且字幕已提取过时直接复用
+        :return: 提取出的字幕文件
+        """
+        cached = ExtractedSubtitleCache.get(file_path)
+        if cached is not None and all(os.path.exists(output) for output in cached.values()):
+            logger.debug(f"内嵌字幕已提取过，跳过 - {file_path}")
+            return list(cached.values())
+
+        base_name = os.path.splitext(file_path)[0]
+        targets = {}
         streams_info = cls.get_video_streams(file_path)
+        if not streams_info:
+            # 探测失败不能说明没有字幕，不记录结果，下次重新探测
+            logger.warning(f"获取视频流信息失败，跳过字幕提取 - {file_path}")
+            return []
         for stream in streams_info.get('streams', []):
-            if stream.get('codec_type') == 'subtitle':
-                stream_index = stream['index']
-                base_name = os.path.splitext(file_path)[0]
-                language = stream.get('tags', {}).get('language', 'unknown')
-                
-                if language not in ['zh', 'zho', 'chi', 'chs', 'cht', 'cn']:
-                    continue
-                    
-                output_file = f"{base_name}.{language}.ass"
-                if os.path.exists(output_file):
-                    os.remove(output_file)
-                    
-                if cls.extract_subtitles(file_path, output_file, stream_index):
-                    logger.info(f'成功提取内嵌字幕 - {output_file}')
-                    break
+            if stream.get('codec_type') != 'subtitle' or stream.get('codec_name') in cls.IMAGE_SUB_CODECS:
+                continue
+            language = stream.get('tags', {}).get('language', 'unknown')
+            if language not in MediaProbe.SUB_LANGUAGES:
+                continue
+            output_file = f"{base_name}.{language}.ass"
+            # 同一语言有多条字幕流时以流序号区分
+            if output_file in targets.values():
+                output_file = f"{base_name}.{language}.{stream['index']}.ass"
+            targets[stream['index']] = output_file
+
+        if not targets:
+            ExtractedSubtitleCache.put(file_path, {})
+            return []
+
+        if cls.extract_subtitle_streams(file_path, targets):
+            extracted = dict(targets)
+        elif len(targets) > 1:
+            # 其中一条流转换失败会导致整体失败，逐条重试
+            extracted = {index: output for index, output in targets.items()
+                         if cls.extract_subtitles(file_path, output, index)}
+        else:
+            extracted = {}
+        # 删除失败时残留的文件，避免被当作字幕使用
+        for output_file in set(targets.values()) - set(extracted.values()):
+            if os.path.exists(output_file):
+                os.remove(output_file)
+        for output_file in extracted.values():
+            logger.info(f'成功提取内嵌字幕 - {output_file}')
+        if extracted:
+            ExtractedSubtitleCache.put(file_path, extracted)
+            SubtitleIndex.invalidate(os.path.dirname(file_path))
+        return list(extracted.values())
 
     @staticmethod
     def find_subtitle_file(file_path: str) -> Optional[str]:
-        filename = os.path.splitext(os.path.basename(file_path))[0]
-        for root, _, files in os.walk(os.path.dirname(file_path)):
-            for file in files:
-                if (file.endswith(('.srt', '.ass', '.ssa')) and 
-                    'danmu' not in file and 
-                    file.startswith(filename)):
-                    sub2 = os.path.join(root, file)
-                    logger.info(f"找到字幕文件 - {sub2}")
-                    return sub2
+        candidates = SubtitleIndex.candidates(file_path)
+        if candidates:
+            sub2 = candidates[0]
+            logger.info(f"找到字幕文件 - {sub2}")
+            return sub2
         logger.info("没找到字幕文件")
         return None
 
-    @staticmethod
-    def combine_sub_ass(sub1: str, sub2: str) -> bool:
+    # 编码检测读取的字节数
+    ENCODING_SAMPLE_SIZE = 64 * 1024
+    COPY_CHUNK_SIZE = 1024 * 1024
+
+    @classmethod
+    def detect_encoding(cls, file_path: str) -> str:
+        """
+        根据文件开头的一段内容检测编码，能按UTF-8解码时跳过chardet
+        :param file_path: 字幕文件路径
+        """
+        with open(file_path, 'rb') as f:
+            head = f.read(cls.ENCODING_SAMPLE_SIZE)
+        if head.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            return 'utf-16'
+        try:
+            # 截断处可能是半个字符，未读完整个文件时不做结尾检查
+            codecs.getincrementaldecoder('utf-8')().decode(head, final=len(head) < cls.ENCODING_SAMPLE_SIZE)
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+        encoding = chardet.detect(head).get('encoding') or 'utf-8'
+        # GB2312/GBK检测结果按超集GB18030解码，避免后文出现生僻字时失败
+        if encoding.lower() in ('gb2312', 'gbk'):
+            encoding = 'gb18030'
+        return encoding
+
+    @classmethod
+    def combine_sub_ass(cls, sub1: str, sub2: str) -> bool:
+        """
+        将弹幕文件与原生ass字幕流式合并为 .withDanmu.ass，
+        弹幕内容按块复制，原生字幕逐行读取，只改写样式中的字号
+        :param sub1: 弹幕文件
+        :param sub2: 原生字幕文件
+        """
         if not sub1 or not sub2:
             return False
-        
+        if os.path.splitext(sub2)[1].lower() not in ['.ass', '.ssa']:
+            return False
+
+        output = os.path.splitext(sub2)[0] + ".withDanmu.ass"
+        tmp_output = output + '.tmp'
         try:
-            with open(sub1, 'r', encoding='utf-8-sig') as f:
-                sub1_content = f.read()
-            
-            with open(sub2, 'rb') as f:
-                raw_data = f.read()
-                result = chardet.detect(raw_data)
-                file_encoding = result['encoding']
-            
-            with open(sub2, 'r', encoding=file_encoding) as f:
-                sub2_content = f.read()
-                
-            if os.path.splitext(sub2)[1].lower() in ['.ass', '.ssa']:
-                sub1ResX = re.search(r"PlayResX:\s*(\d+)", sub1_content)
-                sub2ResX = re.search(r"PlayResX:\s*(\d+)", sub2_content)
+            with open(sub1, 'rb') as f:
+                sub1ResX = re.search(rb"PlayResX:\s*(\d+)", f.read(cls.ENCODING_SAMPLE_SIZE))
+
+            with open(sub2, 'r', encoding=cls.detect_encoding(sub2), errors='replace') as src, \
+                    open(tmp_output, 'wb') as out:
+                # 读取原生字幕 [Events] 之前的部分：分辨率、样式格式和样式
+                sub2ResX = None
+                format_line = None
+                style_lines = []
+                events_head = None
+                for line in src:
+                    pos = line.find('[Events]')
+                    if pos != -1:
+                        events_head = line[pos + len('[Events]'):]
+                        break
+                    if sub2ResX is None:
+                        sub2ResX = re.search(r"PlayResX:\s*(\d+)", line)
+                    if format_line is None:
+                        match = re.search(r"Format:.+", line)
+                        format_line = match.group() if match else None
+                    pos = line.find('Style:')
+                    if pos != -1:
+                        style_lines.append(line[pos:].rstrip('\n'))
+                if format_line is None or events_head is None:
+                    return False
 
                 fontSizeRatio = 1
                 if sub1ResX and sub2ResX:
                     fontSizeRatio = int(sub1ResX.group(1)) / int(sub2ResX.group(1)) * 0.8
-
-                format_match = re.search(r"Format:.+", sub2_content)
-                if not format_match:
-                    return False
-
-                style_lines = re.findall(r'Style:.*', sub2_content)
                 for i, line in enumerate(style_lines):
                     elements = line.split(',')
                     if len(elements) >= 3:
                         elements[2] = str(int(float(elements[2]) * fontSizeRatio))
                         style_lines[i] = ','.join(elements)
 
-                events_start = sub2_content.find('[Events]')
-                if events_start == -1:
-                    return False
+                # 按块复制弹幕文件
+                out.write(codecs.BOM_UTF8)
+                with open(sub1, 'rb') as f:
+                    chunk = f.read(cls.COPY_CHUNK_SIZE)
+                    if chunk.startswith(codecs.BOM_UTF8):
+                        chunk = chunk[len(codecs.BOM_UTF8):]
+                    while chunk:
+                        out.write(chunk)
+                        chunk = f.read(cls.COPY_CHUNK_SIZE)
+
+                out.write(('\n[V4+ Styles]\n' + format_line + '\n' + '\n'.join(style_lines)
+                           + '\n[Events]\n').encode('utf-8'))
+
+                # 逐行复制事件，去掉首尾空白
+                pending = ''
+                started = False
+                for line in itertools.chain([events_head], src):
+                    if not started:
+                        line = line.lstrip()
+                        if not line:
+                            continue
+                        started = True
+                    content = line.rstrip()
+                    if not content:
+                        pending += line
+                        continue
+                    out.write((pending + content).encode('utf-8'))
+                    pending = line[len(content):]
+
+            os.replace(tmp_output, output)
+            return True
 
-                events_content = sub2_content[events_start + len('[Events]'):].strip()
-                output = os.path.splitext(sub2)[0] + ".withDanmu.ass"
-                
-                with open(output, 'w', encoding='utf-8-sig') as f:
-                    f.write(sub1_content)
-                    f.write('\n[V4+ Styles]\n')
-                    f.write(format_match.group())
-                    f.write('\n')
-                    f.write('\n'.join(style_lines))
-                    f.write('\n[Events]\n')
-                    f.write(events_content)
-                
-                return True
-                
-            return False
-            
         except Exception as e:
             logger.error(f"合并字幕失败: {e}")
             return False
+        finally:
+            if os.path.exists(tmp_output):
+                os.remove(tmp_output)
 
-def danmu_generator(file_path: str, width: int = 1920, height: int = 1080, 
-                   fontface: str = 'Arial', fontsize: float = 50, 
-                   alpha: float = 0.8, duration: float = 6, onlyFromBili: bool = False,
-                   use_tmdb_id: bool = False, tmdb_id: Optional[int] = None,
-                   episode: Optional[int] = None, cache_ttl: Optional[int] = None) -> Optional[str]:
-    try:
-        comment_id = DanmuAPI.get_comment_id(file_path, use_tmdb_id, tmdb_id, episode, cache_ttl)
-        if not comment_id:
-            logger.info(f"未找到对应弹幕 - {file_path}")
-            return "未找到对应弹幕"
-
-        comments_data = DanmuAPI.get_comments(comment_id)
-        if not comments_data:
-            return "未获取到弹幕数据"
-
-        comments = sorted(comments_data["comments"], key=lambda x: float(x['p'].split(',')[0]))
-        
-        if len(comments) == 0:
+def write_danmu(file_path: str, comments_data: Dict, width: int = 1920, height: int = 1080,
+                fontface: str = 'Arial', fontsize: float = 50, alpha: float = 0.8,
+                duration: float = 6, onlyFromBili: bool = False,
+                thinning: Optional[ThinningOptions] = None) -> str:
+    """
+    将弹幕数据写入ass文件并与原生字幕合并
+    :param thinning: 弹幕精简选项
+    :return: 弹幕文件路径，弹幕为空时返回原因
+    """
+    with ScrapeMetrics.timer("convert"):
+        columns = DanmuConverter.parse_comments(comments_data.get("comments", []), onlyFromBili)
+    
+        if len(columns) == 0:
             logger.info(f"弹幕数量为0，跳过生成 - {file_path}")
             return f"弹幕数量为0，跳过生成 - {file_path}"
 
-        # 过滤B站弹幕
         if onlyFromBili:
-            comments = [comment for comment in comments if '[BiliBili]' in comment['p'].split(',')[3]]
-            logger.info(f"过滤后剩余{len(comments)}条B站弹幕")
+            logger.info(f"过滤后剩余{len(columns)}条B站弹幕")
+
+        thinning = thinning or ThinningOptions()
+        total = len(columns)
+        dropped = {}
+        if thinning.enabled:
+            columns, dropped = DanmuConverter.thin_columns(columns, thinning, int(height) // int(fontsize))
 
         output_file = os.path.splitext(file_path)[0] + '.danmu.ass'
-        
-        DanmuConverter.convert_comments_to_ass(
-            comments, output_file, 
+    
+        stats = DanmuConverter.convert_columns_to_ass(
+            columns, output_file, 
             width=int(width), 
             height=int(height), 
             fontface=fontface, 
             fontsize=float(fontsize), 
             alpha=float(alpha), 
-            duration=float(duration)
+            duration=float(duration),
+            drop_when_full=thinning.drop_when_full
         )
+        if thinning.enabled:
+            logger.info(f"弹幕精简完成 - {file_path}，原始 {total} 条，写入 {stats['written']} 条，"
+                        f"重复 {dropped.get('duplicate', 0)} 条，超出频率 {dropped.get('rate_limited', 0)} 条，"
+                        f"轨道已满 {stats['saturated']} 条")
 
+    with ScrapeMetrics.timer("merge"):
         sub2 = SubtitleProcessor.find_subtitle_file(file_path)
         if not sub2:
             SubtitleProcessor.try_extract_sub(file_path)
@@ -466,9 +1430,27 @@ def danmu_generator(file_path: str, width: int = 1920, height: int = 1080,
         else:
             logger.error(f'未找到原生字幕，跳过合并 - {file_path}')
 
-        return output_file
+    return output_file
+
+def danmu_generator(file_path: str, width: int = 1920, height: int = 1080, 
+                   fontface: str = 'Arial', fontsize: float = 50, 
+                   alpha: float = 0.8, duration: float = 6, onlyFromBili: bool = False,
+                   use_tmdb_id: bool = False, tmdb_id: Optional[int] = None,
+                   episode: Optional[int] = None, cache_ttl: Optional[int] = None,
+                   thinning: Optional[ThinningOptions] = None, allow_stale: bool = True) -> Optional[str]:
+    try:
+        comment_id = DanmuAPI.get_comment_id(file_path, use_tmdb_id, tmdb_id, episode, cache_ttl)
+        if not comment_id:
+            logger.info(f"未找到对应弹幕 - {file_path}")
+            return "未找到对应弹幕"
+
+        comments_data = DanmuAPI.get_comments(comment_id, cache_ttl, allow_stale)
+        if not comments_data:
+            return FETCH_FAILED
+
+        return write_danmu(file_path, comments_data, width, height, fontface,
+                           fontsize, alpha, duration, onlyFromBili, thinning)
 
     except Exception as e:
         logger.error(f"生成弹幕失败: {e}")
         return f"生成弹幕失败: {str(e)}"
-
@@ -20,6 +20,15 @@ const _hoisted_13 = { class: "d-flex justify-space-between align-center" };
 const _hoisted_14 = { class: "setting-item d-flex align-center py-2" };
 const _hoisted_15 = { class: "setting-content flex-grow-1" };
 const _hoisted_16 = { class: "d-flex justify-space-between align-center" };
+const _hoisted_17 = { class: "setting-item d-flex align-center py-2" };
+const _hoisted_18 = { class: "setting-content flex-grow-1" };
+const _hoisted_19 = { class: "d-flex justify-space-between align-center" };
+const _hoisted_20 = { class: "setting-item d-flex align-center py-2" };
+const _hoisted_21 = { class: "setting-content flex-grow-1" };
+const _hoisted_22 = { class: "d-flex justify-space-between align-center" };
+const _hoisted_23 = { class: "setting-item d-flex align-center py-2" };
+const _hoisted_24 = { class: "setting-content flex-grow-1" };
+const _hoisted_25 = { class: "d-flex justify-space-between align-center" };
 
 const {ref,reactive,onMounted} = await importShared('vue');
 
@@ -66,7 +75,14 @@ const editableConfig = reactive({
   onlyFromBili: false,
   useTmdbID: true,
   auto_scrape: true,
-  enable_retry_task: true
+  enable_retry_task: true,
+  max_retry_times: 10,
+  incremental: false,
+  incremental_ttl: 168,
+  dedup_window: 0,
+  lane_rate: 0,
+  drop_when_full: false,
+  use_library_index: true
 });
 
 const getPluginId = () => {
@@ -99,7 +115,14 @@ async function loadInitialData() {
         onlyFromBili: data.onlyFromBili,
         useTmdbID: data.useTmdbID,
         auto_scrape: data.auto_scrape,
-        enable_retry_task: data.enable_retry_task
+        enable_retry_task: data.enable_retry_task,
+        max_retry_times: data.max_retry_times,
+        incremental: data.incremental,
+        incremental_ttl: data.incremental_ttl,
+        dedup_window: data.dedup_window,
+        lane_rate: data.lane_rate,
+        drop_when_full: data.drop_when_full,
+        use_library_index: data.use_library_index
       });
       initialConfigLoaded.value = true;
       successMessage.value = '成功加载配置';
@@ -123,7 +146,14 @@ async function loadInitialData() {
         onlyFromBili: props.initialConfig.onlyFromBili,
         useTmdbID: props.initialConfig.useTmdbID,
         auto_scrape: props.initialConfig.auto_scrape,
-        enable_retry_task: props.initialConfig.enable_retry_task
+        enable_retry_task: props.initialConfig.enable_retry_task,
+        max_retry_times: props.initialConfig.max_retry_times,
+        incremental: props.initialConfig.incremental,
+        incremental_ttl: props.initialConfig.incremental_ttl,
+        dedup_window: props.initialConfig.dedup_window,
+        lane_rate: props.initialConfig.lane_rate,
+        drop_when_full: props.initialConfig.drop_when_full,
+        use_library_index: props.initialConfig.use_library_index
       });
     }
     successMessage.value = null;
@@ -162,7 +192,14 @@ async function saveFullConfig() {
       onlyFromBili: editableConfig.onlyFromBili,
       useTmdbID: editableConfig.useTmdbID,
       auto_scrape: editableConfig.auto_scrape,
-      enable_retry_task: editableConfig.enable_retry_task
+      enable_retry_task: editableConfig.enable_retry_task,
+      max_retry_times: editableConfig.max_retry_times,
+      incremental: editableConfig.incremental,
+      incremental_ttl: editableConfig.incremental_ttl,
+      dedup_window: editableConfig.dedup_window,
+      lane_rate: editableConfig.lane_rate,
+      drop_when_full: editableConfig.drop_when_full,
+      use_library_index: editableConfig.use_library_index
     };
 
     // 发送保存请求
@@ -266,7 +303,7 @@ return (_ctx, _cache) => {
               color: "primary",
               size: "small"
             }),
-            _cache[14] || (_cache[14] = _createElementVNode("span", null, "弹幕刮削配置", -1))
+            _cache[21] || (_cache[21] = _createElementVNode("span", null, "弹幕刮削配置", -1))
           ]),
           _: 1
         }),
@@ -306,7 +343,7 @@ return (_ctx, _cache) => {
               ref_key: "form",
               ref: form,
               modelValue: isFormValid.value,
-              "onUpdate:modelValue": _cache[11] || (_cache[11] = $event => ((isFormValid).value = $event)),
+              "onUpdate:modelValue": _cache[18] || (_cache[18] = $event => ((isFormValid).value = $event)),
               onSubmit: _withModifiers(saveFullConfig, ["prevent"])
             }, {
               default: _withCtx(() => [
@@ -323,7 +360,7 @@ return (_ctx, _cache) => {
                           color: "primary",
                           size: "small"
                         }),
-                        _cache[15] || (_cache[15] = _createElementVNode("span", null, "基本设置", -1))
+                        _cache[22] || (_cache[22] = _createElementVNode("span", null, "基本设置", -1))
                       ]),
                       _: 1
                     }),
@@ -345,7 +382,7 @@ return (_ctx, _cache) => {
                                   }, null, 8, ["color"]),
                                   _createElementVNode("div", _hoisted_3, [
                                     _createElementVNode("div", _hoisted_4, [
-                                      _cache[16] || (_cache[16] = _createElementVNode("div", null, [
+                                      _cache[23] || (_cache[23] = _createElementVNode("div", null, [
                                         _createElementVNode("div", { class: "text-subtitle-2" }, "启用插件"),
                                         _createElementVNode("div", { class: "text-caption text-grey" }, "是否启用弹幕刮削功能")
                                       ], -1)),
@@ -379,7 +416,7 @@ return (_ctx, _cache) => {
                                   }, null, 8, ["color"]),
                                   _createElementVNode("div", _hoisted_6, [
                                     _createElementVNode("div", _hoisted_7, [
-                                      _cache[17] || (_cache[17] = _createElementVNode("div", null, [
+                                      _cache[24] || (_cache[24] = _createElementVNode("div", null, [
                                         _createElementVNode("div", { class: "text-subtitle-2" }, "仅从B站获取"),
                                         _createElementVNode("div", { class: "text-caption text-grey" }, "是否仅从B站获取弹幕")
                                       ], -1)),
@@ -413,7 +450,7 @@ return (_ctx, _cache) => {
                                   }, null, 8, ["color"]),
                                   _createElementVNode("div", _hoisted_9, [
                                     _createElementVNode("div", _hoisted_10, [
-                                      _cache[18] || (_cache[18] = _createElementVNode("div", null, [
+                                      _cache[25] || (_cache[25] = _createElementVNode("div", null, [
                                         _createElementVNode("div", { class: "text-subtitle-2" }, "使用TMDB ID"),
                                         _createElementVNode("div", { class: "text-caption text-grey" }, "是否使用TMDB ID进行匹配")
                                       ], -1)),
@@ -447,7 +484,7 @@ return (_ctx, _cache) => {
                                   }, null, 8, ["color"]),
                                   _createElementVNode("div", _hoisted_12, [
                                     _createElementVNode("div", _hoisted_13, [
-                                      _cache[19] || (_cache[19] = _createElementVNode("div", null, [
+                                      _cache[26] || (_cache[26] = _createElementVNode("div", null, [
                                         _createElementVNode("div", { class: "text-subtitle-2" }, "入库自动刮削"),
                                         _createElementVNode("div", { class: "text-caption text-grey" }, "是否在媒体入库时自动刮削弹幕")
                                       ], -1)),
@@ -481,7 +518,7 @@ return (_ctx, _cache) => {
                                   }, null, 8, ["color"]),
                                   _createElementVNode("div", _hoisted_15, [
                                     _createElementVNode("div", _hoisted_16, [
-                                      _cache[20] || (_cache[20] = _createElementVNode("div", null, [
+                                      _cache[27] || (_cache[27] = _createElementVNode("div", null, [
                                         _createElementVNode("div", { class: "text-subtitle-2" }, "启用重试任务"),
                                         _createElementVNode("div", { class: "text-caption text-grey" }, "弹幕数量不足时自动加入重试列表")
                                       ], -1)),
@@ -500,6 +537,40 @@ return (_ctx, _cache) => {
                                 ])
                               ]),
                               _: 1
+                            }),
+                            _createVNode(_component_v_col, {
+                              cols: "12",
+                              md: "6"
+                            }, {
+                              default: _withCtx(() => [
+                                _createElementVNode("div", _hoisted_17, [
+                                  _createVNode(_component_v_icon, {
+                                    icon: "mdi-update",
+                                    size: "small",
+                                    color: editableConfig.incremental ? 'success' : 'grey',
+                                    class: "mr-3"
+                                  }, null, 8, ["color"]),
+                                  _createElementVNode("div", _hoisted_18, [
+                                    _createElementVNode("div", _hoisted_19, [
+                                      _cache[28] || (_cache[28] = _createElementVNode("div", null, [
+                                        _createElementVNode("div", { class: "text-subtitle-2" }, "增量刮削"),
+                                        _createElementVNode("div", { class: "text-caption text-grey" }, "路径刮削时跳过未变化且未过期的文件")
+                                      ], -1)),
+                                      _createVNode(_component_v_switch, {
+                                        modelValue: editableConfig.incremental,
+                                        "onUpdate:modelValue": _cache[5] || (_cache[5] = $event => ((editableConfig.incremental) = $event)),
+                                        color: "success",
+                                        inset: "",
+                                        disabled: saving.value,
+                                        density: "compact",
+                                        "hide-details": "",
+                                        class: "small-switch"
+                                      }, null, 8, ["modelValue", "disabled"])
+                                    ])
+                                  ])
+                                ])
+                              ]),
+                              _: 1
                             })
                           ]),
                           _: 1
@@ -523,7 +594,7 @@ return (_ctx, _cache) => {
                           color: "primary",
                           size: "small"
                         }),
-                        _cache[21] || (_cache[21] = _createElementVNode("span", null, "弹幕参数设置", -1))
+                        _cache[29] || (_cache[29] = _createElementVNode("span", null, "弹幕参数设置", -1))
                       ]),
                       _: 1
                     }),
@@ -538,7 +609,7 @@ return (_ctx, _cache) => {
                               default: _withCtx(() => [
                                 _createVNode(_component_v_text_field, {
                                   modelValue: editableConfig.width,
-                                  "onUpdate:modelValue": _cache[5] || (_cache[5] = $event => ((editableConfig.width) = $event)),
+                                  "onUpdate:modelValue": _cache[6] || (_cache[6] = $event => ((editableConfig.width) = $event)),
                                   modelModifiers: { number: true },
                                   label: "视频宽度",
                                   type: "number",
@@ -562,7 +633,7 @@ return (_ctx, _cache) => {
                               default: _withCtx(() => [
                                 _createVNode(_component_v_text_field, {
                                   modelValue: editableConfig.height,
-                                  "onUpdate:modelValue": _cache[6] || (_cache[6] = $event => ((editableConfig.height) = $event)),
+                                  "onUpdate:modelValue": _cache[7] || (_cache[7] = $event => ((editableConfig.height) = $event)),
                                   modelModifiers: { number: true },
                                   label: "视频高度",
                                   type: "number",
@@ -586,7 +657,7 @@ return (_ctx, _cache) => {
                               default: _withCtx(() => [
                                 _createVNode(_component_v_text_field, {
                                   modelValue: editableConfig.fontsize,
-                                  "onUpdate:modelValue": _cache[7] || (_cache[7] = $event => ((editableConfig.fontsize) = $event)),
+                                  "onUpdate:modelValue": _cache[8] || (_cache[8] = $event => ((editableConfig.fontsize) = $event)),
                                   modelModifiers: { number: true },
                                   label: "字体大小",
                                   type: "number",
@@ -610,7 +681,7 @@ return (_ctx, _cache) => {
                               default: _withCtx(() => [
                                 _createVNode(_component_v_text_field, {
                                   modelValue: editableConfig.alpha,
-                                  "onUpdate:modelValue": _cache[8] || (_cache[8] = $event => ((editableConfig.alpha) = $event)),
+                                  "onUpdate:modelValue": _cache[9] || (_cache[9] = $event => ((editableConfig.alpha) = $event)),
                                   modelModifiers: { number: true },
                                   label: "透明度",
                                   type: "number",
@@ -636,7 +707,7 @@ return (_ctx, _cache) => {
                               default: _withCtx(() => [
                                 _createVNode(_component_v_text_field, {
                                   modelValue: editableConfig.duration,
-                                  "onUpdate:modelValue": _cache[9] || (_cache[9] = $event => ((editableConfig.duration) = $event)),
+                                  "onUpdate:modelValue": _cache[10] || (_cache[10] = $event => ((editableConfig.duration) = $event)),
                                   modelModifiers: { number: true },
                                   label: "持续时间",
                                   type: "number",
@@ -652,6 +723,137 @@ return (_ctx, _cache) => {
                                 }, null, 8, ["modelValue", "rules", "disabled"])
                               ]),
                               _: 1
+                            }),
+                            _createVNode(_component_v_col, {
+                              cols: "12",
+                              md: "6"
+                            }, {
+                              default: _withCtx(() => [
+                                _createVNode(_component_v_text_field, {
+                                  modelValue: editableConfig.max_retry_times,
+                                  "onUpdate:modelValue": _cache[11] || (_cache[11] = $event => ((editableConfig.max_retry_times) = $event)),
+                                  modelModifiers: { number: true },
+                                  label: "最大重试次数",
+                                  type: "number",
+                                  variant: "outlined",
+                                  min: 1,
+                                  rules: [v => v > 0 || '重试次数必须大于0'],
+                                  hint: "重试间隔按上映时间和弹幕增长自动调整",
+                                  "persistent-hint": "",
+                                  "prepend-inner-icon": "mdi-repeat",
+                                  disabled: saving.value || !editableConfig.enable_retry_task,
+                                  density: "compact",
+                                  class: "text-caption"
+                                }, null, 8, ["modelValue", "rules", "disabled"])
+                              ]),
+                              _: 1
+                            }),
+                            _createVNode(_component_v_col, {
+                              cols: "12",
+                              md: "6"
+                            }, {
+                              default: _withCtx(() => [
+                                _createVNode(_component_v_text_field, {
+                                  modelValue: editableConfig.incremental_ttl,
+                                  "onUpdate:modelValue": _cache[12] || (_cache[12] = $event => ((editableConfig.incremental_ttl) = $event)),
+                                  modelModifiers: { number: true },
+                                  label: "增量刮削有效期",
+                                  type: "number",
+                                  variant: "outlined",
+                                  min: 1,
+                                  rules: [v => v > 0 || '有效期必须大于0'],
+                                  hint: "增量刮削时弹幕文件的有效期(小时)",
+                                  "persistent-hint": "",
+                                  "prepend-inner-icon": "mdi-timer-sand",
+                                  disabled: saving.value,
+                                  density: "compact",
+                                  class: "text-caption"
+                                }, null, 8, ["modelValue", "rules", "disabled"])
+                              ]),
+                              _: 1
+                            }),
+                            _createVNode(_component_v_col, {
+                              cols: "12",
+                              md: "6"
+                            }, {
+                              default: _withCtx(() => [
+                                _createVNode(_component_v_text_field, {
+                                  modelValue: editableConfig.dedup_window,
+                                  "onUpdate:modelValue": _cache[13] || (_cache[13] = $event => ((editableConfig.dedup_window) = $event)),
+                                  modelModifiers: { number: true },
+                                  label: "重复弹幕去重窗口",
+                                  type: "number",
+                                  variant: "outlined",
+                                  min: 0,
+                                  rules: [v => v >= 0 || '去重窗口不能小于0'],
+                                  hint: "相同内容的弹幕在该时间(秒)内只保留一条,0为关闭",
+                                  "persistent-hint": "",
+                                  "prepend-inner-icon": "mdi-content-duplicate",
+                                  disabled: saving.value,
+                                  density: "compact",
+                                  class: "text-caption"
+                                }, null, 8, ["modelValue", "rules", "disabled"])
+                              ]),
+                              _: 1
+                            }),
+                            _createVNode(_component_v_col, {
+                              cols: "12",
+                              md: "6"
+                            }, {
+                              default: _withCtx(() => [
+                                _createVNode(_component_v_text_field, {
+                                  modelValue: editableConfig.lane_rate,
+                                  "onUpdate:modelValue": _cache[14] || (_cache[14] = $event => ((editableConfig.lane_rate) = $event)),
+                                  modelModifiers: { number: true },
+                                  label: "平均每轨道每秒弹幕上限",
+                                  type: "number",
+                                  variant: "outlined",
+                                  min: 0,
+                                  step: 0.1,
+                                  rules: [v => v >= 0 || '上限不能小于0'],
+                                  hint: "滚动/顶部/底部弹幕每秒各最多保留 轨道数×该值 条,优先丢弃重复和较短的弹幕,0为不限制",
+                                  "persistent-hint": "",
+                                  "prepend-inner-icon": "mdi-speedometer",
+                                  disabled: saving.value,
+                                  density: "compact",
+                                  class: "text-caption"
+                                }, null, 8, ["modelValue", "rules", "disabled"])
+                              ]),
+                              _: 1
+                            }),
+                            _createVNode(_component_v_col, {
+                              cols: "12",
+                              md: "6"
+                            }, {
+                              default: _withCtx(() => [
+                                _createElementVNode("div", _hoisted_20, [
+                                  _createVNode(_component_v_icon, {
+                                    icon: "mdi-layers-off",
+                                    size: "small",
+                                    color: editableConfig.drop_when_full ? 'warning' : 'grey',
+                                    class: "mr-3"
+                                  }, null, 8, ["color"]),
+                                  _createElementVNode("div", _hoisted_21, [
+                                    _createElementVNode("div", _hoisted_22, [
+                                      _cache[30] || (_cache[30] = _createElementVNode("div", null, [
+                                        _createElementVNode("div", { class: "text-subtitle-2" }, "轨道已满时丢弃"),
+                                        _createElementVNode("div", { class: "text-caption text-grey" }, "避免弹幕重叠,减轻播放器渲染压力")
+                                      ], -1)),
+                                      _createVNode(_component_v_switch, {
+                                        modelValue: editableConfig.drop_when_full,
+                                        "onUpdate:modelValue": _cache[15] || (_cache[15] = $event => ((editableConfig.drop_when_full) = $event)),
+                                        color: "warning",
+                                        inset: "",
+                                        disabled: saving.value,
+                                        density: "compact",
+                                        "hide-details": "",
+                                        class: "small-switch"
+                                      }, null, 8, ["modelValue", "disabled"])
+                                    ])
+                                  ])
+                                ])
+                              ]),
+                              _: 1
                             })
                           ]),
                           _: 1
@@ -675,7 +877,7 @@ return (_ctx, _cache) => {
                           color: "primary",
                           size: "small"
                         }),
-                        _cache[22] || (_cache[22] = _createElementVNode("span", null, "手动控制媒体库路径", -1))
+                        _cache[31] || (_cache[31] = _createElementVNode("span", null, "手动控制媒体库路径", -1))
                       ]),
                       _: 1
                     }),
@@ -683,7 +885,7 @@ return (_ctx, _cache) => {
                       default: _withCtx(() => [
                         _createVNode(_component_v_textarea, {
                           modelValue: editableConfig.path,
-                          "onUpdate:modelValue": _cache[10] || (_cache[10] = $event => ((editableConfig.path) = $event)),
+                          "onUpdate:modelValue": _cache[16] || (_cache[16] = $event => ((editableConfig.path) = $event)),
                           label: "/",
                           variant: "outlined",
                           hint: "每行一个路径,在状态页手动控制刮削",
@@ -693,7 +895,33 @@ return (_ctx, _cache) => {
                           density: "compact",
                           class: "text-caption",
                           rows: "3"
-                        }, null, 8, ["modelValue", "disabled"])
+                        }, null, 8, ["modelValue", "disabled"]),
+                        _createElementVNode("div", _hoisted_23, [
+                          _createVNode(_component_v_icon, {
+                            icon: "mdi-database-search",
+                            size: "small",
+                            color: editableConfig.use_library_index ? 'success' : 'grey',
+                            class: "mr-3"
+                          }, null, 8, ["color"]),
+                          _createElementVNode("div", _hoisted_24, [
+                            _createElementVNode("div", _hoisted_25, [
+                              _cache[32] || (_cache[32] = _createElementVNode("div", null, [
+                                _createElementVNode("div", { class: "text-subtitle-2" }, "媒体库后台索引"),
+                                _createElementVNode("div", { class: "text-caption text-grey" }, "监控目录变化,浏览和刮削时不再遍历磁盘")
+                              ], -1)),
+                              _createVNode(_component_v_switch, {
+                                modelValue: editableConfig.use_library_index,
+                                "onUpdate:modelValue": _cache[17] || (_cache[17] = $event => ((editableConfig.use_library_index) = $event)),
+                                color: "success",
+                                inset: "",
+                                disabled: saving.value,
+                                density: "compact",
+                                "hide-details": "",
+                                class: "small-switch"
+                              }, null, 8, ["modelValue", "disabled"])
+                            ])
+                          ])
+                        ])
                       ]),
                       _: 1
                     })
@@ -713,7 +941,7 @@ return (_ctx, _cache) => {
                           class: "mr-2",
                           size: "small"
                         }),
-                        _cache[23] || (_cache[23] = _createElementVNode("span", { class: "text-caption" }, " 此插件用于生成视频的弹幕字幕文件.弹幕来源为弹弹play平台. ", -1))
+                        _cache[33] || (_cache[33] = _createElementVNode("span", { class: "text-caption" }, " 此插件用于生成视频的弹幕字幕文件.弹幕来源为弹弹play平台. ", -1))
                       ]),
                       _: 1
                     })
@@ -731,13 +959,13 @@ return (_ctx, _cache) => {
           default: _withCtx(() => [
             _createVNode(_component_v_btn, {
               color: "info",
-              onClick: _cache[12] || (_cache[12] = $event => (emit('switch'))),
+              onClick: _cache[19] || (_cache[19] = $event => (emit('switch'))),
               "prepend-icon": "mdi-view-dashboard",
               disabled: saving.value,
               variant: "text",
               size: "small"
             }, {
-              default: _withCtx(() => _cache[24] || (_cache[24] = [
+              default: _withCtx(() => _cache[34] || (_cache[34] = [
                 _createTextVNode("状态页")
               ])),
               _: 1
@@ -751,7 +979,7 @@ return (_ctx, _cache) => {
               "prepend-icon": "mdi-restore",
               size: "small"
             }, {
-              default: _withCtx(() => _cache[25] || (_cache[25] = [
+              default: _withCtx(() => _cache[35] || (_cache[35] = [
                 _createTextVNode("重置")
               ])),
               _: 1
@@ -765,20 +993,20 @@ return (_ctx, _cache) => {
               variant: "text",
               size: "small"
             }, {
-              default: _withCtx(() => _cache[26] || (_cache[26] = [
+              default: _withCtx(() => _cache[36] || (_cache[36] = [
                 _createTextVNode("保存配置")
               ])),
               _: 1
             }, 8, ["disabled", "loading"]),
             _createVNode(_component_v_btn, {
               color: "grey",
-              onClick: _cache[13] || (_cache[13] = $event => (emit('close'))),
+              onClick: _cache[20] || (_cache[20] = $event => (emit('close'))),
               "prepend-icon": "mdi-close",
               disabled: saving.value,
               variant: "text",
               size: "small"
             }, {
-              default: _withCtx(() => _cache[27] || (_cache[27] = [
+              default: _withCtx(() => _cache[37] || (_cache[37] = [
                 _createTextVNode("关闭")
               ])),
               _: 1
@@ -17,10 +17,7 @@ const _hoisted_10 = { class: "text-caption text-grey" };
 const _hoisted_11 = { class: "status-item d-flex align-center py-2" };
 const _hoisted_12 = { class: "status-content flex-grow-1" };
 const _hoisted_13 = { class: "text-caption text-grey" };
-const _hoisted_14 = {
-  key: 0,
-  class: "directory-content"
-};
+const _hoisted_14 = { key: 0 };
 const _hoisted_15 = { class: "text-subtitle-2 text-primary cursor-pointer" };
 const _hoisted_16 = ["onClick"];
 const _hoisted_17 = { class: "text-subtitle-2 cursor-pointer" };
@@ -33,13 +30,21 @@ const _hoisted_20 = { class: "d-flex align-center" };
 const _hoisted_21 = { class: "text-subtitle-2" };
 const _hoisted_22 = {
   key: 2,
-  class: "text-center py-4"
+  class: "text-center py-2"
 };
 const _hoisted_23 = {
   key: 1,
-  class: "text-center py-4"
+  class: "text-caption text-grey"
 };
 const _hoisted_24 = {
+  key: 3,
+  class: "text-center py-4"
+};
+const _hoisted_25 = {
+  key: 1,
+  class: "text-center py-4"
+};
+const _hoisted_26 = {
   key: 2,
   class: "text-center py-4"
 };
@@ -67,6 +72,7 @@ const emit = __emit;
 const error = ref(null);
 const successMessage = ref(null);
 const running = ref(false);
+let statusTimer = null;
 
 // 状态数据
 const status = reactive({
@@ -81,8 +87,11 @@ const scrapingStatus = reactive({
   success: 0,
   failed: 0,
   current_file: "",
-  duration: 0
+  duration: 0,
+  eta: null,
+  job_id: null
 });
+const cancelling = ref(false);
 
 // 当前目录内容和导航
 const directoryContent = ref(null);
@@ -93,6 +102,33 @@ const pathHistory = ref([]);
 // 搜索关键字
 const searchKeyword = ref('');
 
+// 分页、排序和过滤
+const pageSize = 100;
+const nextCursor = ref(null);
+const loadingMore = ref(false);
+const filterBy = ref('all');
+const sortBy = ref('name');
+const filterOptions = [
+  { title: '全部', value: 'all' },
+  { title: '无弹幕', value: 'missing' },
+  { title: '弹幕不足', value: 'below' }
+];
+const sortOptions = [
+  { title: '按名称', value: 'name' },
+  { title: '弹幕少的在前', value: 'danmu_asc' },
+  { title: '弹幕多的在前', value: 'danmu_desc' }
+];
+
+// 分页请求参数
+function pageParams(cursor) {
+  return {
+    limit: pageSize,
+    cursor: cursor || undefined,
+    sort: sortBy.value,
+    filter_by: filterBy.value
+  };
+}
+
 // 计算属性：过滤后的项目
 const filteredItems = computed(() => {
   if (!directoryContent.value || !directoryContent.value.children) {
@@ -138,10 +174,19 @@ async function getStatus() {
         success: data.success,
         failed: data.failed,
         current_file: data.current_file,
-        duration: data.duration
+        duration: data.duration,
+        eta: data.eta ?? null,
+        job_id: data.job_id ?? null
       });
       
       running.value = data.running;
+      // 刮削进行中时定时刷新进度
+      if (data.running && !statusTimer) {
+        statusTimer = setInterval(getStatus, 3000);
+      } else if (!data.running && statusTimer) {
+        clearInterval(statusTimer);
+        statusTimer = null;
+      }
     }
   } catch (err) {
     console.error('获取状态失败:', err);
@@ -149,6 +194,25 @@ async function getStatus() {
   }
 }
 
+// 取消全局刮削
+async function cancelScrape() {
+  try {
+    cancelling.value = true;
+    const result = await props.api.get('plugin/Danmu/cancel_scrape');
+    if (result && result.success) {
+      successMessage.value = result.message;
+    } else {
+      error.value = result?.message || '取消刮削失败';
+    }
+    await getStatus();
+  } catch (err) {
+    console.error('取消刮削失败:', err);
+    error.value = '取消刮削失败，请检查网络或API';
+  } finally {
+    cancelling.value = false;
+  }
+}
+
 // 导航到指定路径
 async function navigateToPath(path) {
   try {
@@ -157,9 +221,12 @@ async function navigateToPath(path) {
     
     // 如果是空路径，加载根目录
     if (!path) {
-      const data = await props.api.get('plugin/Danmu/scan_path');
+      const data = await props.api.get('plugin/Danmu/scan_path', {
+        params: pageParams()
+      });
       if (data && data.success) {
         directoryContent.value = data.data;
+        nextCursor.value = data.data.next_cursor || null;
         currentPath.value = '';
         // 如果是多根目录，保存根路径历史
         if (data.data.type === 'root') {
@@ -171,11 +238,12 @@ async function navigateToPath(path) {
     } else {
       // 加载指定路径
       const data = await props.api.get('plugin/Danmu/scan_subfolder', {
-        params: { subfolder_path: path }
+        params: { subfolder_path: path, ...pageParams() }
       });
       
       if (data && data.success) {
         directoryContent.value = data.data;
+        nextCursor.value = data.data.next_cursor || null;
         currentPath.value = path;
         
         // 更新路径历史
@@ -194,6 +262,41 @@ async function navigateToPath(path) {
   }
 }
 
+// 加载下一页
+async function loadMore() {
+  if (!nextCursor.value || loadingMore.value || !directoryContent.value) return;
+  try {
+    loadingMore.value = true;
+    const data = currentPath.value
+      ? await props.api.get('plugin/Danmu/scan_subfolder', {
+          params: { subfolder_path: currentPath.value, ...pageParams(nextCursor.value) }
+        })
+      : await props.api.get('plugin/Danmu/scan_path', {
+          params: pageParams(nextCursor.value)
+        });
+    if (data && data.success) {
+      directoryContent.value.children.push(...data.data.children);
+      directoryContent.value.total = data.data.total;
+      nextCursor.value = data.data.next_cursor || null;
+    } else {
+      error.value = data?.message || '加载更多失败';
+    }
+  } catch (err) {
+    console.error('加载更多失败:', err);
+    error.value = '加载更多失败，请检查网络或API';
+  } finally {
+    loadingMore.value = false;
+  }
+}
+
+// 滚动到底部时加载下一页
+function onScroll(event) {
+  const el = event.target;
+  if (el.scrollTop + el.clientHeight >= el.scrollHeight - 100) {
+    loadMore();
+  }
+}
+
 // 返回上级目录
 function goBack() {
   if (!currentPath.value) return;
@@ -240,7 +343,10 @@ onMounted(async () => {
 
 // 清理
 onUnmounted(() => {
-  // 移除不需要的清理代码
+  if (statusTimer) {
+    clearInterval(statusTimer);
+    statusTimer = null;
+  }
 });
 
 return (_ctx, _cache) => {
@@ -252,10 +358,12 @@ return (_ctx, _cache) => {
   const _component_v_card_text = _resolveComponent("v-card-text");
   const _component_v_card = _resolveComponent("v-card");
   const _component_v_spacer = _resolveComponent("v-spacer");
+  const _component_v_btn = _resolveComponent("v-btn");
   const _component_v_text_field = _resolveComponent("v-text-field");
+  const _component_v_select = _resolveComponent("v-select");
   const _component_v_progress_linear = _resolveComponent("v-progress-linear");
   const _component_v_chip = _resolveComponent("v-chip");
-  const _component_v_btn = _resolveComponent("v-btn");
+  const _component_v_progress_circular = _resolveComponent("v-progress-circular");
   const _component_v_divider = _resolveComponent("v-divider");
   const _component_v_card_actions = _resolveComponent("v-card-actions");
 
@@ -273,7 +381,7 @@ return (_ctx, _cache) => {
               color: "primary",
               size: "small"
             }),
-            _cache[4] || (_cache[4] = _createElementVNode("span", null, "弹幕刮削", -1))
+            _cache[8] || (_cache[8] = _createElementVNode("span", null, "弹幕刮削", -1))
           ]),
           _: 1
         }),
@@ -322,7 +430,7 @@ return (_ctx, _cache) => {
                       color: "primary",
                       size: "small"
                     }),
-                    _cache[5] || (_cache[5] = _createElementVNode("span", null, "插件状态", -1))
+                    _cache[9] || (_cache[9] = _createElementVNode("span", null, "插件状态", -1))
                   ]),
                   _: 1
                 }),
@@ -343,7 +451,7 @@ return (_ctx, _cache) => {
                                 class: "mr-3"
                               }, null, 8, ["color"]),
                               _createElementVNode("div", _hoisted_3, [
-                                _cache[6] || (_cache[6] = _createElementVNode("div", { class: "text-subtitle-2" }, "插件状态", -1)),
+                                _cache[10] || (_cache[10] = _createElementVNode("div", { class: "text-subtitle-2" }, "插件状态", -1)),
                                 _createElementVNode("div", _hoisted_4, _toDisplayString(status.enabled ? '已启用' : '已禁用'), 1)
                               ])
                             ])
@@ -374,7 +482,24 @@ return (_ctx, _cache) => {
                           color: "primary",
                           size: "small"
                         }),
-                        _cache[7] || (_cache[7] = _createElementVNode("span", null, "刮削进度", -1))
+                        _cache[11] || (_cache[11] = _createElementVNode("span", null, "刮削进度", -1)),
+                        _createVNode(_component_v_spacer),
+                        (scrapingStatus.job_id)
+                          ? (_openBlock(), _createBlock(_component_v_btn, {
+                              key: 0,
+                              color: "error",
+                              variant: "text",
+                              size: "small",
+                              "prepend-icon": "mdi-stop",
+                              loading: cancelling.value,
+                              onClick: cancelScrape
+                            }, {
+                              default: _withCtx(() => _cache[12] || (_cache[12] = [
+                                _createTextVNode("取消")
+                              ])),
+                              _: 1
+                            }, 8, ["loading"]))
+                          : _createCommentVNode("", true)
                       ]),
                       _: 1
                     }),
@@ -392,7 +517,7 @@ return (_ctx, _cache) => {
                                     class: "mr-3"
                                   }),
                                   _createElementVNode("div", _hoisted_6, [
-                                    _cache[8] || (_cache[8] = _createElementVNode("div", { class: "text-subtitle-2" }, "当前文件", -1)),
+                                    _cache[13] || (_cache[13] = _createElementVNode("div", { class: "text-subtitle-2" }, "当前文件", -1)),
                                     _createElementVNode("div", _hoisted_7, _toDisplayString(scrapingStatus.current_file || '等待中...'), 1)
                                   ])
                                 ])
@@ -412,7 +537,7 @@ return (_ctx, _cache) => {
                                     class: "mr-3"
                                   }),
                                   _createElementVNode("div", _hoisted_9, [
-                                    _cache[9] || (_cache[9] = _createElementVNode("div", { class: "text-subtitle-2" }, "处理进度", -1)),
+                                    _cache[14] || (_cache[14] = _createElementVNode("div", { class: "text-subtitle-2" }, "处理进度", -1)),
                                     _createElementVNode("div", _hoisted_10, _toDisplayString(scrapingStatus.processed) + "/" + _toDisplayString(scrapingStatus.total) + " 个文件 (" + _toDisplayString(scrapingStatus.success) + " 成功, " + _toDisplayString(scrapingStatus.failed) + " 失败) ", 1)
                                   ])
                                 ])
@@ -432,8 +557,13 @@ return (_ctx, _cache) => {
                                     class: "mr-3"
                                   }),
                                   _createElementVNode("div", _hoisted_12, [
-                                    _cache[10] || (_cache[10] = _createElementVNode("div", { class: "text-subtitle-2" }, "运行时间", -1)),
-                                    _createElementVNode("div", _hoisted_13, _toDisplayString(formatDuration(scrapingStatus.duration)), 1)
+                                    _cache[15] || (_cache[15] = _createElementVNode("div", { class: "text-subtitle-2" }, "运行时间", -1)),
+                                    _createElementVNode("div", _hoisted_13, [
+                                      _createTextVNode(_toDisplayString(formatDuration(scrapingStatus.duration)) + " ", 1),
+                                      (scrapingStatus.eta !== null)
+                                        ? (_openBlock(), _createElementBlock("span", _hoisted_14, "，预计剩余 " + _toDisplayString(formatDuration(scrapingStatus.eta)), 1))
+                                        : _createCommentVNode("", true)
+                                    ])
                                   ])
                                 ])
                               ]),
@@ -462,7 +592,7 @@ return (_ctx, _cache) => {
                       color: "primary",
                       size: "small"
                     }),
-                    _cache[11] || (_cache[11] = _createElementVNode("span", null, "目录浏览", -1)),
+                    _cache[16] || (_cache[16] = _createElementVNode("span", null, "目录浏览", -1)),
                     _createVNode(_component_v_spacer),
                     _createVNode(_component_v_text_field, {
                       modelValue: searchKeyword.value,
@@ -474,6 +604,32 @@ return (_ctx, _cache) => {
                       "prepend-inner-icon": "mdi-magnify",
                       class: "search-field",
                       style: {"max-width":"200px"}
+                    }, null, 8, ["modelValue"]),
+                    _createVNode(_component_v_select, {
+                      modelValue: filterBy.value,
+                      "onUpdate:modelValue": [
+                        _cache[1] || (_cache[1] = $event => ((filterBy).value = $event)),
+                        _cache[2] || (_cache[2] = $event => (navigateToPath(currentPath.value)))
+                      ],
+                      items: filterOptions,
+                      density: "compact",
+                      variant: "outlined",
+                      "hide-details": "",
+                      class: "ml-2 filter-field",
+                      style: {"max-width":"150px"}
+                    }, null, 8, ["modelValue"]),
+                    _createVNode(_component_v_select, {
+                      modelValue: sortBy.value,
+                      "onUpdate:modelValue": [
+                        _cache[3] || (_cache[3] = $event => ((sortBy).value = $event)),
+                        _cache[4] || (_cache[4] = $event => (navigateToPath(currentPath.value)))
+                      ],
+                      items: sortOptions,
+                      density: "compact",
+                      variant: "outlined",
+                      "hide-details": "",
+                      class: "ml-2 filter-field",
+                      style: {"max-width":"150px"}
                     }, null, 8, ["modelValue"])
                   ]),
                   _: 1
@@ -485,7 +641,11 @@ return (_ctx, _cache) => {
                         _createVNode(_component_v_col, { cols: "12" }, {
                           default: _withCtx(() => [
                             (directoryContent.value)
-                              ? (_openBlock(), _createElementBlock("div", _hoisted_14, [
+                              ? (_openBlock(), _createElementBlock("div", {
+                                  key: 0,
+                                  class: "directory-content",
+                                  onScroll: onScroll
+                                }, [
                                   (loading.value)
                                     ? (_openBlock(), _createBlock(_component_v_progress_linear, {
                                         key: 0,
@@ -498,7 +658,7 @@ return (_ctx, _cache) => {
                                     ? (_openBlock(), _createElementBlock("div", {
                                         key: 1,
                                         class: "back-item d-flex align-center py-2 mb-2",
-                                        onClick: _cache[1] || (_cache[1] = $event => (goBack()))
+                                        onClick: _cache[5] || (_cache[5] = $event => (goBack()))
                                       }, [
                                         _createVNode(_component_v_icon, {
                                           icon: "mdi-keyboard-backspace",
@@ -560,7 +720,7 @@ return (_ctx, _cache) => {
                                                         color: "grey",
                                                         class: "ml-2"
                                                       }, {
-                                                        default: _withCtx(() => _cache[12] || (_cache[12] = [
+                                                        default: _withCtx(() => _cache[17] || (_cache[17] = [
                                                           _createTextVNode(" 无弹幕 ")
                                                         ])),
                                                         _: 1
@@ -580,7 +740,7 @@ return (_ctx, _cache) => {
                                                     size: "small",
                                                     class: "mr-1"
                                                   }),
-                                                  _cache[13] || (_cache[13] = _createTextVNode(" 刮削 "))
+                                                  _cache[18] || (_cache[18] = _createTextVNode(" 刮削 "))
                                                 ]),
                                                 _: 2
                                               }, 1032, ["loading", "onClick"])
@@ -588,24 +748,36 @@ return (_ctx, _cache) => {
                                           : _createCommentVNode("", true)
                                     ], 64))
                                   }), 128)),
-                                  (directoryContent.value.children && directoryContent.value.children.length === 0)
+                                  (nextCursor.value)
                                     ? (_openBlock(), _createElementBlock("div", _hoisted_22, [
+                                        (loadingMore.value)
+                                          ? (_openBlock(), _createBlock(_component_v_progress_circular, {
+                                              key: 0,
+                                              indeterminate: "",
+                                              size: "20",
+                                              color: "primary"
+                                            }))
+                                          : (_openBlock(), _createElementBlock("span", _hoisted_23, " 已加载 " + _toDisplayString(directoryContent.value.children.length) + "/" + _toDisplayString(directoryContent.value.total) + "，滚动加载更多 ", 1))
+                                      ]))
+                                    : _createCommentVNode("", true),
+                                  (directoryContent.value.children && directoryContent.value.children.length === 0)
+                                    ? (_openBlock(), _createElementBlock("div", _hoisted_24, [
                                         _createVNode(_component_v_alert, {
                                           type: "info",
                                           density: "compact",
                                           class: "mb-2 text-caption",
                                           variant: "tonal"
                                         }, {
-                                          default: _withCtx(() => _cache[14] || (_cache[14] = [
+                                          default: _withCtx(() => _cache[19] || (_cache[19] = [
                                             _createTextVNode(" 该目录为空或没有支持的媒体文件 ")
                                           ])),
                                           _: 1
                                         })
                                       ]))
                                     : _createCommentVNode("", true)
-                                ]))
+                                ], 32))
                               : (!directoryContent.value && error.value)
-                                ? (_openBlock(), _createElementBlock("div", _hoisted_23, [
+                                ? (_openBlock(), _createElementBlock("div", _hoisted_25, [
                                     _createVNode(_component_v_alert, {
                                       type: "error",
                                       density: "compact",
@@ -618,14 +790,14 @@ return (_ctx, _cache) => {
                                       _: 1
                                     })
                                   ]))
-                                : (_openBlock(), _createElementBlock("div", _hoisted_24, [
+                                : (_openBlock(), _createElementBlock("div", _hoisted_26, [
                                     _createVNode(_component_v_alert, {
                                       type: "info",
                                       density: "compact",
                                       class: "mb-2 text-caption",
                                       variant: "tonal"
                                     }, {
-                                      default: _withCtx(() => _cache[15] || (_cache[15] = [
+                                      default: _withCtx(() => _cache[20] || (_cache[20] = [
                                         _createTextVNode(" 请先在配置中设置刮削路径 ")
                                       ])),
                                       _: 1
@@ -651,12 +823,12 @@ return (_ctx, _cache) => {
           default: _withCtx(() => [
             _createVNode(_component_v_btn, {
               color: "info",
-              onClick: _cache[2] || (_cache[2] = $event => (emit('switch'))),
+              onClick: _cache[6] || (_cache[6] = $event => (emit('switch'))),
               "prepend-icon": "mdi-cog",
               variant: "text",
               size: "small"
             }, {
-              default: _withCtx(() => _cache[16] || (_cache[16] = [
+              default: _withCtx(() => _cache[21] || (_cache[21] = [
                 _createTextVNode("配置")
               ])),
               _: 1
@@ -664,12 +836,12 @@ return (_ctx, _cache) => {
             _createVNode(_component_v_spacer),
             _createVNode(_component_v_btn, {
               color: "grey",
-              onClick: _cache[3] || (_cache[3] = $event => (emit('close'))),
+              onClick: _cache[7] || (_cache[7] = $event => (emit('close'))),
               "prepend-icon": "mdi-close",
               variant: "text",
               size: "small"
             }, {
-              default: _withCtx(() => _cache[17] || (_cache[17] = [
+              default: _withCtx(() => _cache[22] || (_cache[22] = [
                 _createTextVNode("关闭")
               ])),
               _: 1
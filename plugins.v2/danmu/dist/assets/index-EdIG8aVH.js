@@ -1,6 +1,6 @@
 import { importShared } from './__federation_fn_import-JrT3xvdd.js';
-import Page from './__federation_expose_Page-DF3RUHu3.js';
-import Config from './__federation_expose_Config-BdvrOUFg.js';
+import Page from './__federation_expose_Page-mriV4iya.js';
+import Config from './__federation_expose_Config-cIjzyPUk.js';
 import { _ as _export_sfc } from './_plugin-vue_export-helper-pcqpp-6-.js';
 import { p as propsFactory, i as includes, a as isOn, e as eventName, g as genericComponent, b as getCurrentInstance, c as provideTheme, d as createLayout, u as useRtl, m as makeThemeProps, f as makeLayoutProps, h as provideDefaults, j as convertToUnit, k as destructComputed, l as isCssColor, n as isParsableColor, o as parseColor, q as getForeground, r as getCurrentInstanceName, S as SUPPORTS_INTERSECTION, s as clamp, t as consoleWarn, v as useProxiedModel, w as useToggleScope, x as useLayoutItem, y as makeLayoutItemProps, z as deepEqual, A as wrapInArray, B as findChildrenWithProvide, C as useTheme, D as useIcon, I as IconValue, E as flattenFragments, F as useResizeObserver, G as IN_BROWSER, H as hasEvent, J as isObject, K as keyCodes, L as useLocale, M as EventProp, N as filterInputAttrs, O as matchesSelector, P as omit, Q as callEvent, R as pick, T as useDisplay, U as useGoTo, V as makeDisplayProps, W as focusableChildren, X as consoleError, Y as defineComponent$1, Z as deprecate, _ as isPrimitive, $ as getPropertyFromItem, a0 as focusChild, a1 as CircularBuffer, a2 as defer, a3 as templateRef, a4 as isClickInsideElement, a5 as getNextElement, a6 as debounce, a7 as ensureValidVNode, a8 as checkPrintable, a9 as noop, aa as pickWithRest, ab as keys, ac as getEventCoordinates, ad as HexToHSV, ae as HSVtoHex, af as HSLtoHSV, ag as HSVtoHSL, ah as RGBtoHSV, ai as HSVtoRGB, aj as has, ak as getDecimals, al as createRange, am as keyValues, an as SUPPORTS_EYE_DROPPER, ao as HSVtoCSS, ap as RGBtoCSS, aq as getContrast, ar as isComposingIgnoreKey, as as getObjectValueByPath, at as isEmpty, au as defineFunctionalComponent, av as breakpoints, aw as useDate, ax as humanReadableFileSize, ay as provideLocale, az as useLayout, aA as VuetifyLayoutKey, aB as refElement, aC as VClassIcon, aD as VComponentIcon, aE as VLigatureIcon, aF as VSvgIcon } from './date-BMtbN87Q.js';
 
@@ -0,0 +1,348 @@
+import os
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.log import logger
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+MEDIA_EXTS = ('.mp4', '.mkv')
+DANMU_SUFFIX = '.danmu.ass'
+
+# (大小, 修改时间ns)
+FileKey = Tuple[int, int]
+
+
+class DirNode:
+    """
+    索引中的一个目录，只记录直接子项
+    """
+    __slots__ = ('dirs', 'media', 'danmu')
+
+    def __init__(self):
+        self.dirs: set = set()
+        self.media: Dict[str, FileKey] = {}
+        self.danmu: Dict[str, FileKey] = {}
+
+    def to_dict(self) -> dict:
+        return {"dirs": sorted(self.dirs), "media": self.media, "danmu": self.danmu}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'DirNode':
+        node = cls()
+        node.dirs = set(data.get("dirs", []))
+        node.media = {k: tuple(v) for k, v in data.get("media", {}).items()}
+        node.danmu = {k: tuple(v) for k, v in data.get("danmu", {}).items()}
+        return node
+
+
+class _IndexEventHandler(FileSystemEventHandler):
+
+    def __init__(self, index: 'LibraryIndex'):
+        super().__init__()
+        self.index = index
+
+    def on_any_event(self, event):
+        # 只读访问不影响索引
+        if event.event_type in ('opened', 'closed_no_write'):
+            return
+        # 目录新建、移动、删除时需要重新扫描整个子树，目录修改（子项增删）只需扫描该目录本身
+        recursive = event.is_directory and event.event_type in ('created', 'moved', 'deleted')
+        paths = [getattr(event, 'src_path', None), getattr(event, 'dest_path', None)]
+        for path in filter(None, paths):
+            path = os.fsdecode(path)
+            if event.is_directory:
+                self.index.mark_dirty(path, recursive=recursive)
+            self.index.mark_dirty(os.path.dirname(path))
+
+
+class LibraryIndex:
+    """
+    媒体库后台索引：启动时加载持久化的目录树并全量校对一次，
+    之后通过 inotify（watchdog）增量更新，并定期全量校对以覆盖网络挂载等收不到事件的情况
+    """
+    INDEX_FILE = 'library_index.json'
+
+    def __init__(self, roots: List[str], data_path: Path, reconcile_interval: int = 1800):
+        """
+        :param roots: 需要索引的根目录
+        :param data_path: 持久化目录
+        :param reconcile_interval: 全量校对间隔（秒）
+        """
+        self.roots = [os.path.normpath(root) for root in roots if os.path.isdir(root)]
+        self.index_file = Path(data_path) / self.INDEX_FILE
+        self.reconcile_interval = reconcile_interval
+        self._nodes: Dict[str, DirNode] = {}
+        self._lock = threading.RLock()
+        self._dirty: Dict[str, bool] = {}
+        # 全量校对期间收到变更的目录，校对结果替换索引后需要重新扫描
+        self._changed_during_reconcile: Optional[Dict[str, bool]] = None
+        self._dirty_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._observer = None
+        self._threads: List[threading.Thread] = []
+        # 加载了持久化索引或完成过校对，可用于浏览
+        self.ready = False
+        self.last_reconcile: Optional[float] = None
+
+    # ---- 生命周期 ----
+
+    def start(self):
+        if not self.roots:
+            return
+        self._load()
+        self._threads = [
+            threading.Thread(target=self._reconcile_loop, name="danmu-index-reconcile", daemon=True),
+            threading.Thread(target=self._dirty_loop, name="danmu-index-update", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                handler = _IndexEventHandler(self)
+                for root in self.roots:
+                    self._observer.schedule(handler, root, recursive=True)
+                self._observer.daemon = True
+                self._observer.start()
+                logger.info(f"媒体库索引已启动文件监控: {', '.join(self.roots)}")
+            except Exception as e:
+                logger.warning(f"媒体库索引启动文件监控失败，仅使用定期校对: {e}")
+                self._observer = None
+        else:
+            logger.info("未安装watchdog，媒体库索引仅使用定期校对")
+
+    def stop(self):
+        self._stop_event.set()
+        self._dirty_event.set()
+        if self._observer is not None:
+            try:
+                self._observer.stop()
+                self._observer.join(timeout=5)
+            except Exception as e:
+                logger.warning(f"停止文件监控失败: {e}")
+            self._observer = None
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        if self.ready:
+            self._save()
+
+    # ---- 构建与更新 ----
+
+    @staticmethod
+    def _scan_dir(path: str) -> Optional[DirNode]:
+        node = DirNode()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        # 与直接遍历磁盘一致，跟随指向目录的符号链接
+                        if entry.is_dir():
+                            node.dirs.add(entry.name)
+                        elif entry.name.endswith(DANMU_SUFFIX):
+                            st = entry.stat()
+                            node.danmu[entry.name] = (st.st_size, st.st_mtime_ns)
+                        elif entry.name.endswith(MEDIA_EXTS):
+                            st = entry.stat()
+                            node.media[entry.name] = (st.st_size, st.st_mtime_ns)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        return node
+
+    def _scan_tree(self, root: str) -> Dict[str, DirNode]:
+        nodes = {}
+        stack = [root]
+        # 已扫描的目录 (设备, inode)，避免符号链接成环
+        visited = set()
+        while stack and not self._stop_event.is_set():
+            path = stack.pop()
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in visited:
+                logger.debug(f"跳过已索引的目录（符号链接）: {path}")
+                continue
+            visited.add((st.st_dev, st.st_ino))
+            node = self._scan_dir(path)
+            if node is None:
+                continue
+            nodes[path] = node
+            stack.extend(os.path.join(path, name) for name in node.dirs)
+        return nodes
+
+    def reconcile(self):
+        """
+        全量扫描并替换索引
+        """
+        start = time.time()
+        with self._lock:
+            self._changed_during_reconcile = {}
+        nodes = {}
+        try:
+            for root in self.roots:
+                nodes.update(self._scan_tree(root))
+        finally:
+            with self._lock:
+                changed, self._changed_during_reconcile = self._changed_during_reconcile, None
+        if self._stop_event.is_set():
+            return
+        with self._lock:
+            self._nodes = nodes
+            self.ready = True
+            # 扫描期间的变更可能早于扫描到该目录，重新扫描以免被旧结果覆盖
+            for path, recursive in changed.items():
+                self._dirty[path] = self._dirty.get(path, False) or recursive
+        if changed:
+            self._dirty_event.set()
+        self.last_reconcile = time.time()
+        logger.info(f"媒体库索引校对完成，共 {len(nodes)} 个目录，耗时 {time.time() - start:.1f} 秒")
+        self._save()
+
+    def mark_dirty(self, path: str, recursive: bool = False):
+        """
+        标记目录需要重新扫描，由监控线程合并处理
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            self._dirty[path] = self._dirty.get(path, False) or recursive
+            if self._changed_during_reconcile is not None:
+                changed = self._changed_during_reconcile
+                changed[path] = changed.get(path, False) or recursive
+        self._dirty_event.set()
+
+    def _refresh(self, path: str, recursive: bool):
+        if not any(path == root or path.startswith(root + os.sep) for root in self.roots):
+            return
+        if recursive:
+            nodes = self._scan_tree(path) if os.path.isdir(path) else {}
+            with self._lock:
+                prefix = path + os.sep
+                for key in [k for k in self._nodes if k == path or k.startswith(prefix)]:
+                    del self._nodes[key]
+                self._nodes.update(nodes)
+            return
+        node = self._scan_dir(path)
+        with self._lock:
+            if node is None:
+                self._nodes.pop(path, None)
+            else:
+                self._nodes[path] = node
+
+    def _dirty_loop(self):
+        while not self._stop_event.is_set():
+            self._dirty_event.wait()
+            # 合并短时间内的大量事件
+            self._stop_event.wait(1)
+            with self._lock:
+                dirty, self._dirty = self._dirty, {}
+                self._dirty_event.clear()
+            if not self.ready:
+                continue
+            for path, recursive in dirty.items():
+                try:
+                    self._refresh(path, recursive)
+                except Exception as e:
+                    logger.warning(f"更新媒体库索引失败: {path}, 错误: {e}")
+
+    def _reconcile_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.reconcile()
+            except Exception as e:
+                logger.error(f"媒体库索引校对失败: {e}")
+            self._stop_event.wait(self.reconcile_interval)
+
+    # ---- 持久化 ----
+
+    def _load(self):
+        try:
+            if not self.index_file.exists():
+                return
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if sorted(data.get("roots", [])) != sorted(self.roots):
+                return
+            with self._lock:
+                self._nodes = {path: DirNode.from_dict(node) for path, node in data.get("nodes", {}).items()}
+                self.ready = True
+            logger.info(f"加载媒体库索引，共 {len(self._nodes)} 个目录")
+        except Exception as e:
+            logger.warning(f"加载媒体库索引失败: {e}")
+
+    def _save(self):
+        try:
+            with self._lock:
+                data = {
+                    "roots": self.roots,
+                    "saved_at": time.time(),
+                    "nodes": {path: node.to_dict() for path, node in self._nodes.items()}
+                }
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.index_file.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            logger.warning(f"保存媒体库索引失败: {e}")
+
+    # ---- 查询 ----
+
+    @property
+    def reconciled(self) -> bool:
+        """
+        本次启动后是否完成过全量校对，此前的索引来自持久化文件，可能缺少停机期间的变化
+        """
+        return self.last_reconcile is not None
+
+    def covers(self, path: str) -> bool:
+        """
+        索引是否可用于该路径
+        """
+        if not self.ready:
+            return False
+        path = os.path.normpath(path)
+        return any(path == root or path.startswith(root + os.sep) for root in self.roots)
+
+    def list_dir(self, path: str) -> Optional[DirNode]:
+        """
+        获取目录的直接子项，索引中不存在时返回None
+        """
+        if not self.covers(path):
+            return None
+        with self._lock:
+            return self._nodes.get(os.path.normpath(path))
+
+    def exists(self, file_path: str) -> Optional[bool]:
+        """
+        媒体文件是否存在，索引无法判断时返回None
+        """
+        if not self.covers(file_path):
+            return None
+        node = self.list_dir(os.path.dirname(file_path))
+        return node is not None and os.path.basename(file_path) in node.media
+
+    def iter_media(self, path: str) -> Iterator[str]:
+        """
+        遍历路径下所有媒体文件
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            prefix = path + os.sep
+            dirs = sorted(k for k in self._nodes if k == path or k.startswith(prefix))
+            items = [(d, sorted(self._nodes[d].media)) for d in dirs]
+        for directory, names in items:
+            for name in names:
+                yield os.path.join(directory, name)
@@ -0,0 +1,230 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+
+class Histogram:
+    """
+    固定分桶的耗时直方图（秒）
+    """
+    BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self):
+        # 最后一个桶为+Inf
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        按分桶估算分位数，返回所在桶的上限
+        """
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> Dict:
+        p95 = self.quantile(0.95)
+        return {
+            "count": self.count,
+            "avg": round(self.sum / self.count, 3) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": None if p95 == float('inf') else p95,
+            "buckets": {str(bound): count for bound, count in zip(self.BUCKETS, self.counts)},
+        }
+
+
+class ScrapeMetrics:
+    """
+    刮削进度和性能统计，所有刮削任务（全局、重试、传输）共用。
+    进度计数在没有任务运行时开始新任务会清零，阶段耗时和API统计从插件启动起累计
+    """
+    STAGES = ("hash", "probe", "match", "fetch", "convert", "merge")
+
+    _lock = threading.Lock()
+    _active_jobs = 0
+    _started_at: Optional[float] = None
+    _total: Optional[int] = None
+    _queued = 0
+    _success = 0
+    _failed = 0
+    # 处理中的文件 {路径: 开始时间}
+    _in_flight: Dict[str, float] = {}
+    _histograms: Dict[str, Histogram] = {stage: Histogram() for stage in STAGES}
+    # API统计 {主机: [请求数, 失败数]}
+    _api: Dict[str, list] = {}
+
+    @classmethod
+    def start_job(cls, total: Optional[int] = None):
+        """
+        开始一次刮削
+        :param total: 已知的文件总数，流式刮削时为空
+        """
+        with cls._lock:
+            if cls._active_jobs == 0:
+                cls._started_at = time.time()
+                cls._total = 0
+                cls._queued = cls._success = cls._failed = 0
+                cls._in_flight = {}
+            cls._active_jobs += 1
+            if total is None or cls._total is None:
+                cls._total = None
+            else:
+                cls._total += total
+
+    @classmethod
+    def end_job(cls):
+        with cls._lock:
+            cls._active_jobs = max(0, cls._active_jobs - 1)
+
+    @classmethod
+    def track(cls, items):
+        """
+        包装待处理的文件迭代器，统计已投递数量
+        """
+        for item in items:
+            with cls._lock:
+                cls._queued += 1
+            yield item
+
+    @classmethod
+    def task_started(cls, file_path: str):
+        with cls._lock:
+            cls._in_flight[file_path] = time.time()
+
+    @classmethod
+    def task_finished(cls, file_path: str, success: bool):
+        with cls._lock:
+            cls._in_flight.pop(file_path, None)
+            if success:
+                cls._success += 1
+            else:
+                cls._failed += 1
+
+    @classmethod
+    def observe(cls, stage: str, seconds: float):
+        with cls._lock:
+            cls._histograms[stage].observe(seconds)
+
+    @classmethod
+    @contextmanager
+    def timer(cls, stage: str):
+        """
+        统计代码块耗时
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            cls.observe(stage, time.perf_counter() - start)
+
+    @classmethod
+    def timed(cls, stage: str):
+        """
+        统计函数耗时的装饰器
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with cls.timer(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @classmethod
+    def record_request(cls, host: str, error: bool):
+        with cls._lock:
+            counter = cls._api.setdefault(host, [0, 0])
+            counter[0] += 1
+            if error:
+                counter[1] += 1
+
+    @classmethod
+    def _progress(cls) -> Tuple[int, int, Optional[float]]:
+        """
+        :return: (已处理数, 总数, 预计剩余秒数)
+        """
+        processed = cls._success + cls._failed
+        total = cls._total if cls._total is not None else cls._queued
+        eta = None
+        if cls._active_jobs and cls._started_at and processed:
+            rate = processed / max(time.time() - cls._started_at, 1e-6)
+            eta = max(0, total - processed) / rate
+        return processed, total, eta
+
+    @classmethod
+    def snapshot(cls) -> Dict:
+        """
+        当前状态，字段与状态页一致
+        """
+        with cls._lock:
+            processed, total, eta = cls._progress()
+            current_file = max(cls._in_flight, key=cls._in_flight.get) if cls._in_flight else ""
+            elapsed = time.time() - cls._started_at if cls._started_at else 0
+            return {
+                "running": cls._active_jobs > 0,
+                "total": total,
+                "queued": cls._queued,
+                "in_flight": len(cls._in_flight),
+                "processed": processed,
+                "success": cls._success,
+                "failed": cls._failed,
+                "current_file": current_file,
+                "duration": int(elapsed),
+                "eta": int(eta) if eta is not None else None,
+                "stages": {stage: hist.to_dict() for stage, hist in cls._histograms.items()},
+                "api": {host: {"requests": requests, "errors": errors,
+                               "error_rate": round(errors / requests, 4) if requests else 0}
+                        for host, (requests, errors) in cls._api.items()},
+            }
+
+    @classmethod
+    def prometheus(cls) -> str:
+        """
+        Prometheus文本格式的统计数据
+        """
+        lines = []
+        with cls._lock:
+            processed, total, eta = cls._progress()
+            lines += [
+                "# TYPE danmu_scrape_running gauge",
+                f"danmu_scrape_running {int(cls._active_jobs > 0)}",
+                "# TYPE danmu_scrape_files gauge",
+                f'danmu_scrape_files{{state="total"}} {total}',
+                f'danmu_scrape_files{{state="queued"}} {cls._queued}',
+                f'danmu_scrape_files{{state="in_flight"}} {len(cls._in_flight)}',
+                f'danmu_scrape_files{{state="success"}} {cls._success}',
+                f'danmu_scrape_files{{state="failed"}} {cls._failed}',
+                "# TYPE danmu_scrape_eta_seconds gauge",
+                f"danmu_scrape_eta_seconds {eta if eta is not None else 'NaN'}",
+                "# TYPE danmu_stage_seconds histogram",
+            ]
+            for stage, hist in cls._histograms.items():
+                cumulative = 0
+                for bound, count in zip(Histogram.BUCKETS, hist.counts):
+                    cumulative += count
+                    lines.append(f'danmu_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'danmu_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {hist.count}')
+                lines.append(f'danmu_stage_seconds_sum{{stage="{stage}"}} {hist.sum}')
+                lines.append(f'danmu_stage_seconds_count{{stage="{stage}"}} {hist.count}')
+            lines.append("# TYPE danmu_api_requests_total counter")
+            for host, (requests, errors) in cls._api.items():
+                lines.append(f'danmu_api_requests_total{{host="{host}"}} {requests}')
+            lines.append("# TYPE danmu_api_errors_total counter")
+            for host, (requests, errors) in cls._api.items():
+                lines.append(f'danmu_api_errors_total{{host="{host}"}} {errors}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,237 @@
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from app.log import logger
+
+# 队列结束标记
+_STOP = object()
+
+
+class Stage:
+    """
+    流水线中的一个处理阶段
+    :param name: 阶段名称
+    :param func: 处理函数，返回值为空时任务在本阶段结束，否则传递给下一阶段
+    :param workers: 本阶段的并发数
+    :param limiter: 多条流水线共用的并发限制，同时运行多条流水线时合计并发不超过信号量的容量
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1,
+                 limiter: Optional[threading.Semaphore] = None):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.limiter = limiter
+
+
+class StagePipeline:
+    """
+    多阶段流水线，每个阶段拥有独立的工作线程和有界队列。
+    任务完成一个阶段后立即进入下一阶段，单个慢任务只占用所在阶段的一个线程，不会阻塞整批任务。
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: Optional[int] = None,
+                 on_error: Optional[Callable[[Any, Stage, Exception], None]] = None,
+                 on_complete: Optional[Callable[[Any], None]] = None):
+        """
+        :param stages: 处理阶段
+        :param queue_size: 每个阶段输入队列的容量，默认为该阶段并发数的两倍
+        :param on_error: 任务抛出异常时的回调
+        :param on_complete: 任务离开流水线（完成、提前结束或失败）时的回调，参数为最后一个阶段的输入
+        """
+        if not stages:
+            raise ValueError("流水线至少需要一个阶段")
+        self.stages = stages
+        self.on_error = on_error
+        self.on_complete = on_complete
+        self._queues = [queue.Queue(maxsize=queue_size or stage.workers * 2) for stage in stages]
+        self._alive = [stage.workers for stage in stages]
+        self._lock = threading.Lock()
+        self._stats = {"queued": 0, "done": 0, "finished_early": 0, "failed": 0}
+
+    def _worker(self, index: int):
+        stage = self.stages[index]
+        in_queue = self._queues[index]
+        out_queue = self._queues[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = in_queue.get()
+            if item is _STOP:
+                break
+            try:
+                with stage.limiter or nullcontext():
+                    result = stage.func(item)
+            except Exception as e:
+                logger.error(f"流水线阶段 {stage.name} 处理失败: {e}")
+                self._count("failed")
+                if self.on_error:
+                    try:
+                        self.on_error(item, stage, e)
+                    except Exception as err:
+                        logger.error(f"流水线错误回调失败: {err}")
+                self._complete(item)
+                continue
+            if result is None or result is False:
+                self._count("finished_early")
+                self._complete(item)
+            elif out_queue is None:
+                self._count("done")
+                self._complete(item)
+            else:
+                out_queue.put(result)
+        # 本阶段最后一个线程退出时，通知下一阶段结束
+        with self._lock:
+            self._alive[index] -= 1
+            last = self._alive[index] == 0
+        if last and out_queue is not None:
+            for _ in range(self.stages[index + 1].workers):
+                out_queue.put(_STOP)
+
+    def _complete(self, item: Any):
+        if self.on_complete:
+            try:
+                self.on_complete(item)
+            except Exception as e:
+                logger.error(f"流水线完成回调失败: {e}")
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def run(self, items: Iterable[Any], should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, int]:
+        """
+        运行流水线，items可以是生成器，入口队列满时会阻塞读取实现背压
+        :param items: 待处理任务
+        :param should_stop: 返回True时停止投递新任务，已投递的任务会继续处理完
+        :return: 统计信息
+        """
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._worker, args=(index,),
+                                          name=f"danmu-{stage.name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        try:
+            for item in items:
+                if should_stop and should_stop():
+                    logger.info("流水线停止投递新任务")
+                    break
+                self._queues[0].put(item)
+                self._count("queued")
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._queues[0].put(_STOP)
+            for thread in threads:
+                thread.join()
+        return dict(self._stats)
+
+
+class IngestQueue:
+    """
+    事件任务合并队列：短时间内连续提交的任务合并为一批，已排队或处理中的任务不会重复提交，
+    由固定数量的工作线程按批处理
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], Any], workers: int = 1,
+                 debounce: float = 5, max_wait: float = 60, name: str = "ingest"):
+        """
+        :param handler: 批处理函数
+        :param workers: 工作线程数
+        :param debounce: 最后一次提交后等待的秒数，期间的新任务合并到同一批
+        :param max_wait: 一批任务最长等待的秒数，避免持续提交时一直不处理
+        :param name: 线程名称前缀
+        """
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.name = name
+        self._cond = threading.Condition()
+        # 保持提交顺序的待处理任务
+        self._pending: Dict[Any, None] = {}
+        self._in_flight = set()
+        self._first_at: Optional[float] = None
+        self._last_at: Optional[float] = None
+        self._stopped = False
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"danmu-{self.name}-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        停止队列，丢弃尚未开始的任务，等待处理中的批次结束
+        :return: 所有工作线程是否都已退出
+        """
+        with self._cond:
+            self._stopped = True
+            dropped = len(self._pending)
+            self._pending.clear()
+            self._cond.notify_all()
+        if dropped:
+            logger.info(f"{self.name} 队列停止，丢弃 {dropped} 个未处理任务")
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        return not self._threads
+
+    def submit(self, items: Iterable[Any]) -> int:
+        """
+        提交任务
+        :return: 实际加入队列的任务数
+        """
+        added = 0
+        with self._cond:
+            if self._stopped:
+                return 0
+            for item in items:
+                if item in self._pending or item in self._in_flight:
+                    continue
+                self._pending[item] = None
+                added += 1
+            if added:
+                now = time.monotonic()
+                self._first_at = self._first_at or now
+                self._last_at = now
+                self._cond.notify_all()
+        return added
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"pending": len(self._pending), "in_flight": len(self._in_flight)}
+
+    def _next_batch(self) -> Optional[List[Any]]:
+        with self._cond:
+            while not self._stopped:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                wait = min(self._last_at + self.debounce, self._first_at + self.max_wait) - now
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                batch = list(self._pending)
+                self._pending.clear()
+                self._first_at = self._last_at = None
+                self._in_flight.update(batch)
+                return batch
+            return None
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            try:
+                self.handler(batch)
+            except Exception as e:
+                logger.error(f"{self.name} 批处理失败: {e}")
+            finally:
+                with self._cond:
+                    self._in_flight.difference_update(batch)
@@ -0,0 +1,129 @@
+"""
+DanmuAPI.match_batch 批量匹配测试，使用本地 http.server 模拟弹幕服务
+
+在 MoviePilot 根目录下运行：
+    python -m pytest app/plugins/danmu/tests
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.plugins.danmu.danmu_generator import DanmuAPI, VideoInfo
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    按服务器上设置的 status / respond 返回，收到的请求体记录在 server.requests
+    """
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        self.server.requests.append((self.path, body))
+        payload = json.dumps(self.server.respond(body)).encode()
+        self.send_response(self.server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def match_all(body):
+    """
+    按 hash 返回匹配结果，hash 以 miss 开头的视为未匹配
+    """
+    results = []
+    for item in body["requests"]:
+        if item["file_hash"].startswith("miss"):
+            results.append({"isMatched": False, "matches": []})
+        else:
+            results.append({"isMatched": True, "matches": [{"episodeId": f"ep-{item['file_hash']}"}]})
+    return {"results": results}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    httpd.status = 200
+    httpd.respond = match_all
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(DanmuAPI, 'BASE_URL', f'http://127.0.0.1:{httpd.server_address[1]}/api/v1')
+    monkeypatch.setattr(DanmuAPI, '_batch_disabled_until', 0.0)
+    monkeypatch.setattr(DanmuAPI, 'BATCH_MATCH_SIZE', 2)
+    yield httpd
+    DanmuAPI.close_session()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def make_items(*hashes):
+    return {f"/media/{h}.mkv": VideoInfo(f"{h}.mkv", h, 1024, 1440) for h in hashes}
+
+
+def test_matches_each_file_in_chunks(server):
+    matches = DanmuAPI.match_batch(make_items("a", "b", "miss-c"))
+    assert matches == {"/media/a.mkv": "ep-a", "/media/b.mkv": "ep-b", "/media/miss-c.mkv": None}
+    assert [path for path, _ in server.requests] == ["/api/v1/match/batch"] * 2
+    assert [[item["file_hash"] for item in body["requests"]] for _, body in server.requests] == \
+        [["a", "b"], ["miss-c"]]
+
+
+def test_accepts_single_match_result_format(server):
+    server.respond = lambda body: {"results": [{"matchResult": {"episodeId": 42}} for _ in body["requests"]]}
+    assert DanmuAPI.match_batch(make_items("a")) == {"/media/a.mkv": "42"}
+
+
+@pytest.mark.parametrize("status", [404, 405, 501])
+def test_unsupported_endpoint_falls_back(server, status):
+    server.status = status
+    server.respond = lambda body: {"detail": "Not Found"}
+    assert DanmuAPI.match_batch(make_items("a", "b", "c")) == {}
+    assert not DanmuAPI.batch_available()
+    # 第一次请求后暂停尝试批量接口
+    assert len(server.requests) == 1
+    assert DanmuAPI.match_batch(make_items("d", "e")) == {}
+    assert DanmuAPI.match_group(["/media/d.mkv", "/media/e.mkv"]) == {}
+    assert len(server.requests) == 1
+
+
+def test_unsupported_endpoint_is_retried_later(server, monkeypatch):
+    server.status = 404
+    server.respond = lambda body: {"detail": "Not Found"}
+    assert DanmuAPI.match_batch(make_items("a")) == {}
+    assert not DanmuAPI.batch_available()
+    # 暂停期满后重新尝试批量接口
+    monkeypatch.setattr(DanmuAPI, '_batch_disabled_until', time.monotonic() - 1)
+    server.status = 200
+    server.respond = match_all
+    assert DanmuAPI.match_batch(make_items("a")) == {"/media/a.mkv": "ep-a"}
+    assert len(server.requests) == 2
+
+
+def test_other_errors_keep_batch_enabled(server):
+    server.status = 400
+    server.respond = lambda body: {"detail": "bad request"}
+    assert DanmuAPI.match_batch(make_items("a", "b", "c")) == {}
+    assert DanmuAPI.batch_available()
+    # 每个分块都会尝试
+    assert len(server.requests) == 2
+
+
+def test_result_count_mismatch_skips_chunk(server):
+    def respond(body):
+        results = match_all(body)["results"]
+        # 第一个分块少返回一条，无法确定对应关系
+        return {"results": results[:-1] if len(results) == 2 else results}
+
+    server.respond = respond
+    matches = DanmuAPI.match_batch(make_items("a", "b", "c"))
+    # 数量不符的分块不出现在结果中，由调用方逐个匹配
+    assert matches == {"/media/c.mkv": "ep-c"}
+    assert DanmuAPI.batch_available()
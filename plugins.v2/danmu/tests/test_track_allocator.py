@@ -0,0 +1,74 @@
+"""
+TrackAllocator 轨道分配测试
+
+在 MoviePilot 根目录下运行：
+    python -m pytest app/plugins/danmu/tests
+"""
+import random
+
+from app.plugins.danmu.danmu_generator import TrackAllocator
+
+
+def test_allocates_lowest_free_lane():
+    allocator = TrackAllocator(3)
+    assert allocator.allocate(0, 5) == 1
+    assert allocator.allocate(1, 5) == 2
+    assert allocator.allocate(2, 5) == 3
+
+
+def test_released_lane_is_reused_from_its_end_time():
+    allocator = TrackAllocator(3)
+    allocator.allocate(0, 2)
+    allocator.allocate(0, 10)
+    # 轨道1在时间2空出，与轨道3相比编号更小
+    assert allocator.allocate(2, 4) == 1
+    assert allocator.allocate(2, 4) == 3
+
+
+def test_saturated_reuses_earliest_free_lane():
+    allocator = TrackAllocator(3)
+    allocator.allocate(0, 9)
+    allocator.allocate(0, 3)
+    allocator.allocate(0, 6)
+    assert not allocator.has_free(1)
+    assert allocator.allocate(1, 20) == 2
+    # 被复用的轨道按新的结束时间继续占用
+    assert allocator.allocate(1, 20) == 3
+    assert allocator.allocate(1, 20) == 1
+
+
+def test_saturated_tie_prefers_lower_lane():
+    allocator = TrackAllocator(2)
+    allocator.allocate(0, 5)
+    allocator.allocate(0, 5)
+    assert allocator.allocate(1, 8) == 1
+
+
+def test_has_free():
+    allocator = TrackAllocator(1)
+    assert allocator.has_free(0)
+    allocator.allocate(0, 3)
+    assert not allocator.has_free(2.99)
+    assert allocator.has_free(3)
+
+
+def test_at_least_one_lane():
+    allocator = TrackAllocator(0)
+    assert allocator.allocate(0, 1) == 1
+    assert allocator.allocate(0, 1) == 1
+
+
+def test_random_allocations_pick_expected_lane():
+    rng = random.Random(1)
+    for max_tracks in (1, 5, 21):
+        allocator = TrackAllocator(max_tracks)
+        ends = {}
+        current_time = 0.0
+        for _ in range(5000):
+            current_time += rng.expovariate(8)
+            occupy_until = current_time + rng.uniform(1, 8)
+            free = [track for track in range(1, max_tracks + 1) if ends.get(track, 0) <= current_time]
+            # 有空闲轨道时取编号最小的，否则取最早空出的，同时空出取编号小的
+            expected = free[0] if free else min(ends, key=lambda track: (ends[track], track))
+            assert allocator.allocate(current_time, occupy_until) == expected
+            ends[expected] = occupy_until